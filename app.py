@@ -1,26 +1,149 @@
 import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
 import streamlit as st
 
-from llm import load_llm
+import metrics
+from cache import ExtractionCache
+from llm import BACKENDS, InferenceScheduler, ModelLoader, SchedulerBusy
 from utils import blank_form_dict, deep_merge, coerce_dates_in_form
-from extractor import extract_category           # <- this file below
-from ui_form import render_editable_form         # requires ui_form.py
+from extractor import MERGE_POLICIES, extract_category, extract_category_stream, extract_categories
+from jsonstream import set_path
+from router import route_document
+from ui_form import form_download, form_json, mark_form_changed, render_editable_form         # requires ui_form.py
+from store import IntakeStore
+from workers import WorkerPool
 
 # ---------- Page ----------
 st.set_page_config(page_title="Form Filling — Migrant Support", page_icon="🤝", layout="wide")
 st.title("🤝 Migrant Support — Data Extractor & (Qwen 2.5 0.5B)")
 
+# Extraction results hold personal data, so they only reach disk when a sqlite file is
+# named here (e.g. FORMEASE_CACHE_DB=.formease_cache.sqlite); otherwise memory only
+CACHE_DB = os.environ.get("FORMEASE_CACHE_DB") or None
+# Extraction worker processes sharing the loaded weights (0 = extract in the app process)
+WORKERS = int(os.environ.get("FORMEASE_WORKERS", "0") or 0)
+# Saved intakes are personal data too: the store is off unless a directory is named here
+# (e.g. FORMEASE_STORE=.formease_store)
+STORE_PATH = os.environ.get("FORMEASE_STORE") or None
+_MATCH_LABELS = {"passport_or_id": "passport/ID", "permit_number": "permit number", "name_dob": "name + date of birth"}
+
+@st.cache_resource
+def get_extraction_cache() -> ExtractionCache:
+    # One cache per server process, plus the opt-in file that outlives restarts
+    return ExtractionCache(db_path=CACHE_DB)
+
+extraction_cache = get_extraction_cache()
+
+@st.cache_resource
+def get_intake_store() -> Optional[IntakeStore]:
+    # IntakeStore locks its directory to one writer process; sessions share this one
+    # (it is thread-safe). A failed open isn't cached, so the next run tries again.
+    return IntakeStore(STORE_PATH) if STORE_PATH else None
+
+try:
+    intake_store, store_error = get_intake_store(), None
+except RuntimeError as e:  # another app server or batch_cli --store holds the directory
+    intake_store, store_error = None, str(e)
+
+@st.cache_resource
+def get_model_loader(model_id: str, backend: str) -> ModelLoader:
+    # Weights load (and warm up) on a background thread; pages render meanwhile
+    return ModelLoader(model_id, backend, warmup=os.environ.get("FORMEASE_WARMUP", "1") != "0")
+
+@st.cache_resource
+def get_scheduler(model_id: str, backend: str) -> InferenceScheduler:
+    # All sessions share one inference worker per loaded model
+    tokenizer, model = get_model_loader(model_id, backend).wait()
+    return InferenceScheduler(tokenizer, model)
+
+@st.cache_resource
+def get_worker_pool(model_id: str, backend: str, workers: int) -> WorkerPool:
+    # Workers attach to the app's copy of the weights; the sqlite cache is shared with them
+    tokenizer, model = get_model_loader(model_id, backend).wait()
+    return WorkerPool(tokenizer, model, workers, cache_db=CACHE_DB)
+
+@st.cache_resource
+def get_startup_report() -> dict:
+    # Once per process: seconds from first import to first full render / model ready
+    return {"first_render": None, "model_ready": None}
+
+def _report_startup(stage: str, seconds: float) -> None:
+    report = get_startup_report()
+    if report[stage] is None:
+        report[stage] = round(seconds, 3)
+        # also a JSON log line when FORMEASE_METRICS_LOG=1, like the other stages
+        metrics.observe(f"startup_{stage}_seconds", seconds)
+
 # ---------- Sidebar / Model ----------
 with st.sidebar:
     st.header("Model")
     model_id = st.text_input("Hugging Face model", value="Qwen/Qwen2.5-0.5B-Instruct")
-    tokenizer, model = load_llm(model_id)
+    default_backend = os.environ.get("FORMEASE_BACKEND", "eager")
+    backend = st.selectbox("Inference backend", options=list(BACKENDS),
+                           index=BACKENDS.index(default_backend) if default_backend in BACKENDS else 0)
+    loader = get_model_loader(model_id, backend)
+    tokenizer = model = scheduler = pool = None
+    model_ready = loader.ready()
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if model_ready:
+        tokenizer, model = loader.wait()
+        info = getattr(model, "formease_backend", {})
+        if info.get("backend") != backend:
+            st.warning(f"{backend} backend failed its self-check; using {info.get('backend', 'eager')}.")
+        scheduler = get_scheduler(model_id, backend).session(st.session_state.session_id)
+        if WORKERS > 0 and info.get("backend") != "compile":
+            pool = get_worker_pool(model_id, backend, WORKERS)
+            st.caption(f"Workers: {pool.healthy()}/{pool.workers} up, "
+                       f"{sum(h['restarts'] for h in pool.health())} restarts")
+        _report_startup("model_ready", loader.ready_at - metrics.STARTED)
+        st.caption(f"Model ready in {loader.timings['ready_s']:.1f}s "
+                   f"(load {loader.timings.get('load_s', 0):.1f}s, warm-up {loader.timings.get('warmup_s', 0):.1f}s)")
+    elif loader.state == "failed":
+        st.error(f"Model failed to load: {loader.error}")
+        if st.button("Retry loading"):
+            get_model_loader.clear()
+            st.rerun()
+    else:
+        st.info(f"Model {loader.state}… you can paste text meanwhile.")
+    constrained = st.checkbox("Schema-constrained decoding", value=False,
+                              help="Force the exact JSON key layout and typed values while decoding.")
+    speculative = st.checkbox("Prompt-lookup speculative decoding", value=False,
+                              help="Draft tokens copied from your text and verify them in one pass (same output).")
+    fast_path = st.checkbox("Rule-based fast path", value=False,
+                            help="Read emails, phones, dates, amounts, counts and yes/no fields with rules; "
+                                 "the model only fills what's left.")
+    merge_policy = st.selectbox("Long texts: when chunks disagree, keep", MERGE_POLICIES,
+                                format_func={"first": "the first value", "frequent": "the most frequent value",
+                                             "longest": "the longest value"}.get,
+                                help="Long pastes are split into chunks and only the chunks relevant "
+                                     "to the category are extracted.")
+    stream = st.checkbox("Stream fields as they decode", value=True,
+                         help="Show each field as soon as the model writes it, with a Stop button. "
+                              "Not used with constrained or speculative decoding.")
+    cs = extraction_cache.stats()
+    st.caption(f"Result cache: {cs['hits']} hits / {cs['misses']} misses, "
+               f"{cs['evictions'] + cs['disk_evictions']} evictions, {cs['disk_entries']} stored")
+    if intake_store is not None:
+        st.caption(f"Intake store: {len(intake_store)} saved intakes")
+    elif store_error:
+        st.warning(f"Saving to the intake store is off: {store_error}")
     st.caption("Paste long text per category on the left, click Extract. Edit on the right, then download JSON.")
 
 # ---------- Session State Guards ----------
 if "form" not in st.session_state or not isinstance(st.session_state.form, dict):
     st.session_state.form = blank_form_dict()
 
+if "form_version" not in st.session_state:
+    st.session_state.form_version = 0
+
+if "provenance" not in st.session_state or not isinstance(st.session_state.provenance, dict):
+    st.session_state.provenance = {}
+
 if "inputs" not in st.session_state or not isinstance(st.session_state.inputs, dict):
     st.session_state.inputs = {
         "basic_personal_info": "",
@@ -33,86 +156,305 @@ if "inputs" not in st.session_state or not isinstance(st.session_state.inputs, d
         "skills": "",
     }
 
+# ---------- Category inputs ----------
+# Each tab is a fragment: typing in its text area reruns only that tab, not the form.
+
+def _flash(key: str, kind: str, text: str) -> None:
+    # shown by the tab after the page rerun that follows an extraction
+    st.session_state.setdefault("flash", {}).setdefault(key, []).append((kind, text))
+
+def _clear_input(key: str) -> None:
+    st.session_state.inputs[key] = ""
+    st.session_state[f"input_{key}"] = ""
+
+# How often a streaming extraction touches the page while decoding; a Stop click takes
+# effect within about this long
+STREAM_TICK_S = 0.25
+
+def _stop_stream(key: str) -> None:
+    cancel = st.session_state.get(f"_stream_cancel_{key}")
+    if cancel is not None:
+        cancel.set()
+    _flash(key, "info", "Stopped; kept the fields found so far.")
+
+def _stream_extract(key: str, text: str) -> None:
+    """
+    extract_category_stream into the form: each field is written to st.session_state.form
+    and shown below as it arrives, then the final patch is merged and the page reruns.
+    Called from the page script, not from the category_input fragment: a click on a
+    fragment's widget waits for the running script to finish, while Stop here reruns the
+    page. That rerun interrupts the script at its next st call, so the progress line below
+    is refreshed every STREAM_TICK_S even while no field completes; the finally block
+    then sets the key's cancel event, which stops decoding.
+    """
+    cancel = threading.Event()
+    st.session_state[f"_stream_cancel_{key}"] = cancel
+    st.button("⏹ Stop", key=f"stop_{key}", on_click=_stop_stream, args=(key,),
+              help="Stop decoding and keep the fields found so far.")
+    status, live = st.empty(), st.empty()
+    shown = {}
+    extracted = {}
+    ticked = [0.0]
+
+    def progress(n: int) -> None:
+        now = time.monotonic()
+        if now - ticked[0] >= STREAM_TICK_S:
+            ticked[0] = now
+            status.caption(f"Decoding… {n} pieces so far")
+
+    try:
+        for path, value in extract_category_stream(tokenizer, model, key, text, cache=extraction_cache,
+                                                   scheduler=scheduler, fast_path=fast_path,
+                                                   provenance=st.session_state.provenance, cancel=cancel,
+                                                   progress=progress):
+            if path is None:
+                extracted = value if isinstance(value, dict) else {}
+                break
+            set_path(st.session_state.form, path, value)
+            shown[".".join(map(str, path[1:]))] = value
+            live.json(shown)
+    except (SchedulerBusy, TimeoutError) as e:
+        st.warning(str(e))
+        return
+    except Exception as e:
+        st.error(f"Extraction failed: {e}")
+        return
+    finally:
+        cancel.set()
+        mark_form_changed(key)
+    st.session_state.form = deep_merge(st.session_state.form, extracted)
+    st.session_state.form = coerce_dates_in_form(st.session_state.form)
+    mark_form_changed(key)
+    _flash(key, "success", f"Extracted: {key.replace('_',' ').title()}")
+    st.rerun()
+
+@st.fragment
+def category_input(key: str) -> None:
+    st.markdown(f"**{key.replace('_',' ').title()} — Input**")
+    for kind, text in st.session_state.get("flash", {}).pop(key, []):
+        getattr(st, kind)(text)
+    if f"input_{key}" not in st.session_state:
+        st.session_state[f"input_{key}"] = st.session_state.inputs.get(key, "")
+    st.session_state.inputs[key] = st.text_area(
+        f"Paste all details for {key.replace('_',' ').title()}",
+        key=f"input_{key}",
+        height=160
+    )
+    colx1, colx2 = st.columns(2)
+    with colx1:
+        if st.button(f"Extract {key.split('_')[0].title()}", key=f"extract_{key}", disabled=not model_ready):
+            text = (st.session_state.inputs.get(key) or "").strip()
+            if not text:
+                st.warning("Please paste some text before extracting.")
+            elif stream and not (constrained or speculative):
+                # streamed by the page run (see _stream_extract) so that Stop can interrupt it
+                st.session_state.stream_job = (key, text)
+                st.rerun()
+            else:
+                try:
+                    spec_stats = {}
+                    if pool is not None:
+                        extracted = pool.extract_category(key, text, constrained=constrained,
+                                                          speculative=speculative, stats=spec_stats,
+                                                          fast_path=fast_path, merge_policy=merge_policy,
+                                                          provenance=st.session_state.provenance) or {}
+                    else:
+                        extracted = extract_category(tokenizer, model, key, text, constrained=constrained,
+                                                     speculative=speculative, stats=spec_stats,
+                                                     cache=extraction_cache, scheduler=scheduler,
+                                                     fast_path=fast_path, merge_policy=merge_policy,
+                                                     provenance=st.session_state.provenance) or {}
+                    if not isinstance(extracted, dict):
+                        extracted = {}
+                    st.session_state.form = deep_merge(st.session_state.form, extracted)
+                    st.session_state.form = coerce_dates_in_form(st.session_state.form)
+                    mark_form_changed(key)
+                    _flash(key, "success", f"Extracted: {key.replace('_',' ').title()}")
+                    if spec_stats:
+                        _flash(key, "caption", f"Speculative: {spec_stats['acceptance_rate']:.0%} drafts accepted, "
+                                               f"{spec_stats['tokens_per_sec']:.1f} tok/s")
+                    # the form and preview live outside this fragment
+                    st.rerun()
+                except (SchedulerBusy, TimeoutError) as e:
+                    st.warning(str(e))
+                except Exception as e:
+                    st.error(f"Extraction failed: {e}")
+    with colx2:
+        st.button(f"Clear input ({key})", key=f"clear_{key}", on_click=_clear_input, args=(key,))
+
+def _extract_and_merge(texts: dict) -> dict:
+    """
+    Extracts every non-empty category text and merges the patches into the form.
+    Returns the patches (empty when there was nothing to extract).
+    """
+    spec_stats = {}
+    opts = dict(constrained=constrained, speculative=speculative, stats=spec_stats,
+                fast_path=fast_path, merge_policy=merge_policy, provenance=st.session_state.provenance)
+    if pool is not None:
+        patches = pool.extract_categories(texts, **opts)
+    else:
+        patches = extract_categories(tokenizer, model, texts, cache=extraction_cache,
+                                     scheduler=scheduler, **opts)
+    for extracted in patches.values():
+        if isinstance(extracted, dict):
+            st.session_state.form = deep_merge(st.session_state.form, extracted)
+    if patches:
+        st.session_state.form = coerce_dates_in_form(st.session_state.form)
+        mark_form_changed(*patches)
+        for k, ks in spec_stats.items():
+            if ks:
+                st.caption(f"{k}: {ks['acceptance_rate']:.0%} drafts accepted, {ks['tokens_per_sec']:.1f} tok/s")
+    return patches
+
+# Form edits rerun only their section, so the finish panel reruns itself this often to
+# pick up a new form_version; between edits a rerun reuses the memoized JSON and check
+PANEL_REFRESH_S = 1.0
+
+def _duplicates(final_form: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # per form version and store size: other sessions may have saved a match since
+    stamp = (st.session_state.form_version, len(intake_store))
+    cached = st.session_state.get("_dup_check")
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, intake_store.find_duplicates(final_form))
+        st.session_state._dup_check = cached
+    return cached[1]
+
+@st.fragment(run_every=PANEL_REFRESH_S)
+def _finish_panel() -> None:
+    """
+    Download, save and preview. A fragment on a timer: the preview and duplicate warning
+    follow form_version within PANEL_REFRESH_S of an edit, and the download reads the form
+    itself on click.
+    """
+    st.markdown("### Finish")
+    st.download_button(
+        label="📥 Download JSON",
+        data=form_download(st.session_state.form),
+        file_name="migrant_support_intake.json",
+        mime="application/json",
+        on_click="ignore",
+    )
+    if intake_store is not None:
+        saved = st.session_state.get("saved_as")
+        if saved and saved[0] == st.session_state.form_version:
+            st.caption(f"Saved as intake #{saved[1]}.")
+        else:
+            final_form = json.loads(form_json(st.session_state.form)[0])
+            dups = _duplicates(final_form)
+            if dups:
+                st.warning("Possible duplicate of " + "; ".join(
+                    f"intake #{d['row']} (same {', '.join(_MATCH_LABELS[m] for m in d['matches'])})" for d in dups[:5]))
+            # duplicates that appeared since the last render must be shown before saving
+            shown = st.session_state.get("_save_checked")
+            st.session_state._save_checked = (st.session_state.form_version, bool(dups))
+            if st.button("💾 Save anyway" if dups else "💾 Save to intake store", key="save_intake") \
+                    and (not dups or shown == st.session_state._save_checked):
+                row = intake_store.add(final_form)
+                st.session_state.saved_as = (st.session_state.form_version, row)
+                st.success(f"Saved as intake #{row}.")
+    with st.expander("Preview JSON"):
+        st.code(form_json(st.session_state.form)[0], language="json")
+    if st.session_state.provenance:
+        with st.expander("Field sources"):
+            st.json(st.session_state.provenance)
+
 # ---------- Layout ----------
 left, right = st.columns([0.52, 0.48], gap="large")
 
 with left:
-    st.subheader("Paste text by category")
-
-    tabs = st.tabs([
-        "Basic Info", "Address & Permits", "Employment", "Housing",
-        "Dependents", "Financial", "Education (opt)", "Skills (opt)"
-    ])
+    mode = st.radio("Input", ["By category", "Single document"], horizontal=True, label_visibility="collapsed",
+                    help="Single document: paste the whole intake note; each sentence is routed to the "
+                         "categories it talks about and only that slice is extracted.")
 
     cat_keys = [
         "basic_personal_info", "address_and_permits", "employment", "housing",
         "dependents_information", "financial_information", "education", "skills"
     ]
 
-    for tab, key in zip(tabs, cat_keys):
-        with tab:
-            st.markdown(f"**{key.replace('_',' ').title()} — Input**")
-            st.session_state.inputs[key] = st.text_area(
-                f"Paste all details for {key.replace('_',' ').title()}",
-                value=st.session_state.inputs.get(key, ""),
-                height=160
-            )
-            colx1, colx2 = st.columns(2)
-            with colx1:
-                if st.button(f"Extract {key.split('_')[0].title()}", key=f"extract_{key}"):
-                    text = (st.session_state.inputs.get(key) or "").strip()
-                    if not text:
-                        st.warning("Please paste some text before extracting.")
-                    else:
-                        try:
-                            extracted = extract_category(tokenizer, model, key, text) or {}
-                            if not isinstance(extracted, dict):
-                                extracted = {}
-                            st.session_state.form = deep_merge(st.session_state.form, extracted)
-                            st.session_state.form = coerce_dates_in_form(st.session_state.form)
-                            st.success(f"Extracted: {key.replace('_',' ').title()}")
-                        except Exception as e:
-                            st.error(f"Extraction failed: {e}")
-            with colx2:
-                if st.button(f"Clear input ({key})", key=f"clear_{key}"):
-                    st.session_state.inputs[key] = ""
+    if mode == "Single document":
+        st.subheader("Paste the whole intake note")
+        document = st.text_area("Intake note", key="input_document", height=320, label_visibility="collapsed")
+        if st.button("🧭 Route & extract", disabled=not model_ready or not (document or "").strip()):
+            try:
+                slices, report = route_document(document, tokenizer)
+                with st.expander(f"Routed in {report['routing_ms']:.1f} ms · "
+                                 f"{report['tokens_saved']} of {report['tokens_naive']} {report['token_unit']} "
+                                 f"saved ({report['saved_ratio']:.0%})"):
+                    for k, text in slices.items():
+                        st.markdown(f"**{k}** ({report['categories'][k]} sentences)")
+                        st.caption(text)
+                    if report["skipped"]:
+                        st.caption("Skipped (nothing routed): " + ", ".join(report["skipped"]))
+                if _extract_and_merge(slices):
+                    st.success(f"Extracted {len(slices)} routed categories and merged.")
+                else:
+                    st.warning("Nothing in the note matched a form category.")
+            except (SchedulerBusy, TimeoutError) as e:
+                st.warning(str(e))
+            except Exception as e:
+                st.error(f"Routed extraction failed: {e}")
+    else:
+        st.subheader("Paste text by category")
 
-    st.divider()
-    if st.button("🧠 Extract ALL categories"):
-        any_text = False
-        try:
-            for k in cat_keys:
-                txt = (st.session_state.inputs.get(k) or "").strip()
-                if not txt:
-                    continue
-                any_text = True
-                extracted = extract_category(tokenizer, model, k, txt) or {}
-                if not isinstance(extracted, dict):
-                    extracted = {}
-                st.session_state.form = deep_merge(st.session_state.form, extracted)
-            if any_text:
-                st.session_state.form = coerce_dates_in_form(st.session_state.form)
-                st.success("All available categories extracted and merged.")
-            else:
-                st.warning("No category inputs found. Paste text above first.")
-        except Exception as e:
-            st.error(f"Bulk extraction failed: {e}")
+        tabs = st.tabs([
+            "Basic Info", "Address & Permits", "Employment", "Housing",
+            "Dependents", "Financial", "Education (opt)", "Skills (opt)"
+        ])
+
+        for tab, key in zip(tabs, cat_keys):
+            with tab:
+                category_input(key)
+                job = st.session_state.get("stream_job")
+                if job and job[0] == key:
+                    del st.session_state.stream_job
+                    _stream_extract(*job)
+
+        st.divider()
+        if st.button("🧠 Extract ALL categories", disabled=not model_ready):
+            try:
+                texts = {k: (st.session_state.inputs.get(k) or "").strip() for k in cat_keys}
+                if _extract_and_merge(texts):
+                    st.success("All available categories extracted and merged.")
+                else:
+                    st.warning("No category inputs found. Paste text above first.")
+            except (SchedulerBusy, TimeoutError) as e:
+                st.warning(str(e))
+            except Exception as e:
+                st.error(f"Bulk extraction failed: {e}")
 
     if st.button("↺ Reset entire form"):
         st.session_state.form = blank_form_dict()
+        st.session_state.provenance = {}
+        mark_form_changed()
         st.success("Form reset.")
 
 with right:
     st.session_state.form = render_editable_form(st.session_state.form)
 
     st.divider()
-    st.markdown("### Finish")
-    final_json = json.dumps(coerce_dates_in_form(st.session_state.form), indent=2)
-    st.download_button(
-        label="📥 Download JSON",
-        data=final_json.encode("utf-8"),
-        file_name="migrant_support_intake.json",
-        mime="application/json",
-    )
-    with st.expander("Preview JSON"):
-        st.code(final_json, language="json")
+    _finish_panel()
+
+# ---------- Sidebar / Metrics ----------
+# Rendered last so the panel includes this run's extraction
+with st.sidebar:
+    with st.expander("Metrics"):
+        metrics.enable(st.checkbox("Collect stage metrics (all sessions)", value=metrics.is_enabled()))
+        startup = get_startup_report()
+        st.caption(f"Startup: first render {startup['first_render']}s, model ready {startup['model_ready']}s")
+        snap = metrics.snapshot()
+        if snap["histograms"]:
+            st.dataframe(
+                [{"metric": name, **{k: round(v, 4) for k, v in h.items()}} for name, h in snap["histograms"].items()],
+                hide_index=True,
+            )
+        if snap["counters"]:
+            st.json(snap["counters"])
+        st.download_button("Prometheus metrics", data=metrics.prometheus_text().encode("utf-8"),
+                           file_name="formease_metrics.prom", mime="text/plain")
+
+# ---------- Startup ----------
+_report_startup("first_render", time.perf_counter() - metrics.STARTED)
+if not model_ready and loader.state != "failed":
+    # poll until the background load finishes so the buttons enable themselves
+    time.sleep(1.0)
+    st.rerun()
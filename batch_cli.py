@@ -0,0 +1,260 @@
+"""
+Headless bulk extraction: JSONL case notes in, one FormData JSON per line out.
+
+Input lines look like {"id": "case-17", "texts": {"employment": "...", "housing": "..."}}
+(category keys may also sit at the top level), or {"id": ..., "document": "..."} for a
+whole unsplit intake note, which router.route_document slices per category. Output lines
+are {"id": ..., "form": {...}} and are appended and flushed as soon as each record
+finishes, so the output file doubles as the checkpoint: re-running with the same
+--output skips ids already written. With --store, <output>.stored records which row of
+the store each id went to, so a resumed run never saves a record twice.
+
+    python batch_cli.py --input notes.jsonl --output forms.jsonl --batch-size 8
+    python batch_cli.py --input notes.jsonl --output forms.jsonl --workers 4 --records-per-step 16
+    python batch_cli.py --input notes.jsonl --output forms.jsonl --store .formease_store
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import metrics
+from cache import ExtractionCache
+from extractor import CHUNK_TOKENS, MERGE_POLICIES, extract_many
+from llm import BACKENDS, load_model
+from router import route_document
+from store import IntakeStore
+from utils import blank_form_dict, deep_merge, coerce_dates_in_form, normalize_forms
+from workers import WorkerPool
+
+CATEGORY_KEYS = tuple(blank_form_dict().keys())
+
+def read_records(path: str, routing: Optional[Dict[str, float]] = None) -> Iterator[Tuple[str, Dict[str, str]]]:
+    """
+    Streams (record_id, {root_key: text}) from a JSONL file; "-" reads stdin.
+    Lines that aren't JSON objects are skipped with a warning. A "document" string is
+    routed into category slices (explicit category texts win); routing totals are
+    added to the routing dict if given.
+    """
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+    try:
+        for n, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                print(f"warning: line {n} is not valid JSON, skipped", file=sys.stderr)
+                continue
+            if not isinstance(rec, dict):
+                print(f"warning: line {n} is not a JSON object, skipped", file=sys.stderr)
+                continue
+            texts = rec.get("texts") if isinstance(rec.get("texts"), dict) else rec
+            texts = {k: texts[k] for k in CATEGORY_KEYS if isinstance(texts.get(k), str)}
+            if isinstance(rec.get("document"), str) and rec["document"].strip():
+                slices, report = route_document(rec["document"])
+                texts = {**slices, **texts}
+                if routing is not None:
+                    routing["documents"] = routing.get("documents", 0) + 1
+                    for stat, key in (("routing_ms", "routing_ms"), ("tokens_naive", "words_naive"),
+                                      ("tokens_routed", "words_routed")):
+                        routing[key] = routing.get(key, 0) + report[stat]
+            yield str(rec.get("id", n)), texts
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def completed_ids(path: str) -> Set[str]:
+    """
+    Ids already present in an output file. A torn last line (crash mid-write) is ignored.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    # bytes: a torn line may end inside a multibyte character (output is ensure_ascii=False)
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError, TypeError):
+                continue
+    return done
+
+def stored_rows(path: str) -> Dict[str, int]:
+    """
+    {record id: store row} from a .stored sidecar; a torn last line is ignored.
+    """
+    rows: Dict[str, int] = {}
+    if not os.path.exists(path):
+        return rows
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                rows[str(entry["id"])] = int(entry["row"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return rows
+
+def _open_output(path: str):
+    # Start on a fresh line if the previous run died mid-record
+    torn = False
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            torn = f.read(1) != b"\n"
+    out = open(path, "a", encoding="utf-8")
+    if torn:
+        out.write("\n")
+    return out
+
+def build_form(patches: List[Dict[str, Any]], normalize: bool = True) -> Dict[str, Any]:
+    form = blank_form_dict()
+    for patch in patches:
+        form = deep_merge(form, patch)
+    return coerce_dates_in_form(form) if normalize else form
+
+def run(input_path: str, output_path: str, model_id: str, batch_size: int = 8,
+        records_per_step: int = 4, constrained: bool = False, cache_db: Optional[str] = None,
+        backend: str = "eager", chunk_tokens: int = CHUNK_TOKENS, merge_policy: str = "first",
+        workers: int = 0, threads_per_worker: Optional[int] = None,
+        store_path: Optional[str] = None) -> Dict[str, float]:
+    """
+    Processes input_path into output_path, records_per_step records at a time (their
+    category prompts share model.generate batches of up to batch_size). Long texts are
+    cut to their relevant chunks (see extractor.relevant_chunks); "document" records are
+    routed first and the summary reports routing time and words saved. With workers > 0
+    each step is split over a workers.WorkerPool sharing the weights, so records_per_step
+    should give every worker some jobs. With store_path every form is also saved to that
+    store.IntakeStore once (tracked per id in <output_path>.stored, not by the duplicate
+    check); rows it may duplicate are listed in the output line as "possible_duplicates".
+    Returns a throughput summary.
+    """
+    tokenizer, model = load_model(model_id, backend)  # plain loader: no Streamlit outside the app
+    pool = WorkerPool(tokenizer, model, workers, threads_per_worker, cache_db=cache_db) if workers > 0 else None
+    cache = ExtractionCache(db_path=cache_db) if cache_db and pool is None else None
+    store = IntakeStore(store_path) if store_path else None
+    done = completed_ids(output_path)
+    stored = stored_rows(output_path + ".stored") if store is not None else {}
+    summary = {"records": 0, "skipped": 0, "categories": 0, "seconds": 0.0}
+    if store is not None:
+        summary.update(stored=0, possible_duplicates=0)
+    routing: Dict[str, float] = {}
+    t0 = time.perf_counter()
+
+    def save(rid: str, form: Dict[str, Any], log) -> List[int]:
+        # The row is logged before it is added. We hold the store's writer lock, so it is
+        # the row add() will use: a logged row that exists is this record, saved by an
+        # earlier run that died before writing the output line.
+        row = stored.get(rid)
+        dups = [d["row"] for d in store.find_duplicates(form) if d["row"] != row]
+        if row is None or row >= len(store):
+            row = stored[rid] = len(store)
+            log.write(json.dumps({"id": rid, "row": row}, ensure_ascii=False) + "\n")
+            log.flush()
+            store.add(form)
+            summary["stored"] += 1
+            summary["possible_duplicates"] += bool(dups)
+        return dups
+
+    def flush(group: List[Tuple[str, Dict[str, str]]], out, log) -> None:
+        jobs = [(k, t.strip()) for _, texts in group for k, t in texts.items() if t.strip()]
+        opts = dict(batch_size=batch_size, constrained=constrained, chunk_tokens=chunk_tokens,
+                    merge_policy=merge_policy)
+        if pool is not None:
+            patches = iter(pool.extract_many(jobs, **opts))
+        else:
+            patches = iter(extract_many(tokenizer, model, jobs, cache=cache, **opts))
+        counts = [sum(1 for t in texts.values() if t.strip()) for _, texts in group]
+        forms = normalize_forms([build_form([next(patches) for _ in range(n)], normalize=False) for n in counts])
+        for (rid, _), n, form in zip(group, counts, forms):
+            line = {"id": rid, "form": form}
+            # store before the checkpoint line: a crash in between re-runs the record,
+            # and save() finds it in the sidecar instead of adding it again
+            if store is not None:
+                dups = save(rid, form, log)
+                if dups:
+                    line["possible_duplicates"] = dups
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+            summary["records"] += 1
+            summary["categories"] += n
+
+    log = None
+    try:
+        if store is not None:
+            log = _open_output(output_path + ".stored")
+        with _open_output(output_path) as out:
+            group: List[Tuple[str, Dict[str, str]]] = []
+            for rid, texts in read_records(input_path, routing):
+                if rid in done:
+                    summary["skipped"] += 1
+                    continue
+                done.add(rid)
+                group.append((rid, texts))
+                if len(group) >= max(1, records_per_step):
+                    flush(group, out, log)
+                    group = []
+            if group:
+                flush(group, out, log)
+    finally:
+        if log is not None:
+            log.close()
+        if pool is not None:
+            summary["workers"] = pool.health()
+            pool.close()
+        if store is not None:
+            store.close()
+
+    secs = time.perf_counter() - t0
+    summary["seconds"] = round(secs, 3)
+    summary["records_per_sec"] = round(summary["records"] / secs, 3) if secs > 0 else 0.0
+    summary["categories_per_sec"] = round(summary["categories"] / secs, 3) if secs > 0 else 0.0
+    if routing:
+        routing["routing_ms"] = round(routing["routing_ms"], 2)
+        routing["words_saved"] = routing["words_naive"] - routing["words_routed"]
+        summary["routing"] = routing
+    if cache is not None:
+        summary["cache"] = cache.stats()
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Bulk intake extraction (JSONL in, FormData JSONL out).")
+    ap.add_argument("--input", required=True, help="JSONL of records, or - for stdin")
+    ap.add_argument("--output", required=True, help="JSONL to append to; also the resume checkpoint")
+    ap.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    ap.add_argument("--backend", default="eager", choices=BACKENDS)
+    ap.add_argument("--batch-size", type=int, default=8, help="prompts per model.generate call")
+    ap.add_argument("--records-per-step", type=int, default=4, help="records whose prompts are batched together")
+    ap.add_argument("--constrained", action="store_true", help="schema-constrained decoding (unbatched)")
+    ap.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS,
+                    help="split texts longer than this many tokens into chunks (0 = never)")
+    ap.add_argument("--merge-policy", default="first", choices=MERGE_POLICIES,
+                    help="how values from several chunks of one text are reconciled")
+    ap.add_argument("--workers", type=int, default=0,
+                    help="worker processes sharing one copy of the weights (0 = extract in this process)")
+    ap.add_argument("--threads-per-worker", type=int, default=None, help="torch threads per worker")
+    ap.add_argument("--cache-db", default=None, help="sqlite extraction cache shared with the app")
+    ap.add_argument("--store", default=None, help="also save every form to this intake store (once per id, also when resuming); "
+                         "possible duplicates are listed in the output line")
+    ap.add_argument("--metrics-out", default=None, help="write per-stage metrics (Prometheus text) here")
+    args = ap.parse_args(argv)
+    if args.metrics_out:
+        metrics.enable()
+
+    summary = run(args.input, args.output, args.model, batch_size=args.batch_size,
+                  records_per_step=args.records_per_step, constrained=args.constrained,
+                  cache_db=args.cache_db, backend=args.backend, chunk_tokens=args.chunk_tokens,
+                  merge_policy=args.merge_policy, workers=args.workers,
+                  threads_per_worker=args.threads_per_worker, store_path=args.store)
+    print(json.dumps(summary), file=sys.stderr)
+    if args.metrics_out:
+        with open(args.metrics_out, "w", encoding="utf-8") as f:
+            f.write(metrics.prometheus_text())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""
+Offline benchmarks for FormEase. Run from the repo root, e.g.:
+    python -m benchmarks.bench_batching
+    python -m benchmarks.suite --out results.json   # fake model, no download needed
+"""
@@ -0,0 +1,80 @@
+"""
+Load time, resident memory and prefill/decode tokens/sec per inference backend.
+Each backend runs in a fresh subprocess so memory numbers don't bleed into each other.
+
+    python -m benchmarks.bench_backends --model Qwen/Qwen2.5-0.5B-Instruct
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(model_id: str, backend: str, decode_tokens: int) -> dict:
+    import torch
+    from llm import _encode_prompt, load_model
+    from extractor import build_messages
+    from benchmarks.samples import SAMPLE_TEXTS
+
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    tokenizer, model = load_model(model_id, backend)
+    load_s = time.perf_counter() - t0
+    _, input_ids = _encode_prompt(tokenizer, model, build_messages("employment", SAMPLE_TEXTS["employment"]))
+
+    with torch.inference_mode():
+        model(input_ids)  # warm-up (and compilation for the compile backend)
+        t0 = time.perf_counter()
+        out = model(input_ids, use_cache=True)
+        prefill_s = time.perf_counter() - t0
+        past, tok = out.past_key_values, out.logits[:, -1:].argmax(dim=-1)
+        t0 = time.perf_counter()
+        for _ in range(decode_tokens):
+            out = model(tok, past_key_values=past, use_cache=True)
+            past, tok = out.past_key_values, out.logits[:, -1:].argmax(dim=-1)
+        decode_s = time.perf_counter() - t0
+
+    info = getattr(model, "formease_backend", {})
+    return {
+        "backend": backend,
+        "active_backend": info.get("backend"),
+        "self_check": info.get("self_check"),
+        "load_s": round(load_s, 3),
+        "rss_mb": round(_rss_mb() - rss0, 1),
+        "prefill_tok_s": round(input_ids.shape[-1] / prefill_s, 1),
+        "decode_tok_s": round(decode_tokens / decode_s, 1),
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    ap.add_argument("--backends", nargs="+", default=["eager", "bf16", "int8", "compile"])
+    ap.add_argument("--decode-tokens", type=int, default=64)
+    ap.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.single:
+        print(json.dumps(measure(args.model, args.backends[0], args.decode_tokens)))
+        return
+    for backend in args.backends:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_backends", "--single", "--model", args.model,
+             "--backends", backend, "--decode-tokens", str(args.decode_tokens)],
+            capture_output=True, text=True,
+        )
+        lines = [l for l in proc.stdout.splitlines() if l.startswith("{")]
+        print(lines[-1] if lines else json.dumps({"backend": backend, "error": proc.stderr.strip()[-500:]}), flush=True)
+
+if __name__ == "__main__":
+    main()
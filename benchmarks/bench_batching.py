@@ -0,0 +1,45 @@
+"""
+Sequential vs batched "Extract ALL" at batch sizes 1..8.
+
+    python -m benchmarks.bench_batching --model Qwen/Qwen2.5-0.5B-Instruct --repeats 2
+"""
+import argparse
+import json
+import time
+
+from llm import load_model
+from extractor import extract_category, extract_categories
+from benchmarks.samples import SAMPLE_TEXTS
+
+def _time(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    ap.add_argument("--repeats", type=int, default=1)
+    ap.add_argument("--max-batch", type=int, default=8)
+    args = ap.parse_args()
+
+    tokenizer, model = load_model(args.model)
+    keys = list(SAMPLE_TEXTS)
+    rows = []
+    for n in range(1, min(args.max_batch, len(keys)) + 1):
+        texts = {k: SAMPLE_TEXTS[k] for k in keys[:n]}
+        seq = _time(lambda: [extract_category(tokenizer, model, k, t) for k, t in texts.items()], args.repeats)
+        bat = _time(lambda: extract_categories(tokenizer, model, texts, batch_size=n), args.repeats)
+        rows.append({
+            "batch_size": n,
+            "sequential_s": round(seq, 3),
+            "batched_s": round(bat, 3),
+            "speedup": round(seq / bat, 2) if bat else None,
+        })
+        print(json.dumps(rows[-1]), flush=True)
+
+if __name__ == "__main__":
+    main()
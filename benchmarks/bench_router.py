@@ -0,0 +1,58 @@
+"""
+Single-document routing: each document is one corpus case per category pasted together.
+Reports routing time, tokens sent against full-text-per-category, and recall/precision of
+the routed sentences against the category each sentence was written for.
+
+    python -m benchmarks.bench_router --docs 20
+    python -m benchmarks.bench_router --tokenizer Qwen/Qwen2.5-0.5B-Instruct
+"""
+import argparse
+import json
+import random
+import statistics
+
+from benchmarks.corpus import make_corpus
+from router import split_sentences, route_document
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--docs", type=int, default=20)
+    ap.add_argument("--tokenizer", default=None, help="count model tokens instead of words")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    tokenizer = None
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+
+    cases = make_corpus(args.docs, seed=args.seed)
+    by_key = {}
+    for c in cases:
+        by_key.setdefault(c["root_key"], []).append(c["text"])
+    rng = random.Random(args.seed)
+    ms, saved, hits, routed, expected = [], [], 0, 0, 0
+    for i in range(args.docs):
+        parts = [(k, texts[i]) for k, texts in by_key.items()]
+        rng.shuffle(parts)
+        slices, report = route_document("\n\n".join(t for _, t in parts), tokenizer)
+        ms.append(report["routing_ms"])
+        saved.append(report["saved_ratio"])
+        for key, text in parts:
+            sentences = [s for _, s in split_sentences(text)]
+            expected += len(sentences)
+            hits += sum(1 for s in sentences if s in slices.get(key, ""))
+        routed += sum(report["categories"].values())
+
+    print(json.dumps({
+        "docs": args.docs,
+        "token_unit": "tokens" if tokenizer is not None else "words",
+        "routing_ms_median": round(statistics.median(ms), 2),
+        "routing_ms_max": round(max(ms), 2),
+        "saved_ratio_mean": round(statistics.mean(saved), 3),
+        "recall": round(hits / expected, 3) if expected else 0.0,
+        "precision": round(hits / routed, 3) if routed else 0.0,
+    }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Concurrent sessions with and without the shared InferenceScheduler: p50/p95 latency.
+
+    python -m benchmarks.bench_scheduler --model Qwen/Qwen2.5-0.5B-Instruct --sessions 1 4 8
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+
+from llm import InferenceScheduler, SchedulerBusy, load_model
+from extractor import extract_category
+from benchmarks.samples import SAMPLE_TEXTS
+
+def _percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def _load(tokenizer, model, sessions: int, per_session: int, scheduler=None):
+    latencies, busy = [], [0]
+    lock = threading.Lock()
+    keys = list(SAMPLE_TEXTS)
+
+    def client(n: int) -> None:
+        handle = scheduler.session(f"s{n}") if scheduler is not None else None
+        for i in range(per_session):
+            key = keys[(n + i) % len(keys)]
+            t0 = time.perf_counter()
+            try:
+                extract_category(tokenizer, model, key, SAMPLE_TEXTS[key], scheduler=handle)
+            except SchedulerBusy:
+                with lock:
+                    busy[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(sessions)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    return {
+        "p50_s": round(statistics.median(latencies), 3) if latencies else None,
+        "p95_s": round(_percentile(latencies, 0.95), 3),
+        "requests_per_sec": round(len(latencies) / wall, 3) if wall else None,
+        "busy": busy[0],
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    ap.add_argument("--sessions", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--per-session", type=int, default=2)
+    args = ap.parse_args()
+
+    tokenizer, model = load_model(args.model)
+    scheduler = InferenceScheduler(tokenizer, model)
+    for n in args.sessions:
+        direct = _load(tokenizer, model, n, args.per_session)
+        shared = _load(tokenizer, model, n, args.per_session, scheduler)
+        print(json.dumps({"sessions": n, "direct": direct, "scheduler": shared,
+                          "scheduler_stats": scheduler.stats()}), flush=True)
+    scheduler.close()
+
+if __name__ == "__main__":
+    main()
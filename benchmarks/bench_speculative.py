@@ -0,0 +1,50 @@
+"""
+Greedy vs prompt-lookup speculative decoding, per category.
+
+    python -m benchmarks.bench_speculative --model Qwen/Qwen2.5-0.5B-Instruct
+"""
+import argparse
+import json
+import time
+
+from llm import llm_generate, load_model
+from extractor import build_messages, prompt_prefix
+from benchmarks.samples import SAMPLE_TEXTS
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    ap.add_argument("--max-new-tokens", type=int, default=700)
+    args = ap.parse_args()
+
+    tokenizer, model = load_model(args.model)
+    for key, text in SAMPLE_TEXTS.items():
+        messages = build_messages(key, text)
+        prefix = prompt_prefix(key)
+        # warm the prefix cache so both runs time decoding, not the one-off prefix prefill
+        llm_generate(tokenizer, model, messages, max_new_tokens=1, cache_prefix=prefix)
+
+        t0 = time.perf_counter()
+        greedy = llm_generate(tokenizer, model, messages, max_new_tokens=args.max_new_tokens, cache_prefix=prefix)
+        greedy_s = time.perf_counter() - t0
+
+        stats = {}
+        t0 = time.perf_counter()
+        spec = llm_generate(tokenizer, model, messages, max_new_tokens=args.max_new_tokens,
+                            cache_prefix=prefix, speculative=True, stats=stats)
+        spec_s = time.perf_counter() - t0
+
+        print(json.dumps({
+            "category": key,
+            "identical": greedy == spec,
+            "greedy_s": round(greedy_s, 3),
+            "speculative_s": round(spec_s, 3),
+            "speedup": round(greedy_s / spec_s, 2) if spec_s else None,
+            "acceptance_rate": round(stats.get("acceptance_rate", 0.0), 3),
+            "tokens_per_sec": round(stats.get("tokens_per_sec", 0.0), 1),
+            "forward_passes": stats.get("forward_passes"),
+            "new_tokens": stats.get("new_tokens"),
+        }), flush=True)
+
+if __name__ == "__main__":
+    main()
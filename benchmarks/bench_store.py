@@ -0,0 +1,111 @@
+"""
+IntakeStore: memory and disk per record, add/reopen/export throughput and duplicate-check
+latency, on synthetic forms assembled from the gold corpus (one case per category).
+
+"dict_bytes_per_record" is the same forms held as plain json.loads dicts, for comparison.
+
+    python -m benchmarks.bench_store --n 100000
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.corpus import make_corpus
+from store import IntakeStore
+
+def _forms(n: int, seed: int):
+    by_key = {}
+    for c in make_corpus(n, seed=seed):
+        by_key.setdefault(c["root_key"], []).append(c["gold"][c["root_key"]])
+    return [{k: cases[i] for k, cases in by_key.items()} for i in range(n)]
+
+def _traced(fn):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        obj = fn()
+        return obj, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+def _us(samples):
+    samples = sorted(samples)
+    return {"p50": round(statistics.median(samples) * 1e6, 1),
+            "p99": round(samples[int(len(samples) * 0.99) - 1] * 1e6, 1)}
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--n", type=int, default=100_000)
+    ap.add_argument("--lookups", type=int, default=2000)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    forms = _forms(args.n, args.seed)
+    path = tempfile.mkdtemp(prefix="formease_store_")
+    try:
+        store = IntakeStore(path)
+        t0 = time.perf_counter()
+        for form in forms:
+            store.add(form)
+        add_s = time.perf_counter() - t0
+        store.close()
+
+        t0 = time.perf_counter()
+        IntakeStore(path).close()
+        reopen_s = time.perf_counter() - t0
+        store, store_bytes = _traced(lambda: IntakeStore(path))
+        lines = [json.dumps(f) for f in forms]
+        _, dict_bytes = _traced(lambda: [json.loads(line) for line in lines])
+        lines = None
+
+        rng = random.Random(args.seed)
+        fresh = _forms(args.lookups, args.seed + 1)
+        hit_s, miss_s = [], []
+        for form in rng.sample(forms, min(args.lookups, len(forms))):
+            t0 = time.perf_counter()
+            store.find_duplicates(form)
+            hit_s.append(time.perf_counter() - t0)
+        for form in fresh:
+            for section in ("basic_personal_info", "address_and_permits"):
+                form[section] = dict(form[section])
+            form["basic_personal_info"]["passport_or_id"] = f"Z{rng.randrange(10**9)}"
+            form["address_and_permits"]["permit_number"] = None
+            t0 = time.perf_counter()
+            store.find_duplicates(form)
+            miss_s.append(time.perf_counter() - t0)
+
+        with open(os.devnull, "w", encoding="utf-8", newline="") as out:
+            t0 = time.perf_counter()
+            store.export_jsonl(out)
+            jsonl_s = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            store.export_csv(out)
+            csv_s = time.perf_counter() - t0
+        stats = store.stats()
+        store.close()
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    n = args.n
+    print(json.dumps({
+        "records": n,
+        "store_bytes_per_record": round(store_bytes / n, 1),
+        "dict_bytes_per_record": round(dict_bytes / n, 1),
+        "disk_bytes_per_record": round(stats["disk_bytes"] / n, 1),
+        "distinct_values": stats["distinct_values"],
+        "adds_per_sec": round(n / add_s),
+        "reopen_s": round(reopen_s, 2),
+        "duplicate_check_hit_us": _us(hit_s),
+        "duplicate_check_miss_us": _us(miss_s),
+        "export_jsonl_per_sec": round(n / jsonl_s),
+        "export_csv_per_sec": round(n / csv_s),
+    }))
+
+if __name__ == "__main__":
+    main()
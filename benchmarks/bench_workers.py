@@ -0,0 +1,73 @@
+"""
+WorkerPool scaling: categories/sec and memory per worker count, against one in-process model.
+
+Memory is read from /proc (Linux). "load_mb" is what loading the model cost this process,
+i.e. what every extra single-model process would pay again; "added_mb_per_worker" is the
+growth in total PSS per worker beyond the first, with the weights shared.
+
+    python -m benchmarks.bench_workers --model Qwen/Qwen2.5-0.5B-Instruct --workers 1 2 4
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks.corpus import make_corpus
+from extractor import extract_many
+from llm import load_model
+from workers import WorkerPool, process_memory
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--model", default="Qwen/Qwen2.5-0.5B-Instruct")
+    ap.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    ap.add_argument("--threads-per-worker", type=int, default=None, help="default: cores // workers")
+    ap.add_argument("--n", type=int, default=2, help="corpus cases per category")
+    ap.add_argument("--batch-size", type=int, default=4)
+    args = ap.parse_args()
+
+    jobs = [(c["root_key"], c["text"]) for c in make_corpus(args.n)]
+    pid = os.getpid()
+    import torch  # so the import isn't counted as model memory
+    before = process_memory(pid).get("rss_mb", 0.0)
+    tokenizer, model = load_model(args.model)
+    load_mb = round(process_memory(pid).get("rss_mb", 0.0) - before, 1)
+
+    extract_many(tokenizer, model, jobs[:2], batch_size=args.batch_size)  # warm-up
+    t0 = time.perf_counter()
+    extract_many(tokenizer, model, jobs, batch_size=args.batch_size)
+    single_cps = len(jobs) / (time.perf_counter() - t0)
+    print(json.dumps({"mode": "in-process", "torch_threads": torch.get_num_threads(), "load_mb": load_mb,
+                      "categories_per_sec": round(single_cps, 3)}), flush=True)
+
+    first_pss = None
+    for n in args.workers:
+        t0 = time.perf_counter()
+        pool = WorkerPool(tokenizer, model, workers=n, threads_per_worker=args.threads_per_worker)
+        try:
+            pool.wait_ready()
+            startup_s = time.perf_counter() - t0
+            pool.extract_many(jobs[:n], batch_size=args.batch_size)  # warm-up, one job per worker
+            t0 = time.perf_counter()
+            pool.extract_many(jobs, batch_size=args.batch_size)
+            cps = len(jobs) / (time.perf_counter() - t0)
+            mem = pool.memory_report()
+        finally:
+            pool.close()
+        first_pss = first_pss if first_pss is not None else (n, mem["total_pss_mb"])
+        added = (mem["total_pss_mb"] - first_pss[1]) / (n - first_pss[0]) if n > first_pss[0] else None
+        print(json.dumps({
+            "workers": n,
+            "threads_per_worker": pool.threads,
+            "startup_s": round(startup_s, 2),
+            "categories_per_sec": round(cps, 3),
+            "speedup_vs_in_process": round(cps / single_cps, 2),
+            "weights_mb": mem["weights_mb"],
+            "worker_private_mb_mean": mem["worker_private_mb_mean"],
+            "total_pss_mb": mem["total_pss_mb"],
+            "added_mb_per_worker": round(added, 1) if added is not None else None,
+            "load_mb": load_mb,
+        }), flush=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Synthetic intake corpus: per-category texts paired with gold FormData patches.
+
+Each case is generated from a seeded RNG, so the same (n_per_category, seed) always gives
+the same texts. `gold` holds the target values (dates in ISO form, as coerce_dates_in_form
+leaves them); `stated` holds the same values as they are written in the text, which is
+what a literal extractor copies out before date coercion.
+"""
+import random
+from typing import Any, Dict, List, Tuple
+
+from utils import blank_form_dict
+
+FIRST = ["Amina", "Carlos", "Mei", "Olek", "Fatima", "Juan", "Priya", "Tomasz", "Nadia", "Kwame", "Lucia", "Hassan"]
+LAST = ["Yusuf", "Mendoza", "Chen", "Kowalski", "Rahimi", "Perez", "Nair", "Nowak", "Haddad", "Mensah", "Rossi", "Ali"]
+NATIONALITIES = ["Nigerian", "Mexican", "Chinese", "Polish", "Afghan", "Colombian", "Indian", "Syrian", "Ghanaian"]
+LANGUAGES = ["English", "Spanish", "Mandarin", "Polish", "Dari", "Arabic", "French", "Hindi"]
+CITIES = [("Toronto", "Ontario", "M5H 1A1"), ("Vancouver", "British Columbia", "V6B 2W9"),
+          ("Calgary", "Alberta", "T2P 1J9"), ("Montreal", "Quebec", "H3B 4W8"), ("Halifax", "Nova Scotia", "B3J 3K5")]
+STREETS = ["King Street West", "Main Street", "Oak Avenue", "Elm Road", "Lakeshore Boulevard", "Queen Street"]
+PERMITS = ["work permit", "study permit", "permanent resident card", "visitor record"]
+EMPLOYERS = ["Maple Foods", "Northwind Logistics", "Harbour Cleaning", "Lakeside Hospital", "Bright Build"]
+JOBS = ["line cook", "warehouse associate", "cleaner", "care aide", "carpenter", "cashier"]
+PAY = ["weekly", "biweekly", "monthly"]
+LANDLORDS = ["Mr. Li", "Ms. Okafor", "Mr. Brown", "Mrs. Singh", "Ms. Dubois"]
+BANKS = ["RBC", "TD Bank", "Scotiabank", "BMO", "CIBC"]
+DEGREES = [("Bachelor", "Computer Science"), ("Diploma", "Nursing"), ("Master", "Economics"),
+           ("Certificate", "Welding"), ("Bachelor", "Accounting")]
+SCHOOLS = ["University of Lagos", "UNAM", "Fudan University", "Warsaw University", "Kabul University"]
+SKILLS = ["forklift operation", "customer service", "Microsoft Excel", "cooking", "first aid",
+          "carpentry", "driving", "bookkeeping", "Arabic translation", "welding"]
+RELATIONS = ["son", "daughter", "mother", "father", "wife", "husband"]
+NUMBER_WORDS = ["no", "one", "two", "three", "four"]
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August",
+          "September", "October", "November", "December"]
+
+def _date(rng: random.Random, lo: int, hi: int) -> Tuple[str, str]:
+    """(as written, ISO) for a random date between years lo and hi."""
+    y, m, d = rng.randint(lo, hi), rng.randint(1, 12), rng.randint(1, 28)
+    iso = f"{y:04d}-{m:02d}-{d:02d}"
+    style = rng.randrange(3)
+    if style == 0:
+        return f"{d} {MONTHS[m - 1]} {y}", iso
+    if style == 1:
+        return f"{MONTHS[m - 1]} {d}, {y}", iso
+    return iso, iso
+
+def _amount(rng: random.Random, lo: int, hi: int) -> str:
+    return f"{rng.randrange(lo, hi, 50)} CAD"
+
+def _name(rng: random.Random) -> str:
+    return f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+
+def _basic(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    name = _name(rng)
+    dob, dob_iso = _date(rng, 1960, 2004)
+    gender = rng.choice(["female", "male"])
+    nat, lang = rng.choice(NATIONALITIES), rng.choice(LANGUAGES)
+    passport = f"{rng.choice('ABCPX')}{rng.randrange(10**7, 10**8)}"
+    phone = f"+1 {rng.randrange(200, 999)} 555 {rng.randrange(1000, 9999)}"
+    email = f"{name.lower().replace(' ', '.')}@example.com"
+    text = (f"My name is {name}, {gender}, born {dob}. I am {nat}, passport {passport}. "
+            f"Phone {phone}, email {email}. I prefer {lang}.")
+    stated = {"full_name": name, "date_of_birth": dob, "gender": gender, "nationality": nat,
+              "passport_or_id": passport, "phone": phone, "email": email, "preferred_language": lang}
+    return text, stated, {**stated, "date_of_birth": dob_iso}
+
+def _address(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    city, prov, postal = rng.choice(CITIES)
+    line1 = f"{rng.randrange(1, 400)} {rng.choice(STREETS)}"
+    line2 = f"Apt {rng.randrange(1, 40)}" if rng.random() < 0.5 else None
+    permit = rng.choice(PERMITS)
+    number = f"{permit[0].upper()}P-{rng.randrange(100000, 999999)}"
+    exp, exp_iso = _date(rng, 2025, 2030)
+    where = f"{line1}, {line2}" if line2 else line1
+    text = (f"I live at {where}, {city}, {prov} {postal}, Canada. "
+            f"I hold a {permit}, number {number}, which expires on {exp}.")
+    stated = {"address_line1": line1, "address_line2": line2, "city": city, "state_or_province": prov,
+              "postal_code": postal, "country": "Canada", "permit_type": permit, "permit_number": number,
+              "permit_expiry_date": exp}
+    return text, stated, {**stated, "permit_expiry_date": exp_iso}
+
+def _employment(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    employer, job, pay = rng.choice(EMPLOYERS), rng.choice(JOBS), rng.choice(PAY)
+    start, start_iso = _date(rng, 2015, 2024)
+    income = _amount(rng, 1800, 5000)
+    needs = rng.random() < 0.5
+    text = (f"Employed full time at {employer} as a {job}, started {start}. "
+            f"I earn {income} a month, paid {pay}. "
+            + ("My job requires a work permit." if needs else "The job does not require a work permit."))
+    stated = {"status": "employed", "employer_name": employer, "job_title": job, "start_date": start,
+              "income_per_month": income, "pay_frequency": pay, "work_permit_required": needs}
+    return text, stated, {**stated, "start_date": start_iso}
+
+def _housing(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    landlord, rooms = rng.choice(LANDLORDS), rng.randint(1, 4)
+    start, start_iso = _date(rng, 2021, 2024)
+    end, end_iso = _date(rng, 2025, 2027)
+    rent = _amount(rng, 900, 2600)
+    text = (f"Renting a {rooms} room apartment from {landlord}. "
+            f"Lease from {start} to {end}, rent {rent} per month.")
+    stated = {"status": "renting", "address_if_different": None, "landlord_name": landlord,
+              "lease_start_date": start, "lease_end_date": end, "monthly_rent": rent, "rooms": rooms}
+    return text, stated, {**stated, "lease_start_date": start_iso, "lease_end_date": end_iso}
+
+def _dependents(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    n = rng.randint(0, 3)
+    if n == 0:
+        return "I have no dependents.", {"number_of_dependents": 0, "dependents": []}, \
+            {"number_of_dependents": 0, "dependents": []}
+    stated_deps, gold_deps, parts = [], [], []
+    for _ in range(n):
+        name, rel = rng.choice(FIRST), rng.choice(RELATIONS)
+        dob, dob_iso = _date(rng, 1950, 2022)
+        here = rng.random() < 0.6
+        parts.append(f"my {rel} {name}, born {dob}, " + ("who lives with me" if here else "still abroad"))
+        dep = {"name": name, "relationship": rel, "date_of_birth": dob, "in_country": here, "special_needs": None}
+        stated_deps.append(dep)
+        gold_deps.append({**dep, "date_of_birth": dob_iso})
+    text = f"I have {NUMBER_WORDS[n]} dependents: " + "; ".join(parts) + "."
+    return text, {"number_of_dependents": n, "dependents": stated_deps}, \
+        {"number_of_dependents": n, "dependents": gold_deps}
+
+def _financial(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    has_bank = rng.random() < 0.7
+    bank = rng.choice(BANKS) if has_bank else None
+    income, expenses = _amount(rng, 1500, 5000), _amount(rng, 800, 3000)
+    savings, debts = _amount(rng, 0, 10000), _amount(rng, 0, 8000)
+    text = ((f"I have a bank account at {bank}. " if has_bank else "I don't have a bank account. ")
+            + f"My income is {income} per month and my expenses are {expenses}. "
+            + f"Savings of {savings}; debt of {debts}.")
+    stated = {"has_bank_account": has_bank, "bank_name": bank, "monthly_income": income,
+              "monthly_expenses": expenses, "savings_amount": savings, "debts_amount": debts}
+    return text, stated, dict(stated)
+
+def _education(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    degree, field = rng.choice(DEGREES)
+    school, country = rng.choice(SCHOOLS), rng.choice(["Nigeria", "Mexico", "China", "Poland", "Afghanistan"])
+    start, start_iso = _date(rng, 2000, 2012)
+    end, end_iso = _date(rng, 2013, 2020)
+    text = (f"My highest level is a {degree}. I studied {field} at {school} in {country} "
+            f"from {start} to {end}.")
+    item = {"degree": degree, "field_of_study": field, "institution": school, "start_date": start,
+            "end_date": end, "country": country}
+    return text, {"highest_level": degree, "items": [item]}, \
+        {"highest_level": degree, "items": [{**item, "start_date": start_iso, "end_date": end_iso}]}
+
+def _skills(rng: random.Random) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
+    picked = rng.sample(SKILLS, rng.randint(1, 4))
+    text = "My skills: " + ", ".join(picked) + "."
+    return text, {"skills": picked}, {"skills": list(picked)}
+
+GENERATORS = {
+    "basic_personal_info": _basic,
+    "address_and_permits": _address,
+    "employment": _employment,
+    "housing": _housing,
+    "dependents_information": _dependents,
+    "financial_information": _financial,
+    "education": _education,
+    "skills": _skills,
+}
+
+def make_corpus(n_per_category: int = 10, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    [{"id", "root_key", "text", "stated", "gold"}] with n_per_category cases per category.
+    stated/gold are patches like {"employment": {...}} over the full category schema.
+    """
+    rng = random.Random(seed)
+    blank = blank_form_dict()
+    cases = []
+    for root_key, gen in GENERATORS.items():
+        for i in range(n_per_category):
+            text, stated, gold = gen(rng)
+            cases.append({
+                "id": f"{root_key}-{i}",
+                "root_key": root_key,
+                "text": text,
+                "stated": {root_key: {**blank[root_key], **stated}},
+                "gold": {root_key: {**blank[root_key], **gold}},
+            })
+    return cases
@@ -0,0 +1,188 @@
+"""
+Deterministic stand-ins for the tokenizer/model pair returned by llm.load_model.
+
+FakeTokenizer is character level (id = code point + 2) with a fixed chat template.
+FakeModel implements generate() and the plain forward used for prefix caching, and
+answers each prompt with responder(root_key, user_text). Latency is simulated per
+prefilled token and per decode step, and the model serves one call at a time like a
+single device. Given a streamer, generate() emits the reply token by token. The
+token-by-token paths (speculative, constrained) need logits and so still need a real model.
+"""
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+from transformers import BatchEncoding
+
+_ROOT_RE = re.compile(r'ROOT SCHEMA:\n\{\s*"(\w+)"')
+_TEXT_RE = re.compile(r"USER TEXT:\n([\s\S]*?)\n\nReturn JSON now\.")
+
+Responder = Callable[[Optional[str], str], str]
+
+class FakeTokenizer:
+    pad_token_id = 0
+    eos_token_id = 1
+    all_special_ids = [0, 1]
+
+    def __init__(self):
+        self.padding_side = "right"
+
+    def __len__(self) -> int:
+        return 0x110000 + 2
+
+    def apply_chat_template(self, messages, tokenize: bool = False, add_generation_prompt: bool = False) -> str:
+        text = "".join(f"<|{m['role']}|>\n{m['content']}\n" for m in messages)
+        return text + ("<|assistant|>\n" if add_generation_prompt else "")
+
+    def encode(self, text: str) -> List[int]:
+        return [ord(c) + 2 for c in text]
+
+    def __call__(self, text, return_tensors: str = "pt", padding: bool = False,
+                 add_special_tokens: bool = False) -> BatchEncoding:
+        rows = [self.encode(t) for t in ([text] if isinstance(text, str) else text)]
+        width = max(len(r) for r in rows)
+        ids, mask = [], []
+        for r in rows:
+            pad = width - len(r)
+            if self.padding_side == "left":
+                ids.append([self.pad_token_id] * pad + r)
+                mask.append([0] * pad + [1] * len(r))
+            else:
+                ids.append(r + [self.pad_token_id] * pad)
+                mask.append([1] * len(r) + [0] * pad)
+        return BatchEncoding({"input_ids": torch.tensor(ids), "attention_mask": torch.tensor(mask)})
+
+    def decode(self, ids, skip_special_tokens: bool = False) -> str:
+        ids = ids.tolist() if hasattr(ids, "tolist") else ids
+        return "".join(chr(i - 2) if i >= 2 else ("" if skip_special_tokens else "\x00") for i in ids)
+
+    def batch_decode(self, rows, skip_special_tokens: bool = False) -> List[str]:
+        return [self.decode(r, skip_special_tokens) for r in rows]
+
+class FakePast:
+    """Only tracks how many positions a real KV-cache would hold."""
+
+    def __init__(self, length: int):
+        self.length = length
+
+    def get_seq_length(self) -> int:
+        return self.length
+
+def split_prompt(prompt: str) -> Tuple[Optional[str], str]:
+    """(root_key, user_text) of an extractor.build_messages prompt."""
+    root = _ROOT_RE.search(prompt)
+    text = _TEXT_RE.search(prompt)
+    return (root.group(1) if root else None), (text.group(1) if text else "")
+
+class FakeModel:
+    """
+    - responder: (root_key, user_text) -> reply text; defaults to an empty JSON object
+    - prefill_ms: simulated milliseconds per prefilled prompt token
+    - decode_ms: simulated milliseconds per decode step of a single row
+    - batch_overhead: extra fraction of decode_ms per additional row in a batch
+    """
+
+    def __init__(self, tokenizer: FakeTokenizer, responder: Optional[Responder] = None,
+                 prefill_ms: float = 0.005, decode_ms: float = 0.2, batch_overhead: float = 0.1):
+        self.tokenizer = tokenizer
+        self.responder = responder or (lambda root_key, text: "{}")
+        self.prefill_ms, self.decode_ms, self.batch_overhead = prefill_ms, decode_ms, batch_overhead
+        self.name_or_path = "fake"
+        self.device = torch.device("cpu")
+        self.generation_config = SimpleNamespace(eos_token_id=tokenizer.eos_token_id)
+        self.calls = 0
+        self._device_lock = threading.Lock()
+
+    def _busy(self, ms: float) -> None:
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def __call__(self, input_ids, past_key_values=None, use_cache: bool = True, **kwargs):
+        n = input_ids.shape[-1]
+        with self._device_lock:
+            self._busy(n * self.prefill_ms)
+        start = past_key_values.get_seq_length() if past_key_values is not None else 0
+        return SimpleNamespace(past_key_values=FakePast(start + n), logits=None)
+
+    def _stream(self, input_ids, reply: List[int], stopping_criteria, streamer):
+        # single row, one token per decode step so stopping criteria (cancel) act mid-reply
+        streamer.put(input_ids[0])
+        out = input_ids
+        for token in reply:
+            self._busy(self.decode_ms)
+            out = torch.cat([out, torch.tensor([[token]], dtype=input_ids.dtype)], dim=1)
+            streamer.put(torch.tensor([token]))
+            if any(bool(c(out, None).all()) for c in stopping_criteria or ()):
+                break
+        streamer.end()
+        return out
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens: int = 640, past_key_values=None,
+                 pad_token_id: Optional[int] = None, stopping_criteria=None, streamer=None, **kwargs):
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        pad = self.tokenizer.pad_token_id if pad_token_id is None else pad_token_id
+        replies = []
+        for row, mask in zip(input_ids, attention_mask):
+            root_key, text = split_prompt(self.tokenizer.decode(row[mask.bool()]))
+            ids = self.tokenizer.encode(self.responder(root_key, text)) + [self.tokenizer.eos_token_id]
+            replies.append(ids[:max_new_tokens])
+        steps = max(len(r) for r in replies)
+        prefill = int(attention_mask.sum()) - (past_key_values.get_seq_length() if past_key_values is not None else 0)
+        with self._device_lock:
+            self.calls += 1
+            self._busy(prefill * self.prefill_ms)
+            if streamer is not None:
+                return self._stream(input_ids, replies[0], stopping_criteria, streamer)
+            for criteria in stopping_criteria or ():
+                criteria(input_ids, None)
+            self._busy(steps * self.decode_ms * (1 + self.batch_overhead * (len(replies) - 1)))
+        new = torch.tensor([r + [pad] * (steps - len(r)) for r in replies], dtype=input_ids.dtype)
+        return torch.cat([input_ids, new], dim=1)
+
+def corpus_responder(cases: List[Dict[str, Any]], error_rate: float = 0.0, seed: int = 0) -> Responder:
+    """
+    Scripted replies for benchmarks.corpus cases: each text is answered with its `stated`
+    patch. With error_rate > 0, every non-null field is independently dropped or replaced
+    by a wrong value with that probability (deterministic per case, field and seed).
+    Texts not in the corpus get an empty object.
+    """
+    by_text = {(c["root_key"], c["text"]): c for c in cases}
+
+    def corrupt(case_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        out = {}
+        for k, v in body.items():
+            rng = random.Random(f"{seed}:{case_id}:{k}")
+            if v is not None and v != [] and rng.random() < error_rate:
+                if rng.random() < 0.5:
+                    v = None
+                elif isinstance(v, bool):
+                    v = not v
+                elif isinstance(v, int):
+                    v = v + 1
+                elif isinstance(v, list):
+                    v = v[:-1]
+                else:
+                    v = "unknown"
+            out[k] = v
+        return out
+
+    def respond(root_key: Optional[str], text: str) -> str:
+        case = by_text.get((root_key, text.strip()))
+        if case is None:
+            return "{}"
+        body = case["stated"][root_key]
+        if error_rate > 0 and isinstance(body, dict):
+            body = corrupt(case["id"], body)
+        return json.dumps({root_key: body}, ensure_ascii=False)
+    return respond
+
+def load_fake(responder: Optional[Responder] = None, **latency) -> Tuple[FakeTokenizer, FakeModel]:
+    """(tokenizer, model) in place of llm.load_model(...)."""
+    tokenizer = FakeTokenizer()
+    return tokenizer, FakeModel(tokenizer, responder, **latency)
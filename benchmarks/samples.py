@@ -0,0 +1,32 @@
+# Short per-category intake texts used by the benchmarks
+SAMPLE_TEXTS = {
+    "basic_personal_info": (
+        "My name is Amina Yusuf, born 14 March 1991. I am Nigerian, female. "
+        "Passport A12345678. Phone +1 416 555 0199, email amina.yusuf@example.com. I prefer English."
+    ),
+    "address_and_permits": (
+        "I live at 22 King Street West, Apt 5, Toronto, Ontario M5H 1A1, Canada. "
+        "I hold a work permit, number WP-998877, which expires on 2026-01-31."
+    ),
+    "employment": (
+        "Employed full time at Maple Foods as a line cook since June 3rd 2023. "
+        "I earn about 2800 CAD a month, paid biweekly. My job requires a work permit."
+    ),
+    "housing": (
+        "Renting a 2 room apartment from Mr. Li. Lease from 1 July 2023 to 30 June 2024, rent 1450 CAD per month."
+    ),
+    "dependents_information": (
+        "I have two dependents: my son Musa, born 2015-09-02, who lives with me, "
+        "and my mother Hauwa, born 1960-01-20, still in Nigeria."
+    ),
+    "financial_information": (
+        "I have a bank account with TD Bank. Monthly income 2800 CAD, expenses around 2300. "
+        "Savings 1200 CAD, debts 500 CAD on a credit card."
+    ),
+    "education": (
+        "Highest level is a bachelor's degree. BSc in Microbiology from University of Lagos, 2009 to 2013, Nigeria."
+    ),
+    "skills": (
+        "Cooking, food safety certification, customer service, Hausa and Yoruba languages, basic Excel."
+    ),
+}
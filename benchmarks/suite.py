@@ -0,0 +1,292 @@
+"""
+Offline benchmark and regression suite: extraction latency, throughput under concurrency,
+peak memory, field-level precision/recall against the synthetic gold corpus, and hot
+helper timings. Runs on the deterministic fake model unless --model is given.
+
+    python -m benchmarks.suite --out results.json
+    python -m benchmarks.suite --out new.json --baseline results.json   # exit 1 on regression
+"""
+import argparse
+import copy
+import json
+import platform
+import resource
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+from benchmarks.corpus import make_corpus
+from benchmarks.fake import corpus_responder, load_fake
+from extractor import extract_category, extract_many
+from llm import InferenceScheduler, SchedulerBusy, load_model
+from utils import blank_form_dict, coerce_dates_in_form, deep_merge, normalize_forms, parse_json_strict
+
+# ---------- Scoring ----------
+
+def _norm(v: Any) -> Any:
+    return v.strip().casefold() if isinstance(v, str) else v
+
+def flatten(value: Any, path: str = "") -> Dict[str, Any]:
+    """
+    Non-null leaves as {path: value}. Lists of objects are indexed (items[0].degree);
+    lists of scalars become one key per item (skills[]=cooking) so order doesn't matter.
+    """
+    out: Dict[str, Any] = {}
+    if isinstance(value, dict):
+        for k, v in value.items():
+            out.update(flatten(v, f"{path}.{k}" if path else k))
+    elif isinstance(value, list):
+        for i, v in enumerate(value):
+            if isinstance(v, dict):
+                out.update(flatten(v, f"{path}[{i}]"))
+            elif v is not None:
+                out[f"{path}[]={_norm(v)}"] = True
+    elif value is not None:
+        out[path] = _norm(value)
+    return out
+
+def score(pred: Dict[str, Any], gold: Dict[str, Any]) -> Tuple[int, int, int]:
+    """(true positives, predicted fields, gold fields) for one patch."""
+    p, g = flatten(pred), flatten(gold)
+    tp = sum(1 for k, v in p.items() if k in g and g[k] == v)
+    return tp, len(p), len(g)
+
+def _prf(tp: int, n_pred: int, n_gold: int) -> Dict[str, float]:
+    precision = tp / n_pred if n_pred else 1.0
+    recall = tp / n_gold if n_gold else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": round(precision, 4), "recall": round(recall, 4), "f1": round(f1, 4)}
+
+def _coerced(root_key: str, patch: Dict[str, Any]) -> Dict[str, Any]:
+    # the app coerces dates on the merged form before anyone sees it
+    form = coerce_dates_in_form(deep_merge(blank_form_dict(), copy.deepcopy(patch)))
+    return {root_key: form.get(root_key)}
+
+def quality(tokenizer, model, cases: List[Dict[str, Any]], fast_path: bool) -> Dict[str, Any]:
+    jobs = [(c["root_key"], c["text"]) for c in cases]
+    patches = extract_many(tokenizer, model, jobs, fast_path=fast_path)
+    per_cat: Dict[str, List[int]] = {}
+    for c, patch in zip(cases, patches):
+        counts = score(_coerced(c["root_key"], patch), c["gold"])
+        acc = per_cat.setdefault(c["root_key"], [0, 0, 0])
+        for i, n in enumerate(counts):
+            acc[i] += n
+    total = [sum(v[i] for v in per_cat.values()) for i in range(3)]
+    return {"overall": _prf(*total), "per_category": {k: _prf(*v) for k, v in per_cat.items()}}
+
+# ---------- Timing ----------
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+def _summary(latencies: List[float]) -> Dict[str, float]:
+    return {
+        "n": len(latencies),
+        "mean_ms": round(1000 * statistics.fmean(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(1000 * statistics.median(latencies), 3) if latencies else 0.0,
+        "p95_ms": round(1000 * _percentile(latencies, 0.95), 3),
+    }
+
+def latency(tokenizer, model, cases: List[Dict[str, Any]], fast_path: bool) -> Dict[str, float]:
+    """Sequential end-to-end extract_category, one case at a time."""
+    latencies = []
+    for c in cases:
+        t0 = time.perf_counter()
+        extract_category(tokenizer, model, c["root_key"], c["text"], fast_path=fast_path)
+        latencies.append(time.perf_counter() - t0)
+    return _summary(latencies)
+
+def throughput(tokenizer, model, cases: List[Dict[str, Any]], concurrency: int,
+               scheduler: Optional[InferenceScheduler] = None) -> Dict[str, Any]:
+    """concurrency client threads split the cases; with a scheduler they share its batches."""
+    latencies, busy = [], [0]
+    lock = threading.Lock()
+
+    def client(n: int) -> None:
+        handle = scheduler.session(f"s{n}") if scheduler is not None else None
+        for c in cases[n::concurrency]:
+            t0 = time.perf_counter()
+            try:
+                extract_category(tokenizer, model, c["root_key"], c["text"], scheduler=handle)
+            except SchedulerBusy:
+                with lock:
+                    busy[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    return {**_summary(latencies), "requests_per_sec": round(len(latencies) / wall, 3) if wall else 0.0,
+            "busy": busy[0]}
+
+def memory(tokenizer, model, cases: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Python heap peak (tracemalloc) of one batched pass over the corpus, plus process max RSS."""
+    tracemalloc.start()
+    try:
+        extract_many(tokenizer, model, [(c["root_key"], c["text"]) for c in cases])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return {"python_peak_kb": round(peak / 1024, 1),
+            "max_rss_kb": round(rss / 1024 if sys.platform == "darwin" else rss, 1)}
+
+# ---------- Hot helpers ----------
+
+def _big_form(n: int) -> Dict[str, Any]:
+    form = blank_form_dict()
+    form["basic_personal_info"]["date_of_birth"] = "14 March 1991"
+    form["employment"]["start_date"] = "June 3, 2023"
+    form["dependents_information"]["dependents"] = [
+        {"name": f"Child {i}", "relationship": "son", "date_of_birth": f"{1 + i % 28} May {1990 + i % 30}",
+         "in_country": True, "special_needs": None} for i in range(n)
+    ]
+    form["education"]["items"] = [
+        {"degree": "Diploma", "field_of_study": "Nursing", "institution": "UNAM",
+         "start_date": f"{2000 + i % 20}-09-01", "end_date": f"June {1 + i % 28}, {2004 + i % 20}", "country": "Mexico"}
+        for i in range(n)
+    ]
+    return form
+
+def _nested(depth: int, width: int, leaf: Any) -> Dict[str, Any]:
+    if depth == 0:
+        return {f"k{i}": leaf for i in range(width)}
+    return {f"k{i}": _nested(depth - 1, width, leaf) for i in range(width)}
+
+def _time_calls(fn, make_arg, repeats: int) -> Dict[str, float]:
+    times = []
+    for _ in range(repeats):
+        arg = make_arg()
+        t0 = time.perf_counter()
+        fn(*arg)
+        times.append(time.perf_counter() - t0)
+    return {"best_ms": round(1000 * min(times), 3), "mean_ms": round(1000 * statistics.fmean(times), 3)}
+
+def helpers(size: int, repeats: int) -> Dict[str, Dict[str, float]]:
+    """Times coerce_dates_in_form, normalize_forms, deep_merge and parse_json_strict on large inputs."""
+    form = _big_form(size)
+    base, patch = _nested(3, max(2, round(size ** 0.25)), "x"), _nested(3, max(2, round(size ** 0.25)), "y")
+    body = json.dumps(_big_form(size), ensure_ascii=False)
+    noisy = f"Sure! Here is the extracted JSON:\n```json\n{body}\n```\nLet me know if anything is missing."
+    return {
+        "coerce_dates_in_form": {"items": 2 * size, **_time_calls(
+            coerce_dates_in_form, lambda: (copy.deepcopy(form),), repeats)},
+        "normalize_forms": {"forms": size, **_time_calls(
+            normalize_forms, lambda: ([_big_form(1) for _ in range(size)],), repeats)},
+        "deep_merge": {"leaves": len(flatten(patch)), **_time_calls(
+            deep_merge, lambda: (copy.deepcopy(base), patch), repeats)},
+        "parse_json_strict": {"chars": len(noisy), **_time_calls(
+            parse_json_strict, lambda: (noisy,), repeats)},
+    }
+
+# ---------- Regression check ----------
+
+def _walk(d: Dict[str, Any], path: str = ""):
+    for k, v in d.items():
+        p = f"{path}.{k}" if path else str(k)
+        if isinstance(v, dict):
+            yield from _walk(v, p)
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            yield p, v
+
+def regressions(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.2) -> List[str]:
+    """
+    Metrics that got worse than baseline: timings (*_ms) by more than tolerance (relative),
+    throughput (requests_per_sec) by more than tolerance, precision/recall/f1 by > 0.01.
+    """
+    old = dict(_walk({k: baseline.get(k, {}) for k in ("latency", "throughput", "quality", "helpers")}))
+    found = []
+    for path, new in _walk({k: current.get(k, {}) for k in ("latency", "throughput", "quality", "helpers")}):
+        if path not in old:
+            continue
+        was, leaf = old[path], path.rsplit(".", 1)[-1]
+        if leaf.endswith("_ms") and was > 0 and new > was * (1 + tolerance):
+            found.append(f"{path}: {was} -> {new} ms")
+        elif leaf == "requests_per_sec" and new < was * (1 - tolerance):
+            found.append(f"{path}: {was} -> {new} req/s")
+        elif leaf in ("precision", "recall", "f1") and new < was - 0.01:
+            found.append(f"{path}: {was} -> {new}")
+    return found
+
+# ---------- Runner ----------
+
+def run_suite(tokenizer, model, cases: List[Dict[str, Any]], concurrency: List[int],
+              helper_size: int = 2000, helper_repeats: int = 5) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"latency": {}, "throughput": {}, "quality": {}}
+    for mode, fast_path in (("model", False), ("fast_path", True)):
+        results["latency"][mode] = latency(tokenizer, model, cases, fast_path)
+        results["quality"][mode] = quality(tokenizer, model, cases, fast_path)
+    for n in concurrency:
+        scheduler = InferenceScheduler(tokenizer, model, max_queue=max(64, 2 * len(cases)))
+        try:
+            results["throughput"][f"c{n}"] = {
+                "direct": throughput(tokenizer, model, cases, n),
+                "scheduler": throughput(tokenizer, model, cases, n, scheduler),
+            }
+        finally:
+            scheduler.close()
+    results["memory"] = memory(tokenizer, model, cases)
+    results["helpers"] = helpers(helper_size, helper_repeats)
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", default=None, help="real model id (default: deterministic fake model)")
+    ap.add_argument("--cases", type=int, default=6, help="corpus cases per category")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--error-rate", type=float, default=0.1, help="fake model: per-field error probability")
+    ap.add_argument("--prefill-ms", type=float, default=0.005, help="fake model: ms per prompt token")
+    ap.add_argument("--decode-ms", type=float, default=0.2, help="fake model: ms per decode step")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--helper-size", type=int, default=2000, help="list items in the helper benchmarks")
+    ap.add_argument("--helper-repeats", type=int, default=5)
+    ap.add_argument("--out", default=None, help="write results JSON here (always printed to stdout)")
+    ap.add_argument("--baseline", default=None, help="earlier results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown vs baseline")
+    args = ap.parse_args(argv)
+
+    cases = make_corpus(args.cases, args.seed)
+    if args.model:
+        tokenizer, model = load_model(args.model)
+    else:
+        tokenizer, model = load_fake(corpus_responder(cases, args.error_rate, args.seed),
+                                     prefill_ms=args.prefill_ms, decode_ms=args.decode_ms)
+    metrics.reset()
+    metrics.enable()
+    results = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "model": args.model or "fake"},
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        **run_suite(tokenizer, model, cases, args.concurrency, args.helper_size, args.helper_repeats),
+    }
+    results["stages"] = metrics.snapshot()["histograms"]
+
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            found = regressions(json.load(f), results, args.tolerance)
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        return 1 if found else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""
+Content-addressed cache of extraction results.
+
+Keys hash (model_id, generation params, root_key, schema version, normalized user text).
+Values are the cleaned JSON patches. A bounded in-memory LRU sits in front of an
+optional sqlite file, which survives restarts and is shared by every session/process
+pointing at the same path.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+from models import FormData
+
+def _schema_version() -> str:
+    schema = json.dumps(FormData.model_json_schema(), sort_keys=True)
+    return hashlib.sha256(schema.encode("utf-8")).hexdigest()[:12]
+
+# Changes whenever a models.py field changes, so stale patches are never served
+SCHEMA_VERSION = _schema_version()
+
+def normalize_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+def cache_key(model_id: str, params: Dict[str, Any], root_key: str, user_text: str) -> str:
+    payload = json.dumps({
+        "model_id": model_id,
+        "params": params,
+        "root_key": root_key,
+        "schema": SCHEMA_VERSION,
+        "text": hashlib.sha256(normalize_text(user_text).encode("utf-8")).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ExtractionCache:
+    """
+    LRU (max_entries) over an optional sqlite store (db_path, capped at max_disk_entries).
+    Thread-safe; get() returns a fresh dict each time so callers may mutate it.
+    """
+
+    def __init__(self, max_entries: int = 512, db_path: Optional[str] = None, max_disk_entries: int = 50_000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._mem: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.disk_hits = self.disk_evictions = 0
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extractions (key TEXT PRIMARY KEY, value TEXT NOT NULL, used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS extractions_used ON extractions(used)")
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            raw = self._mem.get(key)
+            if raw is not None:
+                self._mem.move_to_end(key)
+            elif self._db is not None:
+                row = self._db.execute("SELECT value FROM extractions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    raw = row[0]
+                    self.disk_hits += 1
+                    self._db.execute("UPDATE extractions SET used = ? WHERE key = ?", (time.time(), key))
+                    self._db.commit()
+                    self._remember(key, raw)
+            if raw is None:
+                self.misses += 1
+                metrics.count("extraction_cache_misses")
+                return None
+            self.hits += 1
+            metrics.count("extraction_cache_hits")
+        return json.loads(raw)
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        raw = json.dumps(value)
+        with self._lock:
+            self._remember(key, raw)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extractions (key, value, used) VALUES (?, ?, ?)", (key, raw, time.time())
+                )
+                count = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+                if count > self.max_disk_entries:
+                    over = count - self.max_disk_entries
+                    self._db.execute(
+                        "DELETE FROM extractions WHERE key IN (SELECT key FROM extractions ORDER BY used LIMIT ?)", (over,)
+                    )
+                    self.disk_evictions += over
+                self._db.commit()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def _remember(self, key: str, raw: str) -> None:
+        # caller holds the lock
+        self._mem[key] = raw
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            disk = self._db.execute("SELECT COUNT(*) FROM extractions").fetchone()[0] if self._db is not None else 0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "memory_entries": len(self._mem),
+                "disk_entries": disk,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM extractions")
+                self._db.commit()
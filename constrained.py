@@ -0,0 +1,268 @@
+"""
+Schema-constrained JSON decoding.
+
+A category's pydantic model is compiled once into a small node tree. Walking that tree
+yields a decoding "program": fixed text (braces, key names, separators) is forced, and
+value slots are choices restricted to token sets that can only produce null or a value
+of the field's type. The program ends as soon as the root object closes.
+"""
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Generator, List, NamedTuple, Optional, Tuple, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from models import FormData
+
+if TYPE_CHECKING:
+    import torch
+
+FORCE, CHOOSE = "force", "choose"
+
+# Per-value caps so a confused model can't spend the whole token budget in one slot
+MAX_STR_TOKENS = 48
+MAX_INT_TOKENS = 4
+MAX_LIST_ITEMS = 12
+
+class Node(NamedTuple):
+    kind: str                                   # obj | str | int | bool | list
+    nullable: bool = False
+    fields: Tuple[Tuple[str, "Node"], ...] = ()  # obj only
+    item: Optional["Node"] = None               # list only
+
+Step = Tuple[str, str]
+Program = Generator[Step, Optional[str], bool]
+
+# ---------- Schema compilation ----------
+
+def _node_for(annotation: Any) -> Node:
+    nullable = False
+    if get_origin(annotation) is Union:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        nullable = len(args) < len(get_args(annotation))
+        annotation = args[0] if len(args) == 1 else str
+    if get_origin(annotation) in (list, List):
+        (item,) = get_args(annotation) or (str,)
+        return Node("list", nullable, item=_node_for(item))
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        fields = tuple((name, _node_for(f.annotation)) for name, f in annotation.model_fields.items())
+        return Node("obj", nullable, fields=fields)
+    if annotation is bool:
+        return Node("bool", nullable)
+    if annotation is int:
+        return Node("int", nullable)
+    return Node("str", nullable)
+
+@lru_cache(maxsize=None)
+def compile_schema(root_key: str, exclude: FrozenSet[str] = frozenset()) -> Optional[Node]:
+    """
+    Compiled node tree for {root_key: <model>}, or None for unknown keys. Fields named in
+    exclude are left out of the root object. Cached per (root_key, exclude).
+    """
+    field = FormData.model_fields.get(root_key)
+    if field is None:
+        return None
+    node = _node_for(field.annotation)
+    if exclude and node.kind == "obj":
+        node = node._replace(fields=tuple((k, n) for k, n in node.fields if k not in exclude))
+    return Node("obj", fields=((root_key, node),))
+
+# ---------- Decoding program ----------
+# Each generator yields (FORCE, text) or (CHOOSE, kind). CHOOSE is answered via send()
+# with the chosen token's text. The return value tells the caller whether the value
+# consumed its follow character (the first char of the text forced after it).
+
+def _is_null_prefix(text: str) -> bool:
+    return not text.startswith('"') and "null".startswith(text)
+
+def _program(node: Node, follow: str, opened: bool = False) -> Program:
+    if node.kind == "obj":
+        return (yield from _obj(node, opened))
+    if node.kind == "list":
+        return (yield from _list(node, opened))
+    if node.kind == "str":
+        return (yield from _str(node, opened))
+    if node.kind == "int":
+        return (yield from _int(node, follow))
+    return (yield from _bool(node))
+
+def _obj(node: Node, opened: bool) -> Program:
+    if node.nullable and not opened:
+        t = yield (CHOOSE, "obj_start_or_null")
+        if _is_null_prefix(t):
+            yield (FORCE, "null"[len(t):])
+            return False
+        opened = True
+    if not node.fields:
+        yield (FORCE, "}" if opened else "{}")
+        return False
+    sep = "" if opened else "{"
+    for i, (key, child) in enumerate(node.fields):
+        yield (FORCE, f'{sep}"{key}": ')
+        last = i + 1 == len(node.fields)
+        consumed = yield from _program(child, "}" if last else ",")
+        # a value that already chose the follow char leaves only the rest to force
+        sep = " " if consumed else ", "
+        if last and not consumed:
+            yield (FORCE, "}")
+    return False
+
+def _list(node: Node, opened: bool) -> Program:
+    if not opened:
+        if node.nullable:
+            t = yield (CHOOSE, "list_start_or_null")
+            if _is_null_prefix(t):
+                yield (FORCE, "null"[len(t):])
+                return False
+        else:
+            yield (FORCE, "[")
+    item = node.item or Node("str")
+    item_open = "{" if item.kind == "obj" else '"' if item.kind == "str" else None
+    count = 0
+    while True:
+        if count >= MAX_LIST_ITEMS:
+            yield (FORCE, "]")
+            return False
+        if count == 0:
+            t = yield (CHOOSE, f"list_first:{item_open or ''}")
+            if t == "]":
+                return False
+            yield from _program(item, "]", opened=item_open is not None)
+        else:
+            t = yield (CHOOSE, "list_next")
+            if t == "]":
+                return False
+            yield (FORCE, " ")
+            yield from _program(item, "]")
+        count += 1
+
+def _str(node: Node, opened: bool) -> Program:
+    if opened:
+        text = '"'
+    else:
+        t = yield (CHOOSE, "str_start_or_null" if node.nullable else "str_start")
+        if _is_null_prefix(t):
+            yield (FORCE, "null"[len(t):])
+            return False
+        text = t
+    n = 1
+    while not (len(text) >= 2 and text.endswith('"')):
+        if n >= MAX_STR_TOKENS:
+            yield (FORCE, '"')
+            break
+        text += yield (CHOOSE, "str_body")
+        n += 1
+    return False
+
+def _int(node: Node, follow: str) -> Program:
+    t = yield (CHOOSE, "int_start_or_null" if node.nullable else "int_start")
+    if _is_null_prefix(t):
+        yield (FORCE, "null"[len(t):])
+        return False
+    if t == "-":
+        t = yield (CHOOSE, "digits")
+    if t == "0":
+        return False  # JSON allows no digits after a leading zero
+    for _ in range(MAX_INT_TOKENS):
+        t = yield (CHOOSE, f"int_body:{follow}")
+        if t == follow:
+            return True
+    return False
+
+def _bool(node: Node) -> Program:
+    t = yield (CHOOSE, "bool_or_null" if node.nullable else "bool")
+    for word in ("true", "false", "null"):
+        if word.startswith(t):
+            yield (FORCE, word[len(t):])
+            break
+    return False
+
+def root_program(root_key: str, exclude: FrozenSet[str] = frozenset()) -> Optional[Program]:
+    node = compile_schema(root_key, exclude)
+    return _program(node, "") if node is not None else None
+
+# ---------- Token tables ----------
+# Per-kind vocabulary masks, built lazily from each token's decoded text and kept on the
+# tokenizer (the vocabulary never changes for a loaded tokenizer).
+
+_TABLE_ATTR = "_formease_token_texts"
+_MASKS_ATTR = "_formease_token_masks"
+# "\ufffd" is how a byte-fallback / partial UTF-8 token decodes on its own. Its bytes are
+# all non-ASCII, so it can't hide a quote or backslash; llm_generate_constrained decodes
+# chosen ids together, so accented and non-Latin characters come out whole.
+_BODY_RE = re.compile(r'[^"\\\x00-\x1f]+')
+_DIGITS_RE = re.compile(r"[0-9]+")
+_FIRST_DIGITS_RE = re.compile(r"0|[1-9][0-9]*")  # the first digits of a JSON number
+
+def token_texts(tokenizer) -> List[str]:
+    texts = getattr(tokenizer, _TABLE_ATTR, None)
+    if texts is None:
+        texts = tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+        # special/added tokens (<|im_end|>, ...) must never appear inside a value
+        special = set(tokenizer.all_special_ids) | set(getattr(tokenizer, "added_tokens_decoder", {}) or {})
+        for i in special:
+            if 0 <= i < len(texts):
+                texts[i] = ""
+        setattr(tokenizer, _TABLE_ATTR, texts)
+    return texts
+
+def _allowed(kind: str, t: str) -> bool:
+    if not t:
+        return False
+    null = "null".startswith(t)
+    if kind == "str_body":
+        return bool(_BODY_RE.fullmatch(t) or t == '"' or (t.endswith('"') and _BODY_RE.fullmatch(t[:-1])))
+    if kind in ("str_start", "str_start_or_null"):
+        body = t[1:]
+        ok = t.startswith('"') and (not body or _allowed("str_body", body))
+        return ok or (kind == "str_start_or_null" and null)
+    if kind == "digits":
+        return bool(_FIRST_DIGITS_RE.fullmatch(t))
+    if kind in ("int_start", "int_start_or_null"):
+        return bool(_FIRST_DIGITS_RE.fullmatch(t)) or t == "-" or (kind == "int_start_or_null" and null)
+    if kind.startswith("int_body:"):
+        return bool(_DIGITS_RE.fullmatch(t)) or t == kind.split(":", 1)[1]
+    if kind in ("bool", "bool_or_null"):
+        return "true".startswith(t) or "false".startswith(t) or (kind == "bool_or_null" and null)
+    if kind == "obj_start_or_null":
+        return t == "{" or null
+    if kind == "list_start_or_null":
+        return t == "[" or null
+    if kind.startswith("list_first:"):
+        return t == "]" or t == kind.split(":", 1)[1]
+    if kind == "list_next":
+        return t in (",", "]")
+    return False
+
+def close_choice(kind: str) -> str:
+    """
+    Shortest text for a CHOOSE kind that ends the value in progress (null where allowed).
+    Answering every CHOOSE with it finishes the program as valid JSON without the model.
+    """
+    if kind.endswith("_or_null"):
+        return "null"
+    if kind.startswith("int_body:"):
+        return kind.split(":", 1)[1]
+    if kind.startswith("list_"):
+        return "]"
+    return {"str_start": '"', "str_body": '"', "int_start": "0", "digits": "0", "bool": "false"}[kind]
+
+def token_mask(tokenizer, kind: str, vocab_size: int, device) -> "torch.Tensor":
+    """
+    Boolean mask over the model vocabulary of tokens allowed for a CHOOSE kind.
+    """
+    import torch  # deferred like in llm.py; only constrained decoding needs it
+    masks: Dict[Tuple[str, int, str], "torch.Tensor"] = getattr(tokenizer, _MASKS_ATTR, None)
+    if masks is None:
+        masks = {}
+        setattr(tokenizer, _MASKS_ATTR, masks)
+    key = (kind, vocab_size, str(device))
+    mask = masks.get(key)
+    if mask is None:
+        mask = torch.zeros(vocab_size, dtype=torch.bool)
+        ids = [i for i, t in enumerate(token_texts(tokenizer)[:vocab_size]) if _allowed(kind, t)]
+        if ids:
+            mask[torch.tensor(ids)] = True
+        mask = mask.to(device)
+        masks[key] = mask
+    return mask
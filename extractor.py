@@ -1,9 +1,26 @@
 import json
-from typing import Any, Dict
+import re
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, NamedTuple, Optional, Tuple
 
-from llm import llm_generate
+import metrics
+from cache import ExtractionCache, cache_key
+from jsonstream import JsonEventParser, Path, iter_leaves
+from llm import llm_generate, llm_generate_batch, llm_generate_constrained, llm_generate_stream
+from rules import AMOUNT_RE, DATE_RE, EMAIL_RE, PHONE_RE, apply_rules
 from utils import blank_form_dict, parse_json_strict
 
+SYSTEM_PROMPT = (
+    "You are a strict information extractor for migrant intake.\n"
+    "Return ONLY a JSON object that matches the given category schema exactly.\n"
+    "Rules:\n"
+    "1) Keep the exact structure and keys under the ROOT key.\n"
+    "2) Use null when unknown; do not fabricate values.\n"
+    "3) Convert dates to YYYY-MM-DD when possible.\n"
+    "4) No extra keys. No commentary."
+)
+
 def category_schema(root_key: str) -> Dict[str, Any]:
     """
     Returns only the schema for the requested root key, e.g. {'employment': {...}}.
@@ -26,49 +43,542 @@ def _copy_known(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
             if val is not None:
                 dst[k] = val
 
-def extract_category(tokenizer, model, root_key: str, user_text: str) -> Dict[str, Any]:
+def reduced_schema(root_key: str, exclude: FrozenSet[str] = frozenset()) -> Dict[str, Any]:
     """
-    Runs a scoped extraction for a single category.
-    - tokenizer/model: loaded via llm.load_llm in app.py
-    - root_key: one of the top-level keys in the form schema (e.g., 'employment')
-    - user_text: free text pasted by user for that category
-    Returns a dict patch like {'employment': {...}} suitable for deep_merge.
+    category_schema without the fields in exclude (already filled by the fast path).
     """
     schema = category_schema(root_key)
-    if not schema:
-        # If the key is unknown, return an empty patch
-        return {}
+    if exclude and isinstance(schema.get(root_key), dict):
+        schema[root_key] = {k: v for k, v in schema[root_key].items() if k not in exclude}
+    return schema
 
-    system = {
-        "role": "system",
-        "content": (
-            "You are a strict information extractor for migrant intake.\n"
-            "Return ONLY a JSON object that matches the given category schema exactly.\n"
-            "Rules:\n"
-            "1) Keep the exact structure and keys under the ROOT key.\n"
-            "2) Use null when unknown; do not fabricate values.\n"
-            "3) Convert dates to YYYY-MM-DD when possible.\n"
-            "4) No extra keys. No commentary."
-        )
-    }
+def prompt_prefix(root_key: str, exclude: FrozenSet[str] = frozenset()) -> str:
+    """
+    The fixed start of the user message for a category (schema block up to USER TEXT).
+    It never changes per (root_key, exclude), so llm_generate can reuse its KV-cache.
+    """
+    schema = reduced_schema(root_key, exclude)
+    return f"ROOT SCHEMA:\n{json.dumps(schema, indent=2)}\n\nUSER TEXT:\n"
+
+def build_messages(root_key: str, user_text: str, exclude: FrozenSet[str] = frozenset()) -> List[Dict[str, str]]:
+    """
+    Chat messages for a scoped extraction of one category.
+    """
+    system = {"role": "system", "content": SYSTEM_PROMPT}
     user = {
         "role": "user",
-        "content": f"ROOT SCHEMA:\n{json.dumps(schema, indent=2)}\n\nUSER TEXT:\n{user_text}\n\nReturn JSON now."
+        "content": f"{prompt_prefix(root_key, exclude)}{user_text}\n\nReturn JSON now."
     }
+    return [system, user]
 
-    # Generate and parse
-    raw = llm_generate(tokenizer, model, [system, user], max_new_tokens=700, temperature=0.0)
-    parsed = parse_json_strict(raw) or {}
+def clean_patch(root_key: str, raw: str) -> Dict[str, Any]:
+    """
+    Parses raw model output and keeps only schema keys under root_key.
+    """
+    with metrics.timed("parse_json_strict"):
+        parsed = parse_json_strict(raw)
+    if parsed is None:
+        metrics.count("parse_failures")
+    parsed = parsed or {}
 
     # Start from a clean schema for this root
     clean = category_schema(root_key)
 
     # Only copy recognized keys
     if root_key in parsed and isinstance(parsed[root_key], dict) and isinstance(clean.get(root_key), dict):
-        _copy_known(clean[root_key], parsed[root_key])
+        with metrics.timed("copy_known"):
+            _copy_known(clean[root_key], parsed[root_key])
     elif root_key in parsed and isinstance(parsed[root_key], list) and isinstance(clean.get(root_key), list):
         # for list-rooted sections (if any in the future)
         clean[root_key] = parsed[root_key]
 
     # Defensive return: always a dict patch
     return clean if isinstance(clean, dict) else {}
+
+def _result_key(model, root_key: str, user_text: str, constrained: bool, fast_path: bool) -> str:
+    # speculative decoding returns the same tokens as greedy, so it isn't part of the key
+    model_id = getattr(model, "name_or_path", None) or getattr(getattr(model, "config", None), "_name_or_path", "")
+    params = {"max_new_tokens": 700, "temperature": 0.0, "constrained": constrained, "fast_path": fast_path,
+              "backend": getattr(model, "formease_backend", {}).get("backend")}
+    return cache_key(model_id, params, root_key, f"{SYSTEM_PROMPT}\n{user_text}")
+
+def _rule_values(root_key: str, user_text: str, fast_path: bool) -> Tuple[Dict[str, Any], bool]:
+    """
+    Fast-path values for root_key and whether any schema field is still left for the model.
+    """
+    values = apply_rules(root_key, user_text) if fast_path else {}
+    fields = category_schema(root_key).get(root_key)
+    remaining = not isinstance(fields, dict) or any(k not in values for k in fields)
+    return values, remaining
+
+def _finish(root_key: str, patch: Dict[str, Any], rule_values: Dict[str, Any],
+            provenance: Optional[Dict[str, str]], source: str = "model") -> Dict[str, Any]:
+    """
+    Overlays rule values on the patch and records which path produced each filled field.
+    """
+    body = patch.get(root_key)
+    if isinstance(body, dict):
+        body.update(rule_values)
+        if provenance is not None:
+            for k, v in body.items():
+                if v is not None and v != []:
+                    provenance[f"{root_key}.{k}"] = "rule" if k in rule_values else source
+    return patch
+
+# ---------- Long texts ----------
+# Texts longer than CHUNK_TOKENS are split on sentence boundaries into chunks of at most
+# that many tokens; chunks with no lexical cue for the category are dropped, the rest are
+# extracted as separate (batched) jobs and their patches merged field by field.
+CHUNK_TOKENS = 320
+MERGE_POLICIES = ("first", "frequent", "longest")
+MIN_RELEVANCE = 1.0
+
+CATEGORY_TERMS: Dict[str, str] = {
+    "basic_personal_info": r"name|born|birth|dob|age|gender|male|female|nationalit|citizen|passport|"
+                           r"id card|phone|mobile|cell|e-?mail|language|speak",
+    "address_and_permits": r"live|address|street|st\b|road|avenue|ave\b|apt|unit|city|province|state|postal|"
+                           r"zip|country|permit|visa|resident|status|expir|refugee|asylum",
+    "employment": r"work|job|employ|company|hired|started|salary|wage|earn|income|paid|pay|shift|position|"
+                  r"title|unemploy|boss|manager",
+    "housing": r"rent|lease|landlord|housing|apartment|flat|room|house|shelter|tenant|live|stay",
+    "dependents_information": r"child|son\b|sons\b|daughter|kid|wife|husband|spouse|mother|father|parent|"
+                              r"dependent|family|baby",
+    "financial_information": r"bank|account|income|expense|spend|saving|debt|loan|owe|money|budget|earn",
+    "education": r"school|universit|college|degree|diploma|bachelor|master|phd|certificat|studied|study|"
+                 r"graduat|educat|institut|course",
+    "skills": r"skill|speak|fluent|experience|certified|operat|driv|licen[cs]e|proficien|trained|good at",
+}
+# extra weak evidence per category: (pattern, weight)
+CATEGORY_SIGNALS: Dict[str, List[Tuple[Any, float]]] = {
+    "basic_personal_info": [(EMAIL_RE, 1.0), (PHONE_RE, 1.0), (DATE_RE, 0.5)],
+    "address_and_permits": [(DATE_RE, 0.5)],
+    "employment": [(AMOUNT_RE, 0.5), (DATE_RE, 0.5)],
+    "housing": [(AMOUNT_RE, 0.5), (DATE_RE, 0.5)],
+    "dependents_information": [(DATE_RE, 0.5)],
+    "financial_information": [(AMOUNT_RE, 1.0)],
+    "education": [(DATE_RE, 0.5)],
+}
+_TERM_RES = {k: re.compile(rf"\b(?:{v})", re.IGNORECASE) for k, v in CATEGORY_TERMS.items()}
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+|\s*\n\s*")
+# list fields whose length a count field must cover after merging
+_COUNT_FIELDS = {"dependents_information": ("number_of_dependents", "dependents")}
+
+class Chunk(NamedTuple):
+    start: int
+    end: int
+    text: str
+    score: float
+
+def relevance(root_key: str, text: str) -> float:
+    """
+    Cheap lexical relevance of text to a category: distinct cue words plus weighted signals
+    (emails, phones, dates, amounts).
+    """
+    term_re = _TERM_RES.get(root_key)
+    score = float(len({m.lower() for m in term_re.findall(text)})) if term_re else 0.0
+    for pattern, weight in CATEGORY_SIGNALS.get(root_key, ()):
+        if pattern.search(text):
+            score += weight
+    return score
+
+def _token_len(tokenizer, text: str) -> int:
+    return len(tokenizer.encode(text))
+
+def _sentence_spans(text: str) -> List[Tuple[int, int]]:
+    spans, start = [], 0
+    for m in _SENTENCE_BREAK.finditer(text):
+        if m.start() > start:
+            spans.append((start, m.start()))
+        start = m.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+def _split_long(text: str, start: int, end: int, n_parts: int) -> List[Tuple[int, int]]:
+    # a sentence over budget is cut at word boundaries into n_parts similar pieces
+    words = [m.span() for m in re.finditer(r"\S+", text[start:end])]
+    per = max(1, -(-len(words) // n_parts))
+    return [(start + words[i][0], start + words[min(i + per, len(words)) - 1][1])
+            for i in range(0, len(words), per)]
+
+def split_chunks(tokenizer, text: str, max_tokens: int = CHUNK_TOKENS) -> List[Tuple[int, int]]:
+    """
+    (start, end) character spans of consecutive chunks of text, each at most about
+    max_tokens tokens and ending on a sentence boundary where possible.
+    """
+    pieces: List[Tuple[int, int, int]] = []
+    for s, e in _sentence_spans(text):
+        n = _token_len(tokenizer, text[s:e])
+        if n > max_tokens:
+            for ps, pe in _split_long(text, s, e, -(-n // max_tokens)):
+                pieces.append((ps, pe, _token_len(tokenizer, text[ps:pe])))
+        else:
+            pieces.append((s, e, n))
+    chunks: List[Tuple[int, int]] = []
+    cur_start, cur_end, used = None, None, 0
+    for s, e, n in pieces:
+        if cur_start is not None and used + n > max_tokens:
+            chunks.append((cur_start, cur_end))
+            cur_start, used = None, 0
+        if cur_start is None:
+            cur_start = s
+        cur_end, used = e, used + n
+    if cur_start is not None:
+        chunks.append((cur_start, cur_end))
+    return chunks
+
+def relevant_chunks(tokenizer, root_key: str, user_text: str,
+                    max_tokens: int = CHUNK_TOKENS) -> List[Chunk]:
+    """
+    The chunks of user_text worth extracting for root_key, in text order. A text within
+    max_tokens comes back whole; otherwise chunks scoring under MIN_RELEVANCE are dropped
+    (keeping at least the best one).
+    """
+    with metrics.timed("chunking"):
+        if _token_len(tokenizer, user_text) <= max_tokens:
+            return [Chunk(0, len(user_text), user_text, relevance(root_key, user_text))]
+        chunks = [Chunk(s, e, user_text[s:e], relevance(root_key, user_text[s:e]))
+                  for s, e in split_chunks(tokenizer, user_text, max_tokens)]
+        kept = [c for c in chunks if c.score >= MIN_RELEVANCE] or [max(chunks, key=lambda c: c.score)]
+    metrics.count("chunks_total", len(chunks))
+    metrics.count("chunks_dropped", len(chunks) - len(kept))
+    return kept
+
+def _pick(values: List[Tuple[int, Any]], policy: str) -> Tuple[int, Any]:
+    if policy == "frequent":
+        counts = Counter(json.dumps(v, sort_keys=True, default=str) for _, v in values)
+        return max(values, key=lambda iv: counts[json.dumps(iv[1], sort_keys=True, default=str)])
+    if policy == "longest":
+        return max(values, key=lambda iv: len(str(iv[1])))
+    return values[0]
+
+def merge_patches(root_key: str, patches: List[Dict[str, Any]],
+                  policy: str = "first") -> Tuple[Dict[str, Any], Dict[str, int]]:
+    """
+    Merges per-chunk patches (in text order) into one patch for root_key.
+    - policy: for scalar fields, "first" non-null value, most "frequent" value, or the
+      "longest" one; ties go to the earliest chunk
+    List fields (dependents, education items, skills) are concatenated without duplicates.
+    Returns (patch, {field: index of the patch the value came from}).
+    """
+    if policy not in MERGE_POLICIES:
+        raise ValueError(f"Unknown merge policy {policy!r}; expected one of {MERGE_POLICIES}")
+    merged = category_schema(root_key)
+    body = merged.get(root_key)
+    origin: Dict[str, int] = {}
+    if not isinstance(body, dict):
+        return merged, origin
+    for field in body:
+        values = [(i, p[root_key][field]) for i, p in enumerate(patches)
+                  if isinstance(p.get(root_key), dict) and p[root_key].get(field) not in (None, [])]
+        if not values:
+            continue
+        if isinstance(body[field], list):
+            items, seen = [], set()
+            for _, v in values:
+                for item in v if isinstance(v, list) else [v]:
+                    k = json.dumps(item, sort_keys=True, default=str)
+                    if k not in seen:
+                        seen.add(k)
+                        items.append(item)
+            body[field], origin[field] = items, values[0][0]
+        else:
+            origin[field], body[field] = _pick(values, policy)
+    count_field, list_field = _COUNT_FIELDS.get(root_key, (None, None))
+    if count_field and isinstance(body.get(count_field), int) and len(body.get(list_field) or []) > body[count_field]:
+        body[count_field] = len(body[list_field])
+    return merged, origin
+
+def _merge_chunk_results(root_key: str, chunks: List[Chunk], patches: List[Dict[str, Any]],
+                         chunk_prov: List[Dict[str, str]], policy: str,
+                         provenance: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    merged, origin = merge_patches(root_key, patches, policy)
+    if provenance is not None:
+        for field, i in origin.items():
+            path = f"{root_key}.{field}"
+            provenance[path] = f"{chunk_prov[i].get(path, 'model')}@{chunks[i].start}:{chunks[i].end}"
+    return merged
+
+def _sum_stats(parts: List[Dict[str, float]]) -> Dict[str, float]:
+    # speculative stats of several chunks as one run: counts and seconds add up, rates
+    # are recomputed from the totals
+    parts = [p for p in parts if p]
+    if not parts:
+        return {}
+    total = {k: sum(p.get(k, 0) for p in parts)
+             for k in ("new_tokens", "drafted", "accepted", "forward_passes", "seconds")}
+    total["acceptance_rate"] = total["accepted"] / total["drafted"] if total["drafted"] else 0.0
+    total["tokens_per_sec"] = total["new_tokens"] / total["seconds"] if total["seconds"] > 0 else 0.0
+    return total
+
+def _extract_chunked(tokenizer, model, jobs: List[Tuple[str, str]], plans: List[List[Chunk]],
+                     merge_policy: str, stats: Optional[List[Dict[str, float]]],
+                     provenance: Optional[List[Dict[str, str]]], **kwargs) -> List[Dict[str, Any]]:
+    """
+    extract_many over the chunks of every job (plans[i] from relevant_chunks), so chunks of
+    all jobs share batches; the chunk patches are then merged back into one patch per job.
+    """
+    flat, groups = [], []
+    for (k, _), chunks in zip(jobs, plans):
+        groups.append(range(len(flat), len(flat) + len(chunks)))
+        flat.extend((k, c.text) for c in chunks)
+    flat_prov: List[Dict[str, str]] = [{} for _ in flat]
+    flat_stats = [{} for _ in flat] if stats is not None else None
+    flat_patches = extract_many(tokenizer, model, flat, stats=flat_stats, provenance=flat_prov,
+                                chunk_tokens=0, **kwargs)
+    patches = []
+    for i, ((k, t), chunks, g) in enumerate(zip(jobs, plans, groups)):
+        if stats is not None:
+            stats[i].update(_sum_stats([flat_stats[j] for j in g]))
+        prov = provenance[i] if provenance is not None else None
+        if len(chunks) == 1 and chunks[0].text == t:
+            patches.append(flat_patches[g[0]])
+            if prov is not None:
+                prov.update(flat_prov[g[0]])
+        else:
+            patches.append(_merge_chunk_results(k, chunks, [flat_patches[j] for j in g],
+                                                [flat_prov[j] for j in g], merge_policy, prov))
+    return patches
+
+def extract_category(tokenizer, model, root_key: str, user_text: str, constrained: bool = False,
+                     speculative: bool = False, stats: Optional[Dict[str, float]] = None,
+                     cache: Optional[ExtractionCache] = None, scheduler=None, fast_path: bool = False,
+                     provenance: Optional[Dict[str, str]] = None, chunk_tokens: int = CHUNK_TOKENS,
+                     merge_policy: str = "first") -> Dict[str, Any]:
+    """
+    Runs a scoped extraction for a single category.
+    - tokenizer/model: loaded via llm.load_llm in app.py
+    - root_key: one of the top-level keys in the form schema (e.g., 'employment')
+    - user_text: free text pasted by user for that category
+    - constrained: decode under the compiled schema instead of free-form generation
+    - speculative: prompt-lookup speculative decoding (ignored when constrained);
+      stats receives its acceptance rate and tokens/sec (over all chunks of a long text)
+    - cache: optional ExtractionCache; repeated texts are answered without the model
+    - scheduler: optional llm.SchedulerSession; the model is then only touched by the
+      shared inference worker
+    - fast_path: fill rule-readable fields first (rules.py) and ask the model only for
+      the rest, skipping it when nothing is left; provenance receives
+      {"root.field": "rule" | "model" | "cache"} for every filled field
+    - chunk_tokens: texts longer than this many tokens are split into chunks and only the
+      chunks relevant to root_key are extracted (0 turns this off); fields from a chunk
+      get "@start:end" (its character span) appended to their provenance
+    - merge_policy: how chunk patches are merged, one of MERGE_POLICIES (see merge_patches)
+    Returns a dict patch like {'employment': {...}} suitable for deep_merge.
+    """
+    if not category_schema(root_key):
+        # If the key is unknown, return an empty patch
+        return {}
+    if chunk_tokens:
+        chunks = relevant_chunks(tokenizer, root_key, user_text, chunk_tokens)
+        if len(chunks) > 1 or chunks[0].text != user_text:
+            return _extract_chunked(tokenizer, model, [(root_key, user_text)], [chunks], merge_policy,
+                                    [stats] if stats is not None else None,
+                                    [provenance] if provenance is not None else None,
+                                    constrained=constrained, speculative=speculative, cache=cache,
+                                    scheduler=scheduler, fast_path=fast_path)[0]
+    if cache is not None:
+        key = _result_key(model, root_key, user_text, constrained, fast_path)
+        hit = cache.get(key)
+        if hit is not None:
+            return _finish(root_key, hit, {}, provenance, source="cache")
+        patch = extract_category(tokenizer, model, root_key, user_text, constrained, speculative, stats,
+                                 scheduler=scheduler, fast_path=fast_path, provenance=provenance,
+                                 chunk_tokens=0)
+        cache.put(key, patch)
+        return patch
+
+    rule_values, remaining = _rule_values(root_key, user_text, fast_path)
+    if not remaining:
+        return _finish(root_key, category_schema(root_key), rule_values, provenance)
+
+    # Generate and parse
+    exclude = frozenset(rule_values)
+    messages = build_messages(root_key, user_text, exclude)
+    prefix = prompt_prefix(root_key, exclude)
+    if constrained:
+        def run(tok, mdl) -> str:
+            return llm_generate_constrained(tok, mdl, messages, root_key, max_new_tokens=700,
+                                            temperature=0.0, cache_prefix=prefix, exclude_fields=exclude)
+    else:
+        def run(tok, mdl) -> str:
+            return llm_generate(tok, mdl, messages, max_new_tokens=700, temperature=0.0,
+                                cache_prefix=prefix, speculative=speculative, stats=stats)
+    if scheduler is None:
+        raw = run(tokenizer, model)
+    elif constrained or speculative:
+        raw = scheduler.run(run)
+    else:
+        raw = scheduler.generate(messages, max_new_tokens=700, cache_prefix=prefix)
+    return _finish(root_key, clean_patch(root_key, raw), rule_values, provenance)
+
+def extract_category_stream(tokenizer, model, root_key: str, user_text: str,
+                            cache: Optional[ExtractionCache] = None, scheduler=None, fast_path: bool = False,
+                            provenance: Optional[Dict[str, str]] = None,
+                            cancel: Optional[threading.Event] = None,
+                            chunk_tokens: int = CHUNK_TOKENS,
+                            progress: Optional[Callable[[int], None]] = None) -> Iterator[Tuple[Optional[Path], Any]]:
+    """
+    Streaming extract_category (free-form greedy decoding only).
+    Yields (path, value) as each field completes, path being a tuple under root_key such as
+    ('employment', 'job_title') or ('dependents_information', 'dependents', 0, 'name');
+    cached and rule-filled fields come first. Ends with (None, patch), the same patch
+    extract_category would return.
+    - cancel: threading.Event; setting it stops decoding and the final patch holds the
+      fields parsed so far (such a partial result is not cached)
+    - chunk_tokens: a longer text is reduced to its chunks relevant to root_key, which are
+      then decoded as one stream
+    - progress: called with the number of pieces decoded so far after every piece, also
+      while no field is completing (nulls, a runaway string); it runs in the consumer's
+      thread between yields
+    Other parameters as in extract_category.
+    """
+    if not category_schema(root_key):
+        yield None, {}
+        return
+    if chunk_tokens:
+        user_text = "\n".join(c.text for c in relevant_chunks(tokenizer, root_key, user_text, chunk_tokens))
+    key = _result_key(model, root_key, user_text, False, fast_path) if cache is not None else None
+    hit = cache.get(key) if cache is not None else None
+    if hit is not None:
+        patch = _finish(root_key, hit, {}, provenance, source="cache")
+        yield from iter_leaves(patch)
+        yield None, patch
+        return
+
+    rule_values, remaining = _rule_values(root_key, user_text, fast_path)
+    yield from iter_leaves({root_key: rule_values})
+    if not remaining:
+        patch = _finish(root_key, category_schema(root_key), rule_values, provenance)
+        if cache is not None:
+            cache.put(key, patch)
+        yield None, patch
+        return
+
+    exclude = frozenset(rule_values)
+    fields = set(reduced_schema(root_key, exclude)[root_key])
+    messages = build_messages(root_key, user_text, exclude)
+    prefix = prompt_prefix(root_key, exclude)
+    if scheduler is None:
+        pieces = llm_generate_stream(tokenizer, model, messages, max_new_tokens=700, cache_prefix=prefix,
+                                     cancel=cancel)
+    else:
+        pieces = scheduler.stream(messages, max_new_tokens=700, cache_prefix=prefix, cancel=cancel)
+    parser = JsonEventParser()
+    raw: List[str] = []
+    try:
+        for piece in pieces:
+            raw.append(piece)
+            if progress is not None:
+                progress(len(raw))
+            for path, value in parser.feed(piece):
+                if value is not None and len(path) > 1 and path[0] == root_key and path[1] in fields:
+                    yield path, value
+            if parser.done:
+                break  # anything after the root object is discarded anyway
+    finally:
+        pieces.close()
+    cancelled = cancel is not None and cancel.is_set() and not parser.done
+    text = "".join(raw)
+    if cancelled or parse_json_strict(text) is None:
+        text = json.dumps(parser.value)
+    patch = _finish(root_key, clean_patch(root_key, text), rule_values, provenance)
+    if cache is not None and not cancelled:
+        cache.put(key, patch)
+    yield None, patch
+
+def extract_many(tokenizer, model, jobs: List[Tuple[str, str]], batch_size: int = 8,
+                 constrained: bool = False, speculative: bool = False,
+                 stats: Optional[List[Dict[str, float]]] = None,
+                 cache: Optional[ExtractionCache] = None, scheduler=None, fast_path: bool = False,
+                 provenance: Optional[List[Dict[str, str]]] = None, chunk_tokens: int = CHUNK_TOKENS,
+                 merge_policy: str = "first") -> List[Dict[str, Any]]:
+    """
+    Extracts a list of (root_key, user_text) jobs, which may repeat a root_key (e.g.
+    several records in a bulk run). Returns one patch per job, in order.
+    - batch_size: max prompts per model.generate call
+    - constrained/speculative: as in extract_category; these run job by job, not
+      batched, and stats (a list aligned with jobs) receives the speculative stats
+    - cache: optional ExtractionCache; only cache misses reach the model
+    - scheduler: optional llm.SchedulerSession; misses are queued together so the
+      shared worker can batch them with other sessions' requests
+    - fast_path/provenance: as in extract_category (provenance is a list aligned with jobs)
+    - chunk_tokens/merge_policy: as in extract_category; the relevant chunks of all jobs
+      are extracted together
+    """
+    if chunk_tokens:
+        plans = [relevant_chunks(tokenizer, k, t, chunk_tokens) if category_schema(k) else [Chunk(0, len(t), t, 0.0)]
+                 for k, t in jobs]
+        if any(len(p) > 1 or p[0].text != t for p, (_, t) in zip(plans, jobs)):
+            return _extract_chunked(tokenizer, model, jobs, plans, merge_policy, stats, provenance,
+                                    batch_size=batch_size, constrained=constrained, speculative=speculative,
+                                    cache=cache, scheduler=scheduler, fast_path=fast_path)
+    if constrained or speculative:
+        return [
+            extract_category(tokenizer, model, k, t, constrained=constrained, speculative=speculative,
+                             stats=stats[i] if stats is not None else None, cache=cache, scheduler=scheduler,
+                             fast_path=fast_path, provenance=provenance[i] if provenance is not None else None,
+                             chunk_tokens=0)
+            for i, (k, t) in enumerate(jobs)
+        ]
+    patches: List[Optional[Dict[str, Any]]] = [None] * len(jobs)
+    rule_values: Dict[int, Dict[str, Any]] = {}
+    todo = []
+    for i, (k, t) in enumerate(jobs):
+        prov = provenance[i] if provenance is not None else None
+        if not category_schema(k):
+            patches[i] = {}
+            continue
+        hit = cache.get(_result_key(model, k, t, constrained, fast_path)) if cache is not None else None
+        if hit is not None:
+            patches[i] = _finish(k, hit, {}, prov, source="cache")
+            continue
+        rule_values[i], remaining = _rule_values(k, t, fast_path)
+        if remaining:
+            todo.append(i)
+        else:
+            patches[i] = _finish(k, category_schema(k), rule_values[i], prov)
+            if cache is not None:
+                cache.put(_result_key(model, k, t, constrained, fast_path), patches[i])
+    # the scheduler does its own batching, so hand it everything at once
+    step = (len(todo) or 1) if scheduler is not None else max(1, int(batch_size))
+    for s in range(0, len(todo), step):
+        chunk = todo[s:s + step]
+        messages_batch = [build_messages(*jobs[i], frozenset(rule_values[i])) for i in chunk]
+        if scheduler is not None:
+            raws = scheduler.generate_many(messages_batch, max_new_tokens=700)
+        else:
+            raws = llm_generate_batch(tokenizer, model, messages_batch, max_new_tokens=700, temperature=0.0)
+        for i, raw in zip(chunk, raws):
+            k, t = jobs[i]
+            prov = provenance[i] if provenance is not None else None
+            patches[i] = _finish(k, clean_patch(k, raw), rule_values[i], prov)
+            if cache is not None:
+                cache.put(_result_key(model, k, t, constrained, fast_path), patches[i])
+    return patches
+
+def extract_categories(tokenizer, model, texts: Dict[str, str], batch_size: int = 8,
+                       constrained: bool = False, speculative: bool = False,
+                       stats: Optional[Dict[str, Dict[str, float]]] = None,
+                       cache: Optional[ExtractionCache] = None, scheduler=None, fast_path: bool = False,
+                       provenance: Optional[Dict[str, str]] = None, chunk_tokens: int = CHUNK_TOKENS,
+                       merge_policy: str = "first") -> Dict[str, Dict[str, Any]]:
+    """
+    Batched extraction over several categories at once.
+    - texts: {root_key: user_text}; empty texts and unknown keys are skipped
+    - batch_size, constrained, speculative, cache, scheduler, fast_path, chunk_tokens,
+      merge_policy: see extract_many
+    - stats: receives {root_key: speculative stats}
+    - provenance: receives {"root.field": source} across all categories
+    Returns {root_key: patch} with one patch per category, each suitable for deep_merge.
+    """
+    jobs = [
+        (k, t.strip()) for k, t in texts.items()
+        if isinstance(t, str) and t.strip() and category_schema(k)
+    ]
+    job_stats = [stats.setdefault(k, {}) for k, _ in jobs] if stats is not None else None
+    job_prov = [provenance] * len(jobs) if provenance is not None else None
+    patches = extract_many(tokenizer, model, jobs, batch_size=batch_size, constrained=constrained,
+                           speculative=speculative, stats=job_stats, cache=cache, scheduler=scheduler,
+                           fast_path=fast_path, provenance=job_prov, chunk_tokens=chunk_tokens,
+                           merge_policy=merge_policy)
+    return {k: p for (k, _), p in zip(jobs, patches)}
@@ -0,0 +1,176 @@
+"""
+Incremental JSON parsing for streamed model output.
+
+JsonEventParser is fed text pieces as they are decoded and returns (path, value) events
+for every scalar value that has completed, e.g. (("employment", "job_title"), "cook") or
+(("dependents_information", "dependents", 0, "name"), "Musa"). Text before the first "{"
+(prose, code fences) is skipped and parsing stops once the root object closes.
+"""
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+
+Path = Tuple[Any, ...]
+Event = Tuple[Path, Any]
+
+_SEEK, _KEY, _COLON, _VALUE, _ARRAY_START, _STRING, _KEY_STRING, _LITERAL, _AFTER, _DONE = range(10)
+_WS = " \t\r\n"
+_LITERAL_CHARS = frozenset("0123456789+-.eEtruefalsn")
+
+class JsonEventParser:
+    """
+    Character-level parser over a growing JSON text. `value` holds everything parsed so
+    far (completed scalars only) and `done` turns true when the root object closes.
+    """
+
+    def __init__(self):
+        self.value: Dict[str, Any] = {}
+        self.done = False
+        self._state = _SEEK
+        self._frames: List[list] = []   # [container, key-or-index] per open container
+        self._buf: List[str] = []
+        self._escaped = False
+
+    def _path(self) -> Path:
+        return tuple(f[1] for f in self._frames)
+
+    def _emit(self, value: Any, events: List[Event]) -> None:
+        container, key = self._frames[-1]
+        if isinstance(container, list):
+            container.append(value)
+        else:
+            container[key] = value
+        events.append((self._path(), value))
+        self._state = _AFTER
+
+    def _open(self, container) -> None:
+        if self._frames:
+            parent, key = self._frames[-1]
+            if isinstance(parent, list):
+                parent.append(container)
+            else:
+                parent[key] = container
+        self._frames.append([container, 0 if isinstance(container, list) else None])
+        self._state = _ARRAY_START if isinstance(container, list) else _KEY
+
+    def _close(self) -> None:
+        self._frames.pop()
+        self._state = _DONE if not self._frames else _AFTER
+        self.done = not self._frames
+
+    def feed(self, text: str) -> List[Event]:
+        """Consumes text and returns the events it completed, in order."""
+        events: List[Event] = []
+        i, n = 0, len(text)
+        while i < n and self._state != _DONE:
+            c = text[i]
+            state = self._state
+            if state == _STRING or state == _KEY_STRING:
+                if self._escaped:
+                    self._escaped = False
+                    self._buf.append(c)
+                elif c == "\\":
+                    self._escaped = True
+                    self._buf.append(c)
+                elif c == '"':
+                    try:
+                        s = json.loads('"' + "".join(self._buf) + '"')
+                    except ValueError:
+                        s = "".join(self._buf)
+                    self._buf = []
+                    if state == _KEY_STRING:
+                        self._frames[-1][1] = s
+                        self._state = _COLON
+                    else:
+                        self._emit(s, events)
+                else:
+                    self._buf.append(c)
+            elif state == _LITERAL:
+                if c in _LITERAL_CHARS:
+                    self._buf.append(c)
+                else:
+                    raw = "".join(self._buf)
+                    self._buf = []
+                    try:
+                        self._emit(json.loads(raw), events)
+                    except ValueError:
+                        self._state = _AFTER
+                    continue  # re-read c as the character after the literal
+            elif c in _WS:
+                pass
+            elif state == _SEEK:
+                if c == "{":
+                    self._open(self.value)
+            elif state == _KEY:
+                if c == '"':
+                    self._state = _KEY_STRING
+                elif c == "}":
+                    self._close()
+            elif state == _COLON:
+                if c == ":":
+                    self._state = _VALUE
+            elif state == _ARRAY_START and c == "]":
+                self._close()
+            elif state == _VALUE or state == _ARRAY_START:
+                if c == '"':
+                    self._state = _STRING
+                elif c == "{":
+                    self._open({})
+                elif c == "[":
+                    self._open([])
+                elif c in _LITERAL_CHARS:
+                    self._buf = [c]
+                    self._state = _LITERAL
+            elif state == _AFTER:
+                if c == ",":
+                    frame = self._frames[-1]
+                    if isinstance(frame[0], list):
+                        frame[1] += 1
+                        self._state = _VALUE
+                    else:
+                        self._state = _KEY
+                elif c in "}]":
+                    self._close()
+            i += 1
+        return events
+
+def iter_leaves(obj: Any, prefix: Path = ()) -> Iterator[Event]:
+    """(path, value) for every non-null scalar in obj, in the same shape the parser emits."""
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from iter_leaves(v, prefix + (k,))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            yield from iter_leaves(v, prefix + (i,))
+    elif obj is not None:
+        yield prefix, obj
+
+def set_path(target: Dict[str, Any], path: Path, value: Any) -> None:
+    """
+    Writes value at path, creating dicts/lists on the way (list indices may extend a list
+    by one). Paths that clash with existing non-container values are ignored.
+    """
+    cur: Any = target
+    for key, nxt in zip(path, path[1:]):
+        child_type = list if isinstance(nxt, int) else dict
+        if isinstance(cur, list):
+            if key == len(cur):
+                cur.append(child_type())
+            elif not 0 <= key < len(cur):
+                return
+            if cur[key] is None:
+                cur[key] = child_type()
+            cur = cur[key]
+        elif isinstance(cur, dict):
+            if not isinstance(cur.get(key), (dict, list)):
+                cur[key] = child_type()
+            cur = cur[key]
+        else:
+            return
+    last = path[-1]
+    if isinstance(cur, list):
+        if last == len(cur):
+            cur.append(value)
+        elif 0 <= last < len(cur):
+            cur[last] = value
+    elif isinstance(cur, dict):
+        cur[last] = value
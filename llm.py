@@ -1,31 +1,867 @@
-import torch
+import copy
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, FrozenSet, Iterator, List, Optional, Union
+
 import streamlit as st
-from transformers import AutoTokenizer, AutoModelForCausalLM
 
-@st.cache_resource
-def load_llm(model_id: str = "Qwen/Qwen2.5-0.5B-Instruct"):
-    tokenizer = AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
-    dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-    model = AutoModelForCausalLM.from_pretrained(
-        model_id,
-        torch_dtype=dtype,
-        device_map="auto",
-        trust_remote_code=True,
-    )
+import metrics
+
+from constrained import FORCE, close_choice, root_program, token_mask, token_texts
+
+# ---------- Heavy imports ----------
+# torch/transformers take seconds to import, so they're loaded on first use (normally by
+# ModelLoader's thread) instead of when app.py imports this module.
+torch = None
+transformers = None
+_IMPORT_LOCK = threading.Lock()
+
+def _heavy():
+    global torch, transformers
+    if torch is None:
+        with _IMPORT_LOCK:
+            if torch is None:
+                import transformers as _transformers
+                import torch as _torch
+                transformers = _transformers
+                torch = _torch
+    return torch
+
+# ---------- Backends ----------
+# eager: float32 on CPU (float16 on GPU), the reference. bf16: bfloat16 weights on CPU.
+# int8: dynamically-quantized nn.Linear layers. compile: torch.compile'd forward.
+BACKENDS = ("eager", "bf16", "int8", "compile")
+SELF_CHECK_PROMPT = [
+    {"role": "system", "content": "You are a strict information extractor for migrant intake."},
+    {"role": "user", "content": 'ROOT SCHEMA:\n{"employment": {"employer_name": null}}\n\n'
+                                "USER TEXT:\nI work at Maple Foods.\n\nReturn JSON now."},
+]
+# Share of teacher-forced next-token picks that must agree with eager for a backend to pass
+SELF_CHECK_MIN_AGREEMENT = 0.9
+
+def _apply_backend(model, backend: str):
+    if backend == "bf16":
+        return model.to(torch.bfloat16)
+    if backend == "int8":
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "compile":
+        model.forward = torch.compile(model.forward, dynamic=True)
+    return model
+
+def _next_token_picks(tokenizer, model, input_ids):
+    with torch.inference_mode():
+        return model(input_ids).logits[0].float().argmax(dim=-1)
+
+def backend_self_check(tokenizer, model, reference) -> Dict[str, float]:
+    """
+    Compares greedy next-token picks over SELF_CHECK_PROMPT with reference (eager) picks.
+    """
+    _heavy()
+    _, input_ids = _encode_prompt(tokenizer, model, SELF_CHECK_PROMPT)
+    picks = _next_token_picks(tokenizer, model, input_ids)
+    agreement = float((picks == reference).float().mean())
+    return {"agreement": agreement, "passed": agreement >= SELF_CHECK_MIN_AGREEMENT}
+
+def _from_pretrained(model_id: str, dtype):
+    # safetensors are memory-mapped and copied tensor by tensor into the final dtype, so
+    # peak RAM stays near one copy of the weights; older checkpoints fall back to .bin
+    kwargs = dict(torch_dtype=dtype, device_map="auto", trust_remote_code=True, low_cpu_mem_usage=True)
+    try:
+        model = transformers.AutoModelForCausalLM.from_pretrained(model_id, use_safetensors=True, **kwargs)
+    except OSError:
+        model = transformers.AutoModelForCausalLM.from_pretrained(model_id, **kwargs)
     model.eval()
+    return model
+
+@metrics.instrument("load_llm")
+def load_model(model_id: str = "Qwen/Qwen2.5-0.5B-Instruct", backend: str = "eager"):
+    """
+    Uncached load_llm (what ModelLoader runs in the background).
+    backend: one of BACKENDS. Non-eager backends are checked against the eager model on
+    a fixture prompt; on failure the eager model is kept. model.formease_backend records
+    the backend in use, load time and the self-check result.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+    t0 = time.perf_counter()
+    _heavy()
+    tokenizer = transformers.AutoTokenizer.from_pretrained(model_id, trust_remote_code=True)
+    dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    model = _from_pretrained(model_id, dtype)
+    info = {"backend": "eager", "requested": backend}
+    if backend != "eager":
+        _, input_ids = _encode_prompt(tokenizer, model, SELF_CHECK_PROMPT)
+        reference = _next_token_picks(tokenizer, model, input_ids)
+        candidate = _apply_backend(model, backend)
+        check = backend_self_check(tokenizer, candidate, reference)
+        info["self_check"] = check
+        if check["passed"]:
+            model, info["backend"] = candidate, backend
+        elif backend == "compile":
+            del model.forward  # drop the compiled instance attribute, back to the class forward
+        elif backend == "bf16":
+            # the cast was in place and lossy, so the eager weights have to be reloaded
+            model = _from_pretrained(model_id, dtype)
+        # int8 quantizes a copy, so the eager model is still intact
+    info["load_s"] = time.perf_counter() - t0
+    model.formease_backend = info
+    # Prefix KV-caches belong to this model instance; a new model_id starts empty
+    clear_prefix_cache(model)
     return tokenizer, model
 
-def llm_generate(tokenizer, model, messages, max_new_tokens=640, temperature=0.0, top_p=0.9) -> str:
-    input_ids = tokenizer.apply_chat_template(
-        messages, tokenize=True, add_generation_prompt=True, return_tensors="pt"
-    ).to(model.device)
+load_llm = st.cache_resource(load_model)
+
+def warm_up(tokenizer, model, messages=None, max_new_tokens: int = 8) -> float:
+    """
+    One short greedy generate so the first real request doesn't pay one-time costs
+    (chat template compilation, allocator growth, kernel selection, torch.compile).
+    Returns its wall time in seconds.
+    """
+    t0 = time.perf_counter()
+    llm_generate(tokenizer, model, messages or SELF_CHECK_PROMPT, max_new_tokens=max_new_tokens)
+    return time.perf_counter() - t0
+
+class ModelLoader:
+    """
+    Loads (tokenizer, model) on a background thread, then warms it up, so a UI can render
+    while the weights load. state goes loading -> warming -> ready (or failed).
+    timings: import_s, load_s, warmup_s and ready_s (seconds since the loader started).
+    """
+
+    def __init__(self, model_id: str, backend: str = "eager", warmup: bool = True, warmup_messages=None):
+        self.model_id, self.backend = model_id, backend
+        self.state = "loading"
+        self.error: Optional[BaseException] = None
+        self.timings: Dict[str, float] = {}
+        self._warmup, self._warmup_messages = warmup, warmup_messages
+        self._result = None
+        self._done = threading.Event()
+        self._t0 = time.perf_counter()
+        self.ready_at: Optional[float] = None  # perf_counter() when the model became ready
+        self._thread = threading.Thread(target=self._run, name="formease-model-load", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            t = time.perf_counter()
+            _heavy()
+            self.timings["import_s"] = time.perf_counter() - t
+            t = time.perf_counter()
+            tokenizer, model = load_model(self.model_id, self.backend)
+            self.timings["load_s"] = time.perf_counter() - t
+            if self._warmup:
+                self.state = "warming"
+                self.timings["warmup_s"] = warm_up(tokenizer, model, self._warmup_messages)
+            self._result = (tokenizer, model)
+            self.ready_at = time.perf_counter()
+            self.state = "ready"
+        except Exception as e:
+            self.error = e
+            self.state = "failed"
+        finally:
+            self.timings["ready_s"] = time.perf_counter() - self._t0
+            self._done.set()
+
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def wait(self, timeout: Optional[float] = None):
+        """(tokenizer, model) once loaded; re-raises a load failure, TimeoutError if not done in time."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Model is still loading.")
+        if self.error is not None:
+            raise self.error
+        return self._result
+
+# ---------- Prefix KV-cache ----------
+# past_key_values for fixed prompt prefixes (system message + schema block), keyed by
+# the templated prefix text and stored on the model so they die with it.
+PREFIX_CACHE_MAX_ENTRIES = 32
+_PREFIX_ATTR = "_formease_prefix_kv"
+_PREFIX_LOCK = threading.Lock()
+
+def clear_prefix_cache(model) -> None:
+    with _PREFIX_LOCK:
+        setattr(model, _PREFIX_ATTR, {})
+
+def _prefix_store(model) -> Dict[str, tuple]:
+    store = getattr(model, _PREFIX_ATTR, None)
+    if store is None:
+        store = {}
+        setattr(model, _PREFIX_ATTR, store)
+    return store
+
+def _prefix_past(tokenizer, model, prompt: str, input_ids, cache_prefix: str):
+    """
+    Returns a private copy of the cached past_key_values for the part of prompt that
+    ends with cache_prefix, or None when the prefix can't be reused token-for-token.
+    """
+    _heavy()
+    cut = prompt.find(cache_prefix)
+    if cut < 0:
+        return None
+    prefix_text = prompt[: cut + len(cache_prefix)]
+    with _PREFIX_LOCK:
+        store = _prefix_store(model)
+        entry = store.get(prefix_text)
+    if entry is None:
+        prefix_ids = tokenizer(prefix_text, return_tensors="pt", add_special_tokens=False).input_ids.to(model.device)
+        with torch.inference_mode():
+            past = model(prefix_ids, use_cache=True).past_key_values
+        entry = (prefix_ids, past)
+        with _PREFIX_LOCK:
+            store = _prefix_store(model)
+            if len(store) >= PREFIX_CACHE_MAX_ENTRIES:
+                store.pop(next(iter(store)))
+            store[prefix_text] = entry
+    prefix_ids, past = entry
+    n = prefix_ids.shape[-1]
+    # BPE may merge across the boundary; only reuse when the full prompt starts with the same ids
+    if n >= input_ids.shape[-1] or not torch.equal(input_ids[0, :n], prefix_ids[0]):
+        return None
+    with torch.inference_mode():
+        # generate() extends the cache in place, so hand it a copy
+        return copy.deepcopy(past)
+
+@metrics.instrument("chat_template")
+def _encode_prompt(tokenizer, model, messages):
+    prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    input_ids = tokenizer(prompt, return_tensors="pt", add_special_tokens=False).input_ids.to(model.device)
+    return prompt, input_ids
+
+def _past_length(past) -> int:
+    if past is None:
+        return 0
+    if hasattr(past, "get_seq_length"):
+        return past.get_seq_length()
+    return past[0][0].shape[-2]
+
+_FirstTokenTimer = None
+
+def _first_token_timer():
+    # the class is defined on first use because its base class lives in transformers
+    global _FirstTokenTimer
+    if _FirstTokenTimer is None:
+        class FirstTokenTimer(transformers.StoppingCriteria):
+            """Never stops generation; notes when the first new token exists (end of prefill)."""
+
+            def __init__(self):
+                self.t_first = None
+
+            def __call__(self, input_ids, scores, **kwargs):
+                if self.t_first is None:
+                    self.t_first = time.perf_counter()
+                return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        _FirstTokenTimer = FirstTokenTimer
+    return _FirstTokenTimer()
+
+def _timing_kwargs():
+    """generate() kwargs that split prefill from decode, only when metrics are on."""
+    if not metrics.is_enabled():
+        return {}, None
+    timer = _first_token_timer()
+    return {"stopping_criteria": transformers.StoppingCriteriaList([timer])}, timer
+
+def llm_generate(tokenizer, model, messages, max_new_tokens=640, temperature=0.0, top_p=0.9,
+                 cache_prefix: Optional[str] = None, speculative: bool = False,
+                 stats: Optional[Dict[str, float]] = None) -> str:
+    """
+    cache_prefix: optional text that ends the fixed part of the prompt (e.g. everything
+    before the user's pasted text). Its KV-cache is computed once per model and reused,
+    so only the remaining suffix is prefilled.
+    speculative: prompt-lookup speculative decoding (greedy only, same output as
+    temperature=0.0); ignored when sampling. stats, if given, receives acceptance
+    rate and tokens/sec (see _generate_prompt_lookup).
+    """
+    _heavy()
+    prompt, input_ids = _encode_prompt(tokenizer, model, messages)
+    past = _prefix_past(tokenizer, model, prompt, input_ids, cache_prefix) if cache_prefix else None
+    if speculative and temperature <= 0:
+        out_ids = _generate_prompt_lookup(tokenizer, model, input_ids, past, max_new_tokens, stats)
+        return tokenizer.decode(out_ids, skip_special_tokens=True).strip()
+    gen_kwargs, timer = _timing_kwargs()
+    if past is not None:
+        gen_kwargs["past_key_values"] = past
+    prefill_len = input_ids.shape[-1] - _past_length(past)
+    t0 = time.perf_counter()
     with torch.inference_mode():
         output_ids = model.generate(
             input_ids,
+            attention_mask=torch.ones_like(input_ids),
             max_new_tokens=max_new_tokens,
             do_sample=(temperature > 0),
             temperature=temperature,
             top_p=top_p,
             pad_token_id=tokenizer.eos_token_id,
+            **gen_kwargs,
         )
+    if timer is not None:
+        metrics.record_generation(prefill_len, output_ids.shape[-1] - input_ids.shape[-1],
+                                  t0, timer.t_first, time.perf_counter())
     return tokenizer.decode(output_ids[0][input_ids.shape[-1]:], skip_special_tokens=True).strip()
+
+# ---------- Streaming ----------
+_CancelCriteria = None
+
+def _cancel_criteria(*events: Optional[threading.Event]):
+    # defined on first use for the same reason as _first_token_timer
+    global _CancelCriteria
+    if _CancelCriteria is None:
+        class CancelCriteria(transformers.StoppingCriteria):
+            """Stops generation after the current token once any of the events is set."""
+
+            def __init__(self, events):
+                self.events = events
+
+            def __call__(self, input_ids, scores, **kwargs):
+                stop = any(e.is_set() for e in self.events)
+                return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
+        _CancelCriteria = CancelCriteria
+    return _CancelCriteria([e for e in events if e is not None])
+
+def llm_generate_stream(tokenizer, model, messages, max_new_tokens=640, temperature=0.0, top_p=0.9,
+                        cache_prefix: Optional[str] = None,
+                        cancel: Optional[threading.Event] = None) -> Iterator[str]:
+    """
+    llm_generate that yields decoded text pieces as tokens are produced (generate() runs on a
+    helper thread). Setting cancel, or closing the generator, stops decoding after the
+    current token; the pieces already yielded are all the caller gets.
+    """
+    _heavy()
+    prompt, input_ids = _encode_prompt(tokenizer, model, messages)
+    past = _prefix_past(tokenizer, model, prompt, input_ids, cache_prefix) if cache_prefix else None
+    gen_kwargs, timer = _timing_kwargs()
+    stop = threading.Event()
+    criteria = transformers.StoppingCriteriaList([_cancel_criteria(stop, cancel)])
+    criteria.extend(gen_kwargs.get("stopping_criteria", []))
+    gen_kwargs["stopping_criteria"] = criteria
+    if past is not None:
+        gen_kwargs["past_key_values"] = past
+    streamer = transformers.TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    prefill_len = input_ids.shape[-1] - _past_length(past)
+    errors: List[BaseException] = []
+    t0 = time.perf_counter()
+
+    def run():
+        try:
+            with torch.inference_mode():
+                output_ids = model.generate(
+                    input_ids,
+                    attention_mask=torch.ones_like(input_ids),
+                    max_new_tokens=max_new_tokens,
+                    do_sample=(temperature > 0),
+                    temperature=temperature,
+                    top_p=top_p,
+                    pad_token_id=tokenizer.eos_token_id,
+                    streamer=streamer,
+                    **gen_kwargs,
+                )
+            if timer is not None:
+                metrics.record_generation(prefill_len, output_ids.shape[-1] - input_ids.shape[-1],
+                                          t0, timer.t_first, time.perf_counter())
+        except BaseException as e:  # surfaced to the consumer below
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="formease-stream", daemon=True)
+    thread.start()
+    try:
+        for piece in streamer:
+            if piece:
+                yield piece
+    finally:
+        stop.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+
+# ---------- Prompt-lookup speculative decoding ----------
+# Extraction output mostly copies spans of the USER TEXT, so drafts are taken by matching
+# the last few tokens against earlier context and proposing what followed. All drafted
+# tokens are verified in one forward pass; the greedy choice at the first mismatch is kept,
+# so the output is the same as plain greedy decoding.
+LOOKUP_MAX_NGRAM = 3
+LOOKUP_NUM_DRAFT = 10
+
+def _eos_ids(tokenizer, model) -> set:
+    ids = {tokenizer.eos_token_id}
+    cfg_eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+    if isinstance(cfg_eos, int):
+        ids.add(cfg_eos)
+    elif cfg_eos:
+        ids.update(cfg_eos)
+    ids.discard(None)
+    return ids
+
+def _lookup_draft(tokens: List[int], max_ngram: int, num_draft: int) -> List[int]:
+    """
+    Tokens that followed the most recent earlier occurrence of the trailing n-gram
+    (longest n first), or [] when nothing matches.
+    """
+    for n in range(min(max_ngram, len(tokens) - 1), 0, -1):
+        tail = tokens[-n:]
+        for start in range(len(tokens) - n - 1, -1, -1):
+            if tokens[start:start + n] == tail:
+                return tokens[start + n:start + n + num_draft]
+    return []
+
+def _drop_past(past, n: int):
+    """Removes the last n positions from a KV-cache."""
+    if n <= 0:
+        return past
+    if hasattr(past, "crop"):
+        past.crop(-n)
+        return past
+    return tuple((k[..., :-n, :], v[..., :-n, :]) for k, v in past)
+
+def _generate_prompt_lookup(tokenizer, model, input_ids, past, max_new_tokens: int,
+                            stats: Optional[Dict[str, float]] = None) -> List[int]:
+    """
+    Greedy decoding with n-gram drafts from the prompt. Returns the new token ids.
+    stats receives: new_tokens, drafted, accepted, acceptance_rate, forward_passes,
+    seconds, tokens_per_sec.
+    """
+    t0 = time.perf_counter()
+    eos = _eos_ids(tokenizer, model)
+    context = input_ids[0].tolist()
+    new: List[int] = []
+    drafted = accepted = passes = 0
+    pending = context[_past_length(past):]
+    prefill_len, t_first = len(pending), None
+    with torch.inference_mode():
+        while len(new) < max_new_tokens:
+            draft = _lookup_draft(context + new, LOOKUP_MAX_NGRAM, LOOKUP_NUM_DRAFT)
+            draft = draft[: max(0, max_new_tokens - len(new) - 1)]
+            feed = pending + draft
+            out = model(torch.tensor([feed], device=model.device), past_key_values=past, use_cache=True)
+            past = out.past_key_values
+            passes += 1
+            if t_first is None:
+                t_first = time.perf_counter()
+            # greedy predictions after the last pending token and after each draft token
+            preds = out.logits[0, len(pending) - 1:].argmax(dim=-1).tolist()
+            n_ok = 0
+            while n_ok < len(draft) and draft[n_ok] == preds[n_ok] and draft[n_ok] not in eos:
+                n_ok += 1
+            drafted += len(draft)
+            accepted += n_ok
+            step = draft[:n_ok] + [preds[n_ok]]
+            # drop KV entries of rejected draft tokens; the bonus token is fed next round
+            past = _drop_past(past, len(draft) - n_ok)
+            for tid in step:
+                new.append(tid)
+                if tid in eos or len(new) >= max_new_tokens:
+                    break
+            if new[-1] in eos:
+                break
+            pending = [new[-1]]
+    t_end = time.perf_counter()
+    metrics.record_generation(prefill_len, len(new), t0, t_first, t_end)
+    metrics.count("speculative_drafted", drafted)
+    metrics.count("speculative_accepted", accepted)
+    if stats is not None:
+        secs = t_end - t0
+        stats.update({
+            "new_tokens": len(new),
+            "drafted": drafted,
+            "accepted": accepted,
+            "acceptance_rate": accepted / drafted if drafted else 0.0,
+            "forward_passes": passes,
+            "seconds": secs,
+            "tokens_per_sec": len(new) / secs if secs > 0 else 0.0,
+        })
+    return new
+
+def _pad_token_id(tokenizer) -> int:
+    return tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+def llm_generate_batch(tokenizer, model, messages_batch: List[List[Dict[str, str]]],
+                       max_new_tokens=640, temperature=0.0, top_p=0.9) -> List[str]:
+    """
+    Batched counterpart of llm_generate: one left-padded model.generate over many chats.
+    Rows stop independently on EOS (finished rows are padded until the batch completes).
+    Returns one decoded string per chat, in input order.
+    """
+    if not messages_batch:
+        return []
+    _heavy()
+    with metrics.timed("chat_template"):
+        prompts = [
+            tokenizer.apply_chat_template(m, tokenize=False, add_generation_prompt=True)
+            for m in messages_batch
+        ]
+        # Left padding keeps every prompt flush against its first generated token
+        old_side = tokenizer.padding_side
+        tokenizer.padding_side = "left"
+        try:
+            enc = tokenizer(prompts, return_tensors="pt", padding=True, add_special_tokens=False)
+        finally:
+            tokenizer.padding_side = old_side
+    enc = enc.to(model.device)
+    gen_kwargs, timer = _timing_kwargs()
+    t0 = time.perf_counter()
+    with torch.inference_mode():
+        output_ids = model.generate(
+            **enc,
+            max_new_tokens=max_new_tokens,
+            do_sample=(temperature > 0),
+            temperature=temperature,
+            top_p=top_p,
+            pad_token_id=_pad_token_id(tokenizer),
+            **gen_kwargs,
+        )
+    prompt_len = enc["input_ids"].shape[-1]
+    if timer is not None:
+        new_tokens = int((output_ids[:, prompt_len:] != _pad_token_id(tokenizer)).sum())
+        metrics.record_generation(int(enc["attention_mask"].sum()), new_tokens, t0, timer.t_first,
+                                  time.perf_counter(), rows=len(messages_batch))
+        metrics.observe("batch_rows", len(messages_batch))
+    return [
+        tokenizer.decode(row[prompt_len:], skip_special_tokens=True).strip()
+        for row in output_ids
+    ]
+
+# ---------- Schema-constrained decoding ----------
+
+def _pick_token(logits, temperature: float, top_p: float) -> int:
+    if temperature <= 0:
+        return int(torch.argmax(logits))
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    sorted_p, order = torch.sort(probs, descending=True)
+    keep = (torch.cumsum(sorted_p, dim=-1) - sorted_p) < top_p
+    sorted_p = sorted_p * keep
+    return int(order[torch.multinomial(sorted_p / sorted_p.sum(), 1)])
+
+def llm_generate_constrained(tokenizer, model, messages, root_key: str, max_new_tokens=640,
+                             temperature=0.0, top_p=0.9, cache_prefix: Optional[str] = None,
+                             exclude_fields: FrozenSet[str] = frozenset()) -> str:
+    """
+    Decodes JSON for one category under the compiled schema of root_key (see constrained.py).
+    Forced text (braces, keys, separators) is fed to the model in one forward pass with the
+    next chosen token; value tokens are picked from type-restricted vocab masks. Stops as
+    soon as the root object closes. Once max_new_tokens is spent the rest is finished
+    without the model (open values closed, remaining fields null), so the output is always
+    valid JSON.
+    exclude_fields: root-level fields to leave out of the forced skeleton.
+    """
+    program = root_program(root_key, exclude_fields)
+    if program is None:
+        return ""
+    _heavy()
+    prompt, input_ids = _encode_prompt(tokenizer, model, messages)
+    past = _prefix_past(tokenizer, model, prompt, input_ids, cache_prefix) if cache_prefix else None
+    pending = input_ids[0, _past_length(past):].tolist()
+    pieces: List[Union[str, int]] = []  # forced text, or chosen token ids
+    used = 0
+    prefill_len, t0, t_first = len(pending), time.perf_counter(), None
+    with torch.inference_mode():
+        try:
+            step = program.send(None)
+            while True:
+                kind, arg = step
+                chosen = None
+                if kind == FORCE:
+                    pieces.append(arg)
+                    if used < max_new_tokens:
+                        ids = tokenizer(arg, add_special_tokens=False).input_ids if arg else []
+                        pending.extend(ids)
+                        used += len(ids)
+                else:
+                    mask = None
+                    if used < max_new_tokens:
+                        out = model(torch.tensor([pending], device=model.device), past_key_values=past,
+                                    use_cache=True)
+                        past, pending = out.past_key_values, []
+                        if t_first is None:
+                            t_first = time.perf_counter()
+                        logits = out.logits[0, -1]
+                        mask = token_mask(tokenizer, arg, logits.shape[-1], logits.device)
+                    if mask is None or not bool(mask.any()):
+                        # budget spent (or nothing in the vocabulary fits): close the value
+                        chosen = close_choice(arg)
+                        pieces.append(chosen)
+                    else:
+                        tid = _pick_token(logits.masked_fill(~mask, float("-inf")), temperature, top_p)
+                        chosen = token_texts(tokenizer)[tid]
+                        pieces.append(tid)
+                        pending.append(tid)
+                        used += 1
+                step = program.send(chosen)
+        except StopIteration:
+            pass
+    metrics.record_generation(prefill_len, used, t0, t_first, time.perf_counter())
+    return _join_pieces(tokenizer, pieces)
+
+def _join_pieces(tokenizer, pieces: List[Union[str, int]]) -> str:
+    # Runs of chosen ids are decoded together: a character split over byte tokens only
+    # decodes once all of its bytes are there
+    out, run = [], []
+    for p in pieces:
+        if isinstance(p, int):
+            run.append(p)
+            continue
+        if run:
+            out.append(tokenizer.decode(run))
+            run = []
+        out.append(p)
+    if run:
+        out.append(tokenizer.decode(run))
+    return "".join(out)
+
+# ---------- Shared inference scheduler ----------
+# One worker thread owns the model. Sessions enqueue requests; the worker drains them
+# round-robin across sessions into dynamic batches (one llm_generate_batch per round),
+# so concurrent users share forward passes instead of contending for cores.
+
+class SchedulerBusy(RuntimeError):
+    """Raised when the queue (or a session's share of it) is full."""
+
+class _Job:
+    __slots__ = ("session_id", "messages", "max_new_tokens", "cache_prefix", "fn",
+                 "enqueued", "started", "done", "cancelled", "result", "error")
+
+    def __init__(self, session_id: str, messages=None, max_new_tokens: int = 640,
+                 cache_prefix: Optional[str] = None, fn=None):
+        self.session_id = session_id
+        self.messages = messages
+        self.max_new_tokens = max_new_tokens
+        self.cache_prefix = cache_prefix
+        self.fn = fn
+        self.enqueued = time.perf_counter()
+        self.started = None
+        self.done = threading.Event()
+        self.cancelled = False
+        self.result = None
+        self.error = None
+
+class InferenceScheduler:
+    """
+    - max_batch: rows per generate call
+    - max_queue / max_per_session: queued jobs before submit() raises SchedulerBusy
+    - batch_window: seconds the worker waits for more arrivals before a partial batch
+    - timeout: default seconds a caller waits for its result (TimeoutError after that)
+    Greedy only; constrained/speculative work is submitted with run() and executed alone.
+    """
+
+    def __init__(self, tokenizer, model, max_batch: int = 8, max_queue: int = 64, max_per_session: int = 16,
+                 batch_window: float = 0.02, timeout: float = 300.0):
+        self.tokenizer, self.model = tokenizer, model
+        self.max_batch, self.max_queue, self.max_per_session = max_batch, max_queue, max_per_session
+        self.batch_window, self.timeout = batch_window, timeout
+        self._sessions: "OrderedDict[str, deque]" = OrderedDict()
+        self._depth = 0
+        self._cv = threading.Condition()
+        self._closed = False
+        self._stats = {"batches": 0, "rows": 0, "rejected": 0, "timeouts": 0, "errors": 0, "queue_wait_s": 0.0}
+        self._worker = threading.Thread(target=self._loop, name="formease-inference", daemon=True)
+        self._worker.start()
+
+    # ----- client side -----
+    def _submit(self, job: _Job) -> _Job:
+        with self._cv:
+            if self._closed:
+                raise RuntimeError("scheduler is closed")
+            q = self._sessions.get(job.session_id)
+            if self._depth >= self.max_queue or (q is not None and len(q) >= self.max_per_session):
+                self._stats["rejected"] += 1
+                metrics.count("scheduler_rejected")
+                raise SchedulerBusy("The model is busy, please try again in a moment.")
+            if q is None:
+                q = self._sessions[job.session_id] = deque()
+            q.append(job)
+            self._depth += 1
+            self._cv.notify()
+        return job
+
+    def _timed_out(self, job: _Job) -> TimeoutError:
+        job.cancelled = True
+        with self._cv:
+            self._stats["timeouts"] += 1
+        metrics.count("scheduler_timeouts")
+        return TimeoutError("Timed out waiting for the model.")
+
+    def _wait(self, job: _Job, timeout: Optional[float]):
+        if not job.done.wait(self.timeout if timeout is None else timeout):
+            raise self._timed_out(job)
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def generate(self, messages, session_id: str = "default", max_new_tokens: int = 640,
+                 cache_prefix: Optional[str] = None, timeout: Optional[float] = None) -> str:
+        """Greedy llm_generate through the shared queue."""
+        return self._wait(self._submit(_Job(session_id, messages, max_new_tokens, cache_prefix)), timeout)
+
+    def generate_many(self, messages_batch, session_id: str = "default", max_new_tokens: int = 640,
+                      timeout: Optional[float] = None) -> List[str]:
+        """Enqueues every chat at once so they can share batches; results in input order."""
+        jobs = [self._submit(_Job(session_id, m, max_new_tokens)) for m in messages_batch]
+        return [self._wait(j, timeout) for j in jobs]
+
+    def run(self, fn, session_id: str = "default", timeout: Optional[float] = None):
+        """Runs fn(tokenizer, model) on the worker thread, alone."""
+        return self._wait(self._submit(_Job(session_id, fn=fn)), timeout)
+
+    def stream(self, messages, session_id: str = "default", max_new_tokens: int = 640,
+               cache_prefix: Optional[str] = None, cancel: Optional[threading.Event] = None,
+               timeout: Optional[float] = None) -> Iterator[str]:
+        """
+        llm_generate_stream on the worker thread (alone, like run()); pieces are handed over
+        through a queue as they are decoded. timeout bounds the wait for each piece.
+        Closing the generator cancels the stream, and drops the job if it hasn't started.
+        """
+        pieces: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def fn(tokenizer, model):
+            try:
+                for piece in llm_generate_stream(tokenizer, model, messages, max_new_tokens=max_new_tokens,
+                                                 cache_prefix=cache_prefix, cancel=stop):
+                    pieces.put(piece)
+            finally:
+                pieces.put(done)
+
+        job = self._submit(_Job(session_id, fn=fn))
+        wait = self.timeout if timeout is None else timeout
+        last = job.enqueued
+        try:
+            while cancel is None or not cancel.is_set():
+                try:
+                    piece = pieces.get(timeout=0.1)  # short, so cancel is noticed promptly
+                except queue.Empty:
+                    if time.perf_counter() - last > wait:
+                        raise self._timed_out(job)
+                    continue
+                if piece is done:
+                    break
+                last = time.perf_counter()
+                yield piece
+            else:
+                return
+        finally:
+            job.cancelled = True
+            stop.set()
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+
+    def session(self, session_id: str) -> "SchedulerSession":
+        return SchedulerSession(self, session_id)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cv:
+            out = dict(self._stats)
+            out["queue_depth"] = self._depth
+            out["sessions_waiting"] = len(self._sessions)
+        out["mean_batch"] = out["rows"] / out["batches"] if out["batches"] else 0.0
+        return out
+
+    def close(self) -> None:
+        with self._cv:
+            self._closed = True
+            self._cv.notify_all()
+
+    # ----- worker side -----
+    def _take_batch(self) -> List[_Job]:
+        # caller holds the lock; one job per session per pass, served sessions move to the back
+        batch: List[_Job] = []
+        key = None
+        progressed = True
+        while progressed and len(batch) < self.max_batch:
+            progressed = False
+            for sid in list(self._sessions):
+                q = self._sessions[sid]
+                while q and q[0].cancelled:
+                    q.popleft()
+                    self._depth -= 1
+                if not q:
+                    del self._sessions[sid]
+                    continue
+                job = q[0]
+                if job.fn is not None:
+                    if batch:
+                        continue
+                    q.popleft()
+                    self._depth -= 1
+                    self._sessions.move_to_end(sid)
+                    batch.append(job)
+                    break
+                if key is not None and job.max_new_tokens != key:
+                    continue
+                key = job.max_new_tokens
+                q.popleft()
+                self._depth -= 1
+                self._sessions.move_to_end(sid)
+                batch.append(job)
+                progressed = True
+                if len(batch) >= self.max_batch:
+                    break
+        for sid in [s for s, q in self._sessions.items() if not q]:
+            del self._sessions[sid]
+        return batch
+
+    def _loop(self) -> None:
+        while True:
+            with self._cv:
+                while not self._closed and self._depth == 0:
+                    self._cv.wait()
+                if self._closed:
+                    return
+                partial = self._depth < self.max_batch
+            if partial and self.batch_window > 0:
+                time.sleep(self.batch_window)
+            with self._cv:
+                batch = self._take_batch()
+            if batch:
+                self._execute(batch)
+
+    def _execute(self, batch: List[_Job]) -> None:
+        now = time.perf_counter()
+        for j in batch:
+            j.started = now
+            metrics.observe("queue_wait_seconds", now - j.enqueued)
+        try:
+            if batch[0].fn is not None:
+                results = [batch[0].fn(self.tokenizer, self.model)]
+            elif len(batch) == 1:
+                j = batch[0]
+                results = [llm_generate(self.tokenizer, self.model, j.messages, max_new_tokens=j.max_new_tokens,
+                                        cache_prefix=j.cache_prefix)]
+            else:
+                results = llm_generate_batch(self.tokenizer, self.model, [j.messages for j in batch],
+                                             max_new_tokens=batch[0].max_new_tokens)
+            for j, r in zip(batch, results):
+                j.result = r
+        except Exception as e:
+            for j in batch:
+                j.error = e
+        finally:
+            with self._cv:
+                self._stats["batches"] += 1
+                self._stats["rows"] += len(batch)
+                self._stats["queue_wait_s"] += sum(now - j.enqueued for j in batch)
+                if batch[0].error is not None:
+                    self._stats["errors"] += 1
+            for j in batch:
+                j.done.set()
+
+class SchedulerSession:
+    """A scheduler handle bound to one session id (what extractor functions receive)."""
+
+    def __init__(self, scheduler: InferenceScheduler, session_id: str):
+        self.scheduler, self.session_id = scheduler, session_id
+
+    def generate(self, messages, **kwargs) -> str:
+        return self.scheduler.generate(messages, session_id=self.session_id, **kwargs)
+
+    def generate_many(self, messages_batch, **kwargs) -> List[str]:
+        return self.scheduler.generate_many(messages_batch, session_id=self.session_id, **kwargs)
+
+    def run(self, fn, **kwargs):
+        return self.scheduler.run(fn, session_id=self.session_id, **kwargs)
+
+    def stream(self, messages, **kwargs) -> Iterator[str]:
+        return self.scheduler.stream(messages, session_id=self.session_id, **kwargs)
@@ -0,0 +1,195 @@
+"""
+Per-stage latency/throughput metrics.
+
+Stages are timed with `timed(stage)` or the `@instrument(stage)` decorator and values are
+recorded with `observe(name, value)` / `count(name)`. Everything is aggregated into
+fixed-bucket histograms and exported as a dict (`snapshot()`), Prometheus text
+(`prometheus_text()`) or one JSON log line per event (logger "formease.metrics").
+
+Disabled by default (FORMEASE_METRICS=1 or enable() turns it on); while disabled every
+hook is a flag check and nothing else.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger("formease.metrics")
+
+# Upper bounds; seconds for *_seconds histograms, plain units otherwise
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+VALUE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_enabled = os.environ.get("FORMEASE_METRICS", "") not in ("", "0", "false")
+_log_json = os.environ.get("FORMEASE_METRICS_LOG", "") not in ("", "0", "false")
+_lock = threading.Lock()
+# Process start as seen by the app (this module is one of the first it imports)
+STARTED = time.perf_counter()
+_histograms: Dict[str, "Histogram"] = {}
+_counters: Dict[str, float] = {}
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "total", "min", "max")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+
+    def add(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bucket bound holding the q-quantile (max for the overflow bucket)."""
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+def _ensure_log_handler() -> None:
+    # JSON lines go to stderr unless the host app already configured this logger
+    if _log_json and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+def enable(on: bool = True, log_json: Optional[bool] = None) -> None:
+    """Turns collection on/off process-wide; log_json toggles per-event JSON log lines."""
+    global _enabled, _log_json
+    _enabled = on
+    if log_json is not None:
+        _log_json = log_json
+    _ensure_log_handler()
+
+_ensure_log_handler()
+
+def is_enabled() -> bool:
+    return _enabled
+
+def reset() -> None:
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+def observe(name: str, value: float, **fields: Any) -> None:
+    """Adds value to histogram name (names ending in _seconds use latency buckets)."""
+    if not _enabled:
+        return
+    with _lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = Histogram(SECONDS_BUCKETS if name.endswith("_seconds") else VALUE_BUCKETS)
+        h.add(value)
+    if _log_json:
+        logger.info(json.dumps({"metric": name, "value": value, "ts": time.time(), **fields}))
+
+def count(name: str, n: float = 1) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+    if _log_json:
+        logger.info(json.dumps({"counter": name, "inc": n, "ts": time.time()}))
+
+@contextmanager
+def _timed(stage: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(f"{stage}_seconds", time.perf_counter() - t0, stage=stage)
+
+@contextmanager
+def _noop() -> Iterator[None]:
+    yield
+
+def timed(stage: str):
+    """Context manager recording the block's wall time under '<stage>_seconds'."""
+    return _timed(stage) if _enabled else _noop()
+
+def instrument(stage: str):
+    """Decorator form of timed()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _timed(stage):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+def record_generation(prompt_tokens: int, new_tokens: int, t_start: float, t_first: Optional[float],
+                      t_end: float, rows: int = 1) -> None:
+    """
+    Prefill/decode split of one generate call. t_first is when the first new token was
+    available (None if unknown: the whole call is then counted as decode).
+    """
+    if not _enabled:
+        return
+    prefill = (t_first - t_start) if t_first is not None else 0.0
+    decode = t_end - (t_first if t_first is not None else t_start)
+    observe("prompt_tokens", prompt_tokens)
+    observe("new_tokens", new_tokens)
+    if t_first is not None:
+        observe("prefill_seconds", prefill)
+        if prefill > 0:
+            observe("prefill_tokens_per_second", prompt_tokens / prefill)
+    observe("decode_seconds", decode)
+    decoded = max(0, new_tokens - rows) if t_first is not None else new_tokens
+    if decode > 0 and decoded:
+        observe("decode_tokens_per_second", decoded / decode)
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        hist = {
+            name: {
+                "count": h.count,
+                "sum": h.total,
+                "mean": h.total / h.count if h.count else 0.0,
+                "min": h.min if h.count else 0.0,
+                "max": h.max if h.count else 0.0,
+                "p50": h.quantile(0.5),
+                "p95": h.quantile(0.95),
+            }
+            for name, h in sorted(_histograms.items())
+        }
+        return {"enabled": _enabled, "histograms": hist, "counters": dict(sorted(_counters.items()))}
+
+def prometheus_text(prefix: str = "formease") -> str:
+    """Prometheus text exposition (histograms + counters)."""
+    lines = []
+    with _lock:
+        for name, h in sorted(_histograms.items()):
+            metric = f"{prefix}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, c in zip(h.buckets, h.counts):
+                cumulative += c
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {h.count}')
+            lines.append(f"{metric}_sum {h.total}")
+            lines.append(f"{metric}_count {h.count}")
+        for name, v in sorted(_counters.items()):
+            metric = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {v}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,130 @@
+"""
+Routes one unstructured intake document to the form categories.
+
+Each sentence is scored against every category with lexical features only: words from
+the models.py field names, weighted by how few categories share them, plus extractor's
+cue words and signals (emails, phones, dates, amounts). A sentence goes to every category
+scoring at least ROUTE_MIN_SCORE and within ROUTE_RATIO of its best one; a sentence that
+matches nothing follows the sentence before it in the same paragraph ("He was born ...").
+"""
+import math
+import re
+import time
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, get_args
+
+from pydantic import BaseModel
+
+import metrics
+from extractor import relevance
+from models import FormData
+
+ROUTE_MIN_SCORE = 1.0
+ROUTE_RATIO = 0.5
+# field-name parts that say nothing about the topic
+_STOP = {"and", "of", "or", "if", "in", "to", "per", "has", "is", "info", "line1", "line2", "items", "number", "type"}
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+|\s*\n\s*")
+_WORD_RE = re.compile(r"[a-z]+")
+
+def _stem(word: str) -> str:
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us")) else word
+
+def _models(annotation) -> Iterator[type]:
+    for t in (annotation, *get_args(annotation)):
+        if isinstance(t, type) and issubclass(t, BaseModel):
+            yield t
+
+def _field_words(model: type) -> Set[str]:
+    words: Set[str] = set()
+    for name, field in model.model_fields.items():
+        words.update(_stem(w) for w in name.split("_") if w not in _STOP)
+        for inner in _models(field.annotation):
+            words |= _field_words(inner)
+    return words
+
+@lru_cache(maxsize=1)
+def category_vocab() -> Dict[str, Dict[str, float]]:
+    """
+    {root_key: {stem: weight}} from the field (and nested field) names of each category,
+    plus the category's own name. A word unique to one category weighs 1.0; words shared
+    by many (date, name, status) weigh less.
+    """
+    words = {}
+    for root, field in FormData.model_fields.items():
+        ws = {_stem(w) for w in root.split("_") if w not in _STOP}
+        for model in _models(field.annotation):
+            ws |= _field_words(model)
+        words[root] = ws
+    n = len(words)
+    df: Dict[str, int] = {}
+    for ws in words.values():
+        for w in ws:
+            df[w] = df.get(w, 0) + 1
+    return {root: {w: math.log(1 + n / df[w]) / math.log(1 + n) for w in ws} for root, ws in words.items()}
+
+def score_sentence(sentence: str) -> Dict[str, float]:
+    """{root_key: score} of one sentence for every category."""
+    stems = {_stem(w) for w in _WORD_RE.findall(sentence.lower())}
+    return {
+        root: sum(weight for w, weight in vocab.items() if w in stems) + relevance(root, sentence)
+        for root, vocab in category_vocab().items()
+    }
+
+def split_sentences(text: str) -> List[Tuple[int, str]]:
+    """(paragraph index, sentence) for every non-empty sentence."""
+    out = []
+    for p, paragraph in enumerate(_PARAGRAPH_RE.split(text)):
+        out.extend((p, s.strip()) for s in _SENTENCE_RE.split(paragraph) if s.strip())
+    return out
+
+def _count(tokenizer, text: str) -> int:
+    if not text:
+        return 0
+    return len(tokenizer.encode(text)) if tokenizer is not None else len(text.split())
+
+def route_document(text: str, tokenizer=None) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    Splits a whole intake document into per-category slices.
+    Returns (slices, report): slices is {root_key: routed text} for categories that got at
+    least one sentence (ready for extract_categories); report has routing_ms, sentence
+    counts per category, the skipped categories, and text tokens sent to the model
+    compared with pasting the full text into every category (words without a tokenizer).
+    """
+    t0 = time.perf_counter()
+    roots = list(FormData.model_fields)
+    routed: Dict[str, List[str]] = {r: [] for r in roots}
+    unrouted = 0
+    prev: Tuple[Optional[int], List[str]] = (None, [])
+    units = split_sentences(text or "")
+    for paragraph, sentence in units:
+        scores = score_sentence(sentence)
+        best = max(scores.values())
+        targets = [r for r in roots if scores[r] >= ROUTE_MIN_SCORE and scores[r] >= ROUTE_RATIO * best]
+        if not targets and prev[0] == paragraph:
+            targets = prev[1]
+        if not targets:
+            unrouted += 1
+        for r in targets:
+            routed[r].append(sentence)
+        prev = (paragraph, targets)
+    slices = {r: " ".join(s) for r, s in routed.items() if s}
+    routing_s = time.perf_counter() - t0
+    metrics.observe("routing_seconds", routing_s)
+
+    full = _count(tokenizer, text or "")
+    sent = sum(_count(tokenizer, s) for s in slices.values())
+    naive = full * len(roots)
+    report = {
+        "routing_ms": round(routing_s * 1000, 2),
+        "sentences": len(units),
+        "unrouted_sentences": unrouted,
+        "categories": {r: len(s) for r, s in routed.items() if s},
+        "skipped": [r for r in roots if not routed[r]],
+        "token_unit": "tokens" if tokenizer is not None else "words",
+        "tokens_naive": naive,
+        "tokens_routed": sent,
+        "tokens_saved": naive - sent,
+        "saved_ratio": round(1 - sent / naive, 3) if naive else 0.0,
+    }
+    return slices, report
@@ -0,0 +1,187 @@
+"""
+Deterministic fast-path extractors for fields that can be read reliably with rules
+(emails, phones, cued dates, money amounts, small integers, yes/no flags).
+
+Each rule only fires on an explicit cue in the same sentence or clause and returns
+nothing when the text is ambiguous; whatever is left stays null for the model.
+"""
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+from utils import normalize_date
+
+_MONTH = (r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+          r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)")
+DATE_RE = re.compile(
+    r"\b(?:\d{4}-\d{1,2}-\d{1,2}"
+    r"|\d{1,2}[/.]\d{1,2}[/.]\d{2,4}"
+    rf"|\d{{1,2}}(?:st|nd|rd|th)?(?:\s+of)?\s+{_MONTH}\.?,?\s+\d{{4}}"
+    rf"|{_MONTH}\.?\s+\d{{1,2}}(?:st|nd|rd|th)?,?\s+\d{{4}})\b",
+    re.IGNORECASE,
+)
+EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
+PHONE_RE = re.compile(r"(?<![\w-])\+?\(?\d[\d\s().-]{5,}\d(?![\w-])")
+_CURRENCY = r"(?:usd|cad|eur|gbp|inr|aud|chf|dollars?|euros?|pounds?|rupees?)"
+AMOUNT_RE = re.compile(
+    rf"(?:[$€£₹]\s?\d[\d,]*(?:\.\d+)?(?:\s?{_CURRENCY}\b)?"
+    rf"|\b{_CURRENCY}\s?\d[\d,]*(?:\.\d+)?"
+    rf"|\b\d[\d,]*(?:\.\d+)?\s?(?:[$€£₹]|{_CURRENCY}\b))",
+    re.IGNORECASE,
+)
+_WORD_NUMS = {w: i for i, w in enumerate(
+    "zero one two three four five six seven eight nine ten eleven twelve".split())}
+_NUM = r"(\d{1,2}|" + "|".join(_WORD_NUMS) + r")"
+_NEG = re.compile(r"\b(?:no|not|don't|dont|do not|doesn't|does not|without|haven't|have not|never)\b", re.IGNORECASE)
+
+def _sentences(text: str) -> List[str]:
+    return [s for s in re.split(r"(?<=[.!?])\s+|\n+", text) if s.strip()]
+
+def _clauses(text: str) -> List[str]:
+    return [c for c in re.split(r"[.;!?\n]+|,\s+(?=[A-Za-z])|\b(?:and|but)\b", text) if c.strip()]
+
+def _as_int(token: str) -> Optional[int]:
+    token = token.lower()
+    return int(token) if token.isdigit() else _WORD_NUMS.get(token)
+
+def _cued_date(cue: str) -> Callable[[str], Optional[str]]:
+    cue_re = re.compile(cue, re.IGNORECASE)
+
+    def rule(text: str) -> Optional[str]:
+        found = [m.group(0) for s in _sentences(text) if cue_re.search(s) for m in DATE_RE.finditer(s)]
+        return normalize_date(found[0]) if len(set(found)) == 1 else None
+    return rule
+
+def _date_range(end: bool) -> Callable[[str], Optional[str]]:
+    # "lease from 1 July 2023 to 30 June 2024"
+    def rule(text: str) -> Optional[str]:
+        for s in _sentences(text):
+            if not re.search(r"\b(?:lease|rent|tenancy|contract)", s, re.IGNORECASE):
+                continue
+            dates = [m.group(0) for m in DATE_RE.finditer(s)]
+            if len(dates) == 2 and re.search(r"\b(?:to|until|till|through)\b|–|-\s", s):
+                return normalize_date(dates[1] if end else dates[0])
+        return None
+    return rule
+
+def _cued_amount(cue: str, monthly: bool = False) -> Callable[[str], Optional[str]]:
+    cue_re = re.compile(cue, re.IGNORECASE)
+
+    def rule(text: str) -> Optional[str]:
+        for c in _clauses(text):
+            if not cue_re.search(c):
+                continue
+            if monthly and re.search(r"\b(?:hour|hourly|week|weekly|year|yearly|annual|annually|day|daily)\b", c, re.IGNORECASE) \
+                    and not re.search(r"\bmonth", c, re.IGNORECASE):
+                continue
+            m = AMOUNT_RE.search(c)
+            if m:
+                return m.group(0).strip()
+        return None
+    return rule
+
+def _email(text: str) -> Optional[str]:
+    found = set(EMAIL_RE.findall(text))
+    return found.pop() if len(found) == 1 else None
+
+_PHONE_CUE = re.compile(r"\b(?:phone|telephone|tel|mobile|cell|call|whatsapp)\b", re.IGNORECASE)
+
+def _phone(text: str) -> Optional[str]:
+    # "+..." wins; otherwise the digit run closest to a phone cue, so a passport or
+    # permit number in the same sentence isn't taken for the phone
+    for s in _sentences(text):
+        runs = []
+        for m in PHONE_RE.finditer(s):
+            raw = m.group(0).strip()
+            digits = re.sub(r"\D", "", raw)
+            if not DATE_RE.fullmatch(raw) and 7 <= len(digits) <= 15:
+                runs.append((m.start(), m.end(), raw))
+        for _, _, raw in runs:
+            if raw.startswith("+"):
+                return raw
+        cues = [(c.start(), c.end()) for c in _PHONE_CUE.finditer(s)]
+        if runs and cues:
+            def gap(run):
+                return min(max(run[0] - ce, cs - run[1], 0) for cs, ce in cues)
+            return min(runs, key=gap)[2]
+    return None
+
+def _cued_count(noun: str) -> Callable[[str], Optional[int]]:
+    count_re = re.compile(rf"\b{_NUM}[\s-]+(?:{noun})\b", re.IGNORECASE)
+    none_re = re.compile(rf"\bno\s+(?:{noun})\b", re.IGNORECASE)
+
+    def rule(text: str) -> Optional[int]:
+        found = {_as_int(m.group(1)) for m in count_re.finditer(text)}
+        if none_re.search(text):
+            found.add(0)
+        return found.pop() if len(found) == 1 else None
+    return rule
+
+def _flag(subject: str, verb: Optional[str] = None) -> Callable[[str], Optional[bool]]:
+    subject_re = re.compile(subject, re.IGNORECASE)
+    verb_re = re.compile(verb, re.IGNORECASE) if verb else None
+    # the negation must govern the subject/verb: "no bank account", "doesn't require a
+    # work permit", "bank account: none"; not "a bank account, no savings"
+    target = rf"(?:{subject}{'|' + verb if verb else ''})"
+    attached = re.compile(rf"{_NEG.pattern}\W+(?:\w+\W+){{0,3}}?{target}|{subject}\W*(?:\w+\W+)?(?:no|none|not)\b",
+                          re.IGNORECASE)
+
+    def rule(text: str) -> Optional[bool]:
+        answers = set()
+        for c in _clauses(text):
+            if not subject_re.search(c) or (verb_re is not None and not verb_re.search(c)):
+                continue
+            if attached.search(c):
+                answers.add(False)
+            elif _NEG.search(c):
+                answers.add(None)  # a negation we can't place: leave the field to the model
+            else:
+                answers.add(True)
+        return answers.pop() if len(answers) == 1 else None
+    return rule
+
+# field name -> rule, per root_key (only scalar fields directly under the root)
+FIELD_RULES: Dict[str, Dict[str, Callable[[str], Any]]] = {
+    "basic_personal_info": {
+        "email": _email,
+        "phone": _phone,
+        "date_of_birth": _cued_date(r"\b(?:born|birth|dob|d\.o\.b)"),
+    },
+    "address_and_permits": {
+        "permit_expiry_date": _cued_date(r"\b(?:expir|valid (?:until|till|through))"),
+    },
+    "employment": {
+        "start_date": _cued_date(r"\b(?:since|started|starting|start date|joined|hired|began)\b"),
+        "income_per_month": _cued_amount(r"\b(?:earn|income|salary|wage|paid|make)", monthly=True),
+        "work_permit_required": _flag(r"\bwork permit", r"\b(?:requir|need)"),
+    },
+    "housing": {
+        "lease_start_date": _date_range(end=False),
+        "lease_end_date": _date_range(end=True),
+        "monthly_rent": _cued_amount(r"\brent", monthly=True),
+        "rooms": _cued_count(r"(?:bed)?rooms?"),
+    },
+    "dependents_information": {
+        "number_of_dependents": _cued_count(r"dependents?|children|kids"),
+    },
+    "financial_information": {
+        "has_bank_account": _flag(r"\bbank account"),
+        "monthly_income": _cued_amount(r"\b(?:income|earn|salary)", monthly=True),
+        "monthly_expenses": _cued_amount(r"\b(?:expense|spend)"),
+        "savings_amount": _cued_amount(r"\bsaving"),
+        "debts_amount": _cued_amount(r"\b(?:debt|owe|loan)"),
+    },
+}
+
+def apply_rules(root_key: str, text: str) -> Dict[str, Any]:
+    """
+    {field: value} for every rule under root_key that fired on text.
+    """
+    values: Dict[str, Any] = {}
+    for field, rule in FIELD_RULES.get(root_key, {}).items():
+        try:
+            v = rule(text)
+        except Exception:
+            v = None
+        if v is not None:
+            values[field] = v
+    return values
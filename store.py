@@ -0,0 +1,380 @@
+"""
+Local persistent store of finished intakes.
+
+A record is a row of uint32 codes, one per models.py field (list fields such as
+dependents are a single JSON value), into one table of distinct JSON-encoded values, so
+repeated values (statuses, countries, cities, empty lists) are kept once and a record
+costs its row plus whatever values are new. On disk a store is a directory of
+append-only files: schema.json, values.jsonl (line n holds code n) and rows.bin.
+
+Secondary indexes on passport_or_id, permit_number and normalized (full_name,
+date_of_birth) map a 64-bit hash of the key to row numbers, so find_duplicates() is a
+few dict lookups. One writer process per directory, enforced with an exclusive lock on
+<dir>/.lock; threads may share a store, and read-only opens (the CLI below) don't lock.
+
+    python store.py --store .formease_store stats
+    python store.py --store .formease_store export --format csv --output intakes.csv
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import unicodedata
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple, Union, get_origin
+
+from cache import SCHEMA_VERSION
+from models import FormData
+from utils import normalize_date
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, the one-writer rule is on the caller
+    fcntl = None
+
+INDEXES = ("passport_or_id", "permit_number", "name_dob")
+_NULL = 0  # code of "null" (and of empty lists), always line 0 of values.jsonl
+
+def _columns() -> Tuple[Tuple[str, str, bool], ...]:
+    """(root_key, field, is_list) for every field of every FormData category."""
+    return tuple(
+        (root, name, get_origin(f.annotation) is list)
+        for root, section in FormData.model_fields.items()
+        for name, f in section.annotation.model_fields.items()
+    )
+
+COLUMNS = _columns()
+
+def _norm_id(value: Any) -> Optional[str]:
+    # "p 123-456" and "P123456" are the same document
+    return re.sub(r"[^0-9A-Z]", "", str(value).upper()) or None if value else None
+
+def _norm_name(value: Any) -> Optional[str]:
+    # accents, case, punctuation and word order ("Mensah, Olek") don't matter
+    text = unicodedata.normalize("NFKD", str(value or "")).encode("ascii", "ignore").decode("ascii")
+    return " ".join(sorted(re.findall(r"[a-z0-9]+", text.lower()))) or None
+
+def index_keys(form: Dict[str, Any]) -> Dict[str, str]:
+    """{index name: normalized key} for the indexes this form has values for."""
+    basic = form.get("basic_personal_info") if isinstance(form.get("basic_personal_info"), dict) else {}
+    permits = form.get("address_and_permits") if isinstance(form.get("address_and_permits"), dict) else {}
+    keys = {}
+    passport, permit = _norm_id(basic.get("passport_or_id")), _norm_id(permits.get("permit_number"))
+    if passport:
+        keys["passport_or_id"] = passport
+    if permit:
+        keys["permit_number"] = permit
+    name = _norm_name(basic.get("full_name"))
+    dob = normalize_date(basic.get("date_of_birth")) if isinstance(basic.get("date_of_birth"), str) else None
+    if name and dob:
+        keys["name_dob"] = f"{name}|{dob}"
+    return keys
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _truncate(path: str, size: int) -> None:
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+def _lock_dir(path: str) -> TextIO:
+    # held until close(); the OS drops it if the process dies
+    lock_path = os.path.join(path, ".lock")
+    f = open(lock_path, "a", encoding="utf-8")
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            raise RuntimeError(f"intake store {path} is already open for writing by another process "
+                               f"(lock {lock_path}); open it read-only or stop that process first") from None
+    return f
+
+class IntakeStore:
+    """
+    Append-only intake store in directory `path` (created if missing).
+    - read_only: don't lock, write or repair anything; add() then raises
+    - add(form) -> row number; get(row) -> FormData dict
+    - find_duplicates(form) / lookup(index, value) answer from the secondary indexes
+    - export_jsonl(out) / export_csv(out) stream every record to an open text file
+    """
+
+    def __init__(self, path: str, read_only: bool = False):
+        self.path = path
+        self.read_only = read_only
+        self._lock = threading.RLock()
+        self._lock_f = self._values_f = self._rows_f = None
+        self._broken: Optional[str] = None
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+            self._lock_f = _lock_dir(path)
+        self._width = len(COLUMNS)
+        self._col = {(root, name): i for i, (root, name, _) in enumerate(COLUMNS)}
+        schema_path = os.path.join(path, "schema.json")
+        schema = {"schema": SCHEMA_VERSION, "columns": [f"{r}.{n}" for r, n, _ in COLUMNS]}
+        if os.path.exists(schema_path):
+            with open(schema_path, "r", encoding="utf-8") as f:
+                found = json.load(f)
+            if found.get("columns") != schema["columns"]:
+                raise ValueError(f"{path} was written for schema {found.get('schema')}, not {SCHEMA_VERSION}")
+        elif not read_only:
+            with open(schema_path, "w", encoding="utf-8") as f:
+                json.dump(schema, f)
+        self._values, self._rows = self._load()
+        self._codes = {v: i for i, v in enumerate(self._values)}
+        self._indexes: Dict[str, Dict[int, Union[int, List[int]]]] = {name: {} for name in INDEXES}
+        for row in range(len(self)):
+            self._index(row, index_keys(self._key_fields(row)))
+        if not read_only:
+            self._values_f = open(os.path.join(path, "values.jsonl"), "a", encoding="utf-8", newline="\n")
+            self._rows_f = open(os.path.join(path, "rows.bin"), "ab")
+
+    def _load(self) -> Tuple[List[str], array]:
+        values_path, rows_path = os.path.join(self.path, "values.jsonl"), os.path.join(self.path, "rows.bin")
+        # rows before values: a writer flushes a row's values first, so a read-only open
+        # racing it never sees a row whose values it hasn't read
+        rows = array("I")
+        if os.path.exists(rows_path):
+            with open(rows_path, "rb") as f:
+                raw = f.read()
+            usable = len(raw) - len(raw) % (rows.itemsize * self._width)
+            if usable < len(raw) and not self.read_only:  # torn last row
+                _truncate(rows_path, usable)
+            rows.frombytes(raw[:usable])
+
+        if not os.path.exists(values_path):
+            if self.read_only:
+                return ["null"], rows
+            with open(values_path, "w", encoding="utf-8", newline="\n") as f:
+                f.write("null\n")
+        with open(values_path, "rb") as f:
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data) and not self.read_only:  # torn last value from a crash: nothing references it yet
+            _truncate(values_path, end)
+        values = data[:end].decode("utf-8").split("\n")[:-1]
+        if rows and max(rows) >= len(values):
+            raise ValueError(f"{rows_path} references values missing from {values_path}")
+        return values, rows
+
+    def __len__(self) -> int:
+        return len(self._rows) // self._width
+
+    def _value(self, code: int, is_list: bool) -> Any:
+        if code == _NULL:
+            return [] if is_list else None
+        return json.loads(self._values[code])
+
+    def _key_fields(self, row: int) -> Dict[str, Dict[str, Any]]:
+        """Only the fields index_keys() reads, decoded from the row."""
+        base = row * self._width
+        out: Dict[str, Dict[str, Any]] = {"basic_personal_info": {}, "address_and_permits": {}}
+        for root, name in (("basic_personal_info", "full_name"), ("basic_personal_info", "date_of_birth"),
+                           ("basic_personal_info", "passport_or_id"), ("address_and_permits", "permit_number")):
+            out[root][name] = self._value(self._rows[base + self._col[(root, name)]], False)
+        return out
+
+    def _index(self, row: int, keys: Dict[str, str]) -> None:
+        for name, key in keys.items():
+            idx, h = self._indexes[name], _hash(key)
+            cur = idx.get(h)
+            if cur is None:
+                idx[h] = row
+            elif isinstance(cur, list):
+                cur.append(row)
+            else:
+                idx[h] = [cur, row]
+
+    def _candidates(self, name: str, key: str) -> List[int]:
+        cur = self._indexes[name].get(_hash(key))
+        rows = [] if cur is None else cur if isinstance(cur, list) else [cur]
+        # 64-bit hashes practically never collide, but confirm against the record
+        return [r for r in rows if index_keys(self._key_fields(r)).get(name) == key]
+
+    def add(self, form: Dict[str, Any]) -> int:
+        """
+        Appends a FormData dict (unknown keys are ignored) and returns its row number.
+        Does not refuse duplicates; call find_duplicates() first.
+        """
+        if self.read_only:
+            raise RuntimeError(f"intake store {self.path} is open read-only")
+        with self._lock:
+            if self._broken:
+                raise RuntimeError(f"intake store {self.path} needs reopening: {self._broken}")
+            codes, new = array("I"), []
+            for root, name, is_list in COLUMNS:
+                section = form.get(root) if isinstance(form.get(root), dict) else {}
+                value = section.get(name)
+                if value is None or (is_list and not value):
+                    codes.append(_NULL)
+                    continue
+                text = json.dumps(value, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+                code = self._codes.get(text)
+                if code is None:
+                    code = self._codes[text] = len(self._values)
+                    self._values.append(text)
+                    new.append(text)
+                codes.append(code)
+            sizes = os.fstat(self._values_f.fileno()).st_size, os.fstat(self._rows_f.fileno()).st_size
+            try:
+                if new:
+                    self._values_f.write("".join(t + "\n" for t in new))
+                    self._values_f.flush()
+                self._rows_f.write(codes.tobytes())
+                self._rows_f.flush()
+            except Exception:
+                # codes are line numbers of values.jsonl: cut both files back to where they
+                # were before forgetting the new values, or later adds would point at them
+                self._truncate_to(*sizes)
+                for text in new:
+                    del self._codes[text]
+                del self._values[len(self._values) - len(new):]
+                raise
+            self._rows.extend(codes)
+            row = len(self) - 1
+            self._index(row, index_keys(form))
+            return row
+
+    def _truncate_to(self, values_size: int, rows_size: int) -> None:
+        # reopen the append handles: whatever the failed write left in their buffers goes
+        try:
+            for f in (self._values_f, self._rows_f):
+                try:
+                    f.close()
+                except OSError:
+                    pass
+            _truncate(os.path.join(self.path, "values.jsonl"), values_size)
+            _truncate(os.path.join(self.path, "rows.bin"), rows_size)
+            self._values_f = open(os.path.join(self.path, "values.jsonl"), "a", encoding="utf-8", newline="\n")
+            self._rows_f = open(os.path.join(self.path, "rows.bin"), "ab")
+        except OSError as e:
+            self._broken = f"rolling back a failed add: {e}"
+
+    def get(self, row: int) -> Dict[str, Any]:
+        """The stored record as a FormData dict."""
+        if not 0 <= row < len(self):
+            raise IndexError(f"no intake {row}")
+        base = row * self._width
+        form: Dict[str, Dict[str, Any]] = {root: {} for root in FormData.model_fields}
+        for i, (root, name, is_list) in enumerate(COLUMNS):
+            form[root][name] = self._value(self._rows[base + i], is_list)
+        return form
+
+    def iter_forms(self, start: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(row, form) for every record from start, including ones added while iterating."""
+        row = start
+        while row < len(self):
+            yield row, self.get(row)
+            row += 1
+
+    def find_duplicates(self, form: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Stored intakes sharing a passport/ID, permit number or name + date of birth
+        with `form`: [{"row": n, "matches": ["passport_or_id", ...]}], oldest first.
+        """
+        with self._lock:
+            found: Dict[int, List[str]] = {}
+            for name, key in index_keys(form).items():
+                for row in self._candidates(name, key):
+                    found.setdefault(row, []).append(name)
+        return [{"row": row, "matches": found[row]} for row in sorted(found)]
+
+    def lookup(self, index: str, value: Union[str, Tuple[str, str]]) -> List[int]:
+        """
+        Rows whose passport_or_id / permit_number equals value after normalization,
+        or for "name_dob" whose (full_name, date_of_birth) equals the value tuple.
+        """
+        if index == "name_dob":
+            full_name, dob = value
+            form = {"basic_personal_info": {"full_name": full_name, "date_of_birth": dob}}
+        elif index == "passport_or_id":
+            form = {"basic_personal_info": {"passport_or_id": value}}
+        elif index == "permit_number":
+            form = {"address_and_permits": {"permit_number": value}}
+        else:
+            raise ValueError(f"unknown index {index!r}; expected one of {INDEXES}")
+        key = index_keys(form).get(index)
+        with self._lock:
+            return self._candidates(index, key) if key else []
+
+    def export_jsonl(self, out: TextIO) -> int:
+        """Writes {"id": row, "form": {...}} lines (batch_cli's output format); returns the count."""
+        n = 0
+        for row, form in self.iter_forms():
+            out.write(json.dumps({"id": row, "form": form}, ensure_ascii=False) + "\n")
+            n += 1
+        return n
+
+    def export_csv(self, out: TextIO) -> int:
+        """
+        Writes one row per intake with a root_key.field column per field; list fields
+        are JSON text and booleans/numbers as JSON literals. Returns the count.
+        """
+        writer = csv.writer(out)
+        writer.writerow(["id"] + [f"{root}.{name}" for root, name, _ in COLUMNS])
+        decoded: Dict[int, str] = {_NULL: ""}
+        n = 0
+        while n < len(self):
+            base = n * self._width
+            cells = [str(n)]
+            for code in self._rows[base:base + self._width]:
+                cell = decoded.get(code)
+                if cell is None:
+                    text = self._values[code]
+                    cell = json.loads(text) if text.startswith('"') else text
+                    if len(decoded) < 65536:  # repeated values: statuses, countries, cities
+                        decoded[code] = cell
+                cells.append(cell)
+            writer.writerow(cells)
+            n += 1
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        files = ("schema.json", "values.jsonl", "rows.bin")
+        return {
+            "records": len(self),
+            "columns": self._width,
+            "distinct_values": len(self._values),
+            "index_keys": {name: len(idx) for name, idx in self._indexes.items()},
+            "disk_bytes": sum(os.path.getsize(p) for p in (os.path.join(self.path, f) for f in files)
+                              if os.path.exists(p)),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            for f in (self._values_f, self._rows_f, self._lock_f):
+                if f is not None:
+                    f.close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Inspect or export the intake store.")
+    ap.add_argument("--store", default=os.environ.get("FORMEASE_STORE") or ".formease_store")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="record count, distinct values, index sizes, disk bytes")
+    exp = sub.add_parser("export", help="stream every intake as JSONL or CSV")
+    exp.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    exp.add_argument("--output", default="-", help="file to write, or - for stdout")
+    args = ap.parse_args(argv)
+
+    store = IntakeStore(args.store, read_only=True)  # works while the app holds the store
+    try:
+        if args.command == "stats":
+            print(json.dumps(store.stats()))
+            return 0
+        out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8", newline="")
+        try:
+            n = store.export_csv(out) if args.format == "csv" else store.export_jsonl(out)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        print(json.dumps({"exported": n, "format": args.format}), file=sys.stderr)
+        return 0
+    finally:
+        store.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
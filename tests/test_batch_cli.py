@@ -0,0 +1,35 @@
+import json
+
+import batch_cli
+from store import IntakeStore
+
+def _fake_extract_many(tokenizer, model, jobs, **kwargs):
+    # "name|dob" -> basic_personal_info patch; no model involved
+    patches = []
+    for key, text in jobs:
+        name, dob = (text.split("|") + [None])[:2]
+        patches.append({key: {"full_name": name or None, "date_of_birth": dob}})
+    return patches
+
+def _run(tmp_path, monkeypatch, records):
+    monkeypatch.setattr(batch_cli, "load_model", lambda model_id, backend: (None, None))
+    monkeypatch.setattr(batch_cli, "extract_many", _fake_extract_many)
+    inp = tmp_path / "in.jsonl"
+    inp.write_text("".join(json.dumps({"id": rid, "texts": {"basic_personal_info": t}}) + "\n"
+                           for rid, t in records), encoding="utf-8")
+    return batch_cli.run(str(inp), str(tmp_path / "out.jsonl"), "unused", store_path=str(tmp_path / "store"))
+
+def test_resume_after_crash_does_not_store_twice(tmp_path, monkeypatch):
+    records = [("a", "|"), ("b", "Ana Lima|1990-01-01")]  # "a" has nothing a duplicate check could match
+    assert _run(tmp_path, monkeypatch, records)["stored"] == 2
+    (tmp_path / "out.jsonl").write_text("", encoding="utf-8")  # died after the adds, before the output lines
+    summary = _run(tmp_path, monkeypatch, records)
+    assert summary["records"] == 2 and summary["stored"] == 0
+    store = IntakeStore(str(tmp_path / "store"), read_only=True)
+    assert len(store) == 2
+
+def test_possible_duplicates_are_stored_and_flagged(tmp_path, monkeypatch):
+    summary = _run(tmp_path, monkeypatch, [("a", "Ana Lima|1990-01-01"), ("b", "Ana Lima|1990-01-01")])
+    assert summary["stored"] == 2 and summary["possible_duplicates"] == 1
+    lines = [json.loads(line) for line in (tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert "possible_duplicates" not in lines[0] and lines[1]["possible_duplicates"] == [0]
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from constrained import CHOOSE, FORCE, _allowed, close_choice, root_program
+from models import FormData
+
+def _drive(root_key, picks):
+    # answers CHOOSE steps from picks[kind] (a list, consumed in order; close_choice once
+    # it is empty) and returns the text
+    program, text, sent = root_program(root_key), "", None
+    picks = {k: list(v) for k, v in picks.items()}
+    try:
+        while True:
+            action, arg = program.send(sent)
+            sent = None
+            if action == FORCE:
+                text += arg
+            else:
+                assert action == CHOOSE
+                sent = picks[arg].pop(0) if picks.get(arg) else close_choice(arg)
+                text += sent
+    except StopIteration:
+        return text
+
+@pytest.mark.parametrize("digits, expected", [
+    (["0"], 0),
+    (["-", "0"], 0),
+    (["-", "1", "2", ","], -12),
+    (["3", "0", ","], 30),
+])
+def test_int_values_are_valid_json(digits, expected):
+    start, rest = digits[0], digits[1:]
+    picks = {"int_start_or_null": [start], "digits": [], "int_body:,": []}
+    if start == "-":
+        picks["digits"], rest = [rest[0]], rest[1:]
+    picks["int_body:,"] = rest
+    picks["list_first:{"] = ["]"]
+    text = _drive("dependents_information", picks)
+    assert json.loads(text)["dependents_information"]["number_of_dependents"] == expected
+
+def test_leading_zero_tokens_are_masked():
+    assert _allowed("int_start", "0") and _allowed("int_start", "10") and _allowed("int_start", "-")
+    assert not _allowed("int_start", "012")
+    assert not _allowed("digits", "05")
+    assert _allowed("int_body:,", "05")  # after a non-zero first digit anything goes
+
+@pytest.mark.parametrize("root_key", list(FormData.model_fields))
+def test_close_choice_finishes_every_category_as_valid_json(root_key):
+    assert json.loads(_drive(root_key, {}))[root_key] is not None
+
+def test_close_choice_closes_an_open_string_and_list():
+    text = _drive("skills", {"list_first:\"": ['"'], "str_body": ["Cook", "ing"]})
+    assert json.loads(text)["skills"]["skills"] == ["Cooking"]
@@ -0,0 +1,57 @@
+import pytest
+
+from rules import FIELD_RULES, apply_rules
+
+has_bank_account = FIELD_RULES["financial_information"]["has_bank_account"]
+work_permit_required = FIELD_RULES["employment"]["work_permit_required"]
+phone = FIELD_RULES["basic_personal_info"]["phone"]
+
+@pytest.mark.parametrize("text, expected", [
+    ("I have a bank account at RBC.", True),
+    ("I have a bank account but no savings.", True),
+    ("I have a bank account at TD, no debts.", True),
+    ("I don't have a bank account.", False),
+    ("No bank account yet.", False),
+    ("Bank account: none", False),
+    ("I don't know if I have a bank account.", None),  # unclear: left to the model
+    ("Savings of 200 CAD.", None),
+])
+def test_bank_account_flag(text, expected):
+    assert has_bank_account(text) is expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("My job requires a work permit.", True),
+    ("The job does not require a work permit.", False),
+    ("A work permit is not required.", False),
+    ("I don't need a work permit for this job.", False),
+    ("I hold a work permit.", None),  # no require/need cue
+])
+def test_work_permit_flag(text, expected):
+    assert work_permit_required(text) is expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("My passport number is 12345678 and phone +1 555 222 3333", "+1 555 222 3333"),
+    ("Passport number 12345678, phone 555 222 3333.", "555 222 3333"),
+    ("555 222 3333 is my mobile, passport 12345678.", "555 222 3333"),
+    ("Call me on 604-555-1234.", "604-555-1234"),
+    ("My passport number is 12345678.", None),
+    ("Born 2001-04-05, phone not given.", None),
+])
+def test_phone(text, expected):
+    assert phone(text) == expected
+
+def test_apply_rules_only_returns_fired_rules():
+    text = "Email amina@example.com, phone +1 416 555 0101. Born 12 March 1990."
+    assert apply_rules("basic_personal_info", text) == {
+        "email": "amina@example.com",
+        "phone": "+1 416 555 0101",
+        "date_of_birth": "1990-03-12",
+    }
+    assert apply_rules("skills", text) == {}
+
+def test_counts_and_amounts():
+    assert apply_rules("dependents_information", "I have two children.") == {"number_of_dependents": 2}
+    housing = apply_rules("housing", "Rent is 1200 CAD per month for a 2 bedroom flat.")
+    assert housing == {"monthly_rent": "1200 CAD", "rooms": 2}
+    # weekly pay is not a monthly income
+    assert "income_per_month" not in apply_rules("employment", "I earn 500 CAD a week.")
@@ -0,0 +1,43 @@
+import pytest
+
+from store import IntakeStore
+
+def _form(name, city):
+    return {"basic_personal_info": {"full_name": name}, "address_and_permits": {"city": city}}
+
+class _FailingWrites:
+    def __init__(self, f):
+        self._f = f
+
+    def write(self, data):
+        raise OSError("disk full")
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+def test_failed_add_keeps_codes_in_step_with_values_file(tmp_path):
+    store = IntakeStore(str(tmp_path))
+    store.add(_form("Ana Lima", "Toronto"))
+    rows_f = store._rows_f
+    store._rows_f = _FailingWrites(rows_f)  # values.jsonl gets the new values, rows.bin fails
+    with pytest.raises(OSError):
+        store.add(_form("Ben Okafor", "Calgary"))
+    row = store.add(_form("Chen Wei", "Halifax"))
+    assert store.get(row)["basic_personal_info"]["full_name"] == "Chen Wei"
+    assert store.get(row)["address_and_permits"]["city"] == "Halifax"
+    store.close()
+
+    reopened = IntakeStore(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get(1)["basic_personal_info"]["full_name"] == "Chen Wei"
+    reopened.close()
+
+def test_second_writer_is_refused(tmp_path):
+    store = IntakeStore(str(tmp_path))
+    with pytest.raises(RuntimeError, match="already open for writing"):
+        IntakeStore(str(tmp_path))
+    reader = IntakeStore(str(tmp_path), read_only=True)
+    assert len(reader) == 0
+    reader.close()
+    store.close()
+    IntakeStore(str(tmp_path)).close()
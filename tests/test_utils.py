@@ -0,0 +1,13 @@
+import pytest
+
+from utils import normalize_form
+
+@pytest.mark.parametrize("raw, expected", [("3", 3), ("two", 2), (4.0, 4), ("3 rooms", "3 rooms")])
+def test_int_fields_keep_what_does_not_parse(raw, expected):
+    form = normalize_form({"housing": {"rooms": raw}})
+    assert form["housing"]["rooms"] == expected
+
+@pytest.mark.parametrize("raw, expected", [("yes", True), ("No", False), (1, True), ("maybe", "maybe")])
+def test_bool_fields_keep_what_does_not_parse(raw, expected):
+    form = normalize_form({"financial_information": {"has_bank_account": raw}})
+    assert form["financial_information"]["has_bank_account"] == expected
@@ -1,113 +1,225 @@
+"""
+Editable intake form (right column).
+
+Each section is a fragment with keyed widgets, so interacting with one section reruns only
+that section. Edits are written into the form by on_change callbacks and bump
+st.session_state.form_version; nothing else reruns. The download reads the form when it
+is clicked (form_download), and the coerced form and its JSON are memoized per version
+for whatever renders them next.
+"""
+import copy
+import json
 import re
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List, Tuple
 import streamlit as st
+import metrics
 from models import Dependent, EducationItem
+from utils import coerce_dates_in_form
 
-def render_editable_form(form_dict: Dict[str, Any]) -> Dict[str, Any]:
-    st.subheader("Intake Form (editable)")
+SECTIONS = (
+    "basic_personal_info", "address_and_permits", "employment", "housing",
+    "dependents_information", "financial_information", "education", "skills",
+)
+TRI_STATE = ["", "yes", "no"]
+
+# ---------- Versioning ----------
+
+def form_version() -> int:
+    return st.session_state.get("form_version", 0)
+
+def mark_form_changed(*sections: str) -> None:
+    """
+    Call after changing st.session_state.form outside the widgets (extraction, reset).
+    Bumps form_version and renews the widgets of the given sections (all when none are
+    given) so they show the new values; other sections keep their widgets as they are.
+    """
+    st.session_state.form_version = form_version() + 1
+    revs = st.session_state.setdefault("form_section_rev", {})
+    for s in sections or SECTIONS:
+        revs[s] = revs.get(s, 0) + 1
+
+def form_json(form: Dict[str, Any]) -> Tuple[str, bytes]:
+    """
+    (pretty JSON, UTF-8 bytes) of the date-coerced form, recomputed only when
+    form_version changes.
+    """
+    cached = st.session_state.get("_form_json")
+    if cached is None or cached[0] != form_version():
+        with metrics.timed("form_json"):
+            text = json.dumps(coerce_dates_in_form(copy.deepcopy(form)), indent=2)
+        cached = (form_version(), text, text.encode("utf-8"))
+        st.session_state._form_json = cached
+    return cached[1], cached[2]
+
+def form_download(form: Dict[str, Any]) -> Callable[[], bytes]:
+    """
+    data= callable for st.download_button (Streamlit 1.50+). Streamlit calls it on click, on its own thread
+    and without session state, so it reads `form` itself: the file has every edit so far.
+    """
+    return lambda: json.dumps(coerce_dates_in_form(copy.deepcopy(form)), indent=2).encode("utf-8")
+
+# ---------- Widgets ----------
+
+def _key(section: str, *path: Any) -> str:
+    rev = st.session_state.get("form_section_rev", {}).get(section, 0)
+    return ".".join(["form", section, str(rev), *map(str, path)])
+
+def _edited(container: Dict[str, Any], field: str, key: str, convert: Callable[[Any], Any]) -> None:
+    container[field] = convert(st.session_state[key])
+    st.session_state.form_version = form_version() + 1
+
+def _widget(factory, label: str, section: str, container: Dict[str, Any], field: str, path: Tuple = (),
+            to_widget: Callable[[Any], Any] = lambda v: v or "", from_widget: Callable[[Any], Any] = lambda v: v,
+            **kwargs) -> None:
+    key = _key(section, *path, field)
+    if key not in st.session_state:
+        st.session_state[key] = to_widget(container.get(field))
+    factory(label, key=key, on_change=_edited, args=(container, field, key, from_widget), **kwargs)
+
+def _text(label: str, section: str, container: Dict[str, Any], field: str, path: Tuple = ()) -> None:
+    _widget(st.text_input, label, section, container, field, path)
+
+def _tri(label: str, section: str, container: Dict[str, Any], field: str, path: Tuple = ()) -> None:
+    _widget(st.selectbox, label, section, container, field, path,
+            to_widget=lambda v: "yes" if v is True else "no" if v is False else "",
+            from_widget=lambda c: True if c == "yes" else False if c == "no" else None,
+            options=TRI_STATE)
+
+def _int(label: str, section: str, container: Dict[str, Any], field: str, max_value: int) -> None:
+    _widget(st.number_input, label, section, container, field,
+            to_widget=lambda v: int(v) if isinstance(v, int) else 0, from_widget=int,
+            min_value=0, max_value=max_value)
 
-    # Basic Personal Info
+def _resized(section: str, container: Dict[str, Any], list_field: str, key: str, blank: Callable[[], Dict],
+             count_field: str = "") -> None:
+    n = int(st.session_state[key])
+    items: List[Dict[str, Any]] = container.get(list_field) or []
+    container[list_field] = items[:n] + [blank() for _ in range(n - len(items))]
+    if count_field:
+        container[count_field] = n
+    mark_form_changed(section)
+
+def _list_count(label: str, section: str, container: Dict[str, Any], list_field: str, blank: Callable[[], Dict],
+                count_field: str = "") -> int:
+    key = _key(section, f"{list_field}__count")
+    if key not in st.session_state:
+        n = container.get(count_field) if count_field else None
+        st.session_state[key] = n if isinstance(n, int) else len(container.get(list_field) or [])
+    st.number_input(label, min_value=0, max_value=20, key=key,
+                    on_change=_resized, args=(section, container, list_field, key, blank, count_field))
+    # the list follows the count (extraction may fill one without the other)
+    n = int(st.session_state[key])
+    items = container.get(list_field) or []
+    if len(items) != n:
+        container[list_field] = items[:n] + [blank() for _ in range(n - len(items))]
+        st.session_state.form_version = form_version() + 1
+    return n
+
+# ---------- Sections ----------
+
+def _basic(b: Dict[str, Any], s: str) -> None:
     st.markdown("### Basic Personal Info")
-    b = form_dict["basic_personal_info"]
-    b["full_name"] = st.text_input("Full name", value=b.get("full_name") or "")
-    b["date_of_birth"] = st.text_input("Date of birth (YYYY-MM-DD)", value=b.get("date_of_birth") or "")
-    b["gender"] = st.text_input("Gender (optional)", value=b.get("gender") or "")
-    b["nationality"] = st.text_input("Nationality", value=b.get("nationality") or "")
-    b["passport_or_id"] = st.text_input("Passport/ID (optional)", value=b.get("passport_or_id") or "")
-    b["phone"] = st.text_input("Phone", value=b.get("phone") or "")
-    b["email"] = st.text_input("Email", value=b.get("email") or "")
-    b["preferred_language"] = st.text_input("Preferred language", value=b.get("preferred_language") or "")
-
-    # Address & Permits
+    _text("Full name", s, b, "full_name")
+    _text("Date of birth (YYYY-MM-DD)", s, b, "date_of_birth")
+    _text("Gender (optional)", s, b, "gender")
+    _text("Nationality", s, b, "nationality")
+    _text("Passport/ID (optional)", s, b, "passport_or_id")
+    _text("Phone", s, b, "phone")
+    _text("Email", s, b, "email")
+    _text("Preferred language", s, b, "preferred_language")
+
+def _address(a: Dict[str, Any], s: str) -> None:
     st.markdown("### Address & Permits")
-    a = form_dict["address_and_permits"]
-    a["address_line1"] = st.text_input("Address line 1", value=a.get("address_line1") or "")
-    a["address_line2"] = st.text_input("Address line 2 (optional)", value=a.get("address_line2") or "")
-    a["city"] = st.text_input("City", value=a.get("city") or "")
-    a["state_or_province"] = st.text_input("State/Province", value=a.get("state_or_province") or "")
-    a["postal_code"] = st.text_input("Postal/ZIP", value=a.get("postal_code") or "")
-    a["country"] = st.text_input("Country", value=a.get("country") or "")
-    a["permit_type"] = st.text_input("Permit/Status type", value=a.get("permit_type") or "")
-    a["permit_number"] = st.text_input("Permit number", value=a.get("permit_number") or "")
-    a["permit_expiry_date"] = st.text_input("Permit expiry (YYYY-MM-DD)", value=a.get("permit_expiry_date") or "")
-
-    # Employment
+    _text("Address line 1", s, a, "address_line1")
+    _text("Address line 2 (optional)", s, a, "address_line2")
+    _text("City", s, a, "city")
+    _text("State/Province", s, a, "state_or_province")
+    _text("Postal/ZIP", s, a, "postal_code")
+    _text("Country", s, a, "country")
+    _text("Permit/Status type", s, a, "permit_type")
+    _text("Permit number", s, a, "permit_number")
+    _text("Permit expiry (YYYY-MM-DD)", s, a, "permit_expiry_date")
+
+def _employment(e: Dict[str, Any], s: str) -> None:
     st.markdown("### Employment")
-    e = form_dict["employment"]
-    e["status"] = st.text_input("Employment status", value=e.get("status") or "")
-    e["employer_name"] = st.text_input("Employer name", value=e.get("employer_name") or "")
-    e["job_title"] = st.text_input("Job title", value=e.get("job_title") or "")
-    e["start_date"] = st.text_input("Job start date (YYYY-MM-DD)", value=e.get("start_date") or "")
-    e["income_per_month"] = st.text_input("Monthly income (e.g., 1200 USD)", value=e.get("income_per_month") or "")
-    e["pay_frequency"] = st.text_input("Pay frequency (monthly/biweekly/weekly/hourly)", value=e.get("pay_frequency") or "")
-    wp_idx = 0
-    if e.get("work_permit_required") is True: wp_idx = 1
-    if e.get("work_permit_required") is False: wp_idx = 2
-    wp_choice = st.selectbox("Work permit required?", options=["", "yes", "no"], index=wp_idx)
-    e["work_permit_required"] = True if wp_choice == "yes" else False if wp_choice == "no" else None
-
-    # Housing
+    _text("Employment status", s, e, "status")
+    _text("Employer name", s, e, "employer_name")
+    _text("Job title", s, e, "job_title")
+    _text("Job start date (YYYY-MM-DD)", s, e, "start_date")
+    _text("Monthly income (e.g., 1200 USD)", s, e, "income_per_month")
+    _text("Pay frequency (monthly/biweekly/weekly/hourly)", s, e, "pay_frequency")
+    _tri("Work permit required?", s, e, "work_permit_required")
+
+def _housing(h: Dict[str, Any], s: str) -> None:
     st.markdown("### Housing")
-    h = form_dict["housing"]
-    h["status"] = st.text_input("Housing status", value=h.get("status") or "")
-    h["address_if_different"] = st.text_input("Housing address (if different)", value=h.get("address_if_different") or "")
-    h["landlord_name"] = st.text_input("Landlord name (optional)", value=h.get("landlord_name") or "")
-    h["lease_start_date"] = st.text_input("Lease start (YYYY-MM-DD)", value=h.get("lease_start_date") or "")
-    h["lease_end_date"] = st.text_input("Lease end (YYYY-MM-DD)", value=h.get("lease_end_date") or "")
-    h["monthly_rent"] = st.text_input("Monthly rent (e.g., 900 USD)", value=h.get("monthly_rent") or "")
-    rooms_val = h.get("rooms")
-    h["rooms"] = st.number_input("Rooms", min_value=0, max_value=50, value=int(rooms_val) if isinstance(rooms_val, int) else 0)
-
-    # Dependents
+    _text("Housing status", s, h, "status")
+    _text("Housing address (if different)", s, h, "address_if_different")
+    _text("Landlord name (optional)", s, h, "landlord_name")
+    _text("Lease start (YYYY-MM-DD)", s, h, "lease_start_date")
+    _text("Lease end (YYYY-MM-DD)", s, h, "lease_end_date")
+    _text("Monthly rent (e.g., 900 USD)", s, h, "monthly_rent")
+    _int("Rooms", s, h, "rooms", max_value=50)
+
+def _dependents(di: Dict[str, Any], s: str) -> None:
     st.markdown("### Dependents")
-    di = form_dict["dependents_information"]
-    num = di.get("number_of_dependents") if isinstance(di.get("number_of_dependents"), int) else 0
-    di["number_of_dependents"] = st.number_input("Number of dependents", min_value=0, max_value=20, value=num)
-
-    dep_list = di.get("dependents", [])
-    while len(dep_list) < di["number_of_dependents"]:
-        dep_list.append(Dependent().model_dump())
-    if len(dep_list) > di["number_of_dependents"]:
-        dep_list = dep_list[: di["number_of_dependents"]]
-    di["dependents"] = dep_list
-
-    for i, dep in enumerate(dep_list, start=1):
+    n = _list_count("Number of dependents", s, di, "dependents", lambda: Dependent().model_dump(),
+                    count_field="number_of_dependents")
+    for i, dep in enumerate(di["dependents"][:n], start=1):
         with st.expander(f"Dependent {i}"):
-            dep["name"] = st.text_input(f"Name (dep {i})", value=dep.get("name") or "")
-            dep["relationship"] = st.text_input(f"Relationship (dep {i})", value=dep.get("relationship") or "")
-            dep["date_of_birth"] = st.text_input(f"DOB (YYYY-MM-DD) (dep {i})", value=dep.get("date_of_birth") or "")
-            ic_idx = 0
-            if dep.get("in_country") is True: ic_idx = 1
-            if dep.get("in_country") is False: ic_idx = 2
-            ic_choice = st.selectbox(f"In country? (dep {i})", options=["", "yes", "no"], index=ic_idx, key=f"dep_{i}_in_country")
-            dep["in_country"] = True if ic_choice == "yes" else False if ic_choice == "no" else None
-            dep["special_needs"] = st.text_input(f"Special needs (dep {i})", value=dep.get("special_needs") or "")
-
-    # Financial
+            p = ("dependents", i)
+            _text(f"Name (dep {i})", s, dep, "name", p)
+            _text(f"Relationship (dep {i})", s, dep, "relationship", p)
+            _text(f"DOB (YYYY-MM-DD) (dep {i})", s, dep, "date_of_birth", p)
+            _tri(f"In country? (dep {i})", s, dep, "in_country", p)
+            _text(f"Special needs (dep {i})", s, dep, "special_needs", p)
+
+def _financial(f: Dict[str, Any], s: str) -> None:
     st.markdown("### Financial")
-    f = form_dict["financial_information"]
-    ba_idx = 0
-    if f.get("has_bank_account") is True: ba_idx = 1
-    if f.get("has_bank_account") is False: ba_idx = 2
-    ba_choice = st.selectbox("Bank account?", options=["", "yes", "no"], index=ba_idx)
-    f["has_bank_account"] = True if ba_choice == "yes" else False if ba_choice == "no" else None
-    f["bank_name"] = st.text_input("Bank name (optional)", value=f.get("bank_name") or "")
-    f["monthly_income"] = st.text_input("Total monthly income", value=f.get("monthly_income") or "")
-    f["monthly_expenses"] = st.text_input("Total monthly expenses", value=f.get("monthly_expenses") or "")
-    f["savings_amount"] = st.text_input("Savings amount", value=f.get("savings_amount") or "")
-    f["debts_amount"] = st.text_input("Debts amount", value=f.get("debts_amount") or "")
-
-    # Education
+    _tri("Bank account?", s, f, "has_bank_account")
+    _text("Bank name (optional)", s, f, "bank_name")
+    _text("Total monthly income", s, f, "monthly_income")
+    _text("Total monthly expenses", s, f, "monthly_expenses")
+    _text("Savings amount", s, f, "savings_amount")
+    _text("Debts amount", s, f, "debts_amount")
+
+def _education(edu: Dict[str, Any], s: str) -> None:
     st.markdown("### Education (optional)")
-    edu = form_dict["education"]
-    edu["highest_level"] = st.text_input("Highest education level", value=edu.get("highest_level") or "")
-    items = edu.get("items", [])
-    add_more = st.number_input("Number of education entries", min_value=0, max_value=20, value=len(items))
-    while len(items) < add_more:
-        items.append(EducationItem().model_dump())
-    if len(items) > add_more:
-        items = items[:add_more]
-    edu["items"] = items
-    for i, it in enumerate(items, start=1):
+    _text("Highest education level", s, edu, "highest_level")
+    n = _list_count("Number of education entries", s, edu, "items", lambda: EducationItem().model_dump())
+    for i, it in enumerate(edu["items"][:n], start=1):
         with st.expander(f"Education item {i}"):
-            it["degree"] = st.text_input(f"Degree (item {i})", value=it.get("degree") or "")
+            p = ("items", i)
+            _text(f"Degree (item {i})", s, it, "degree", p)
+            _text(f"Field of study (item {i})", s, it, "field_of_study", p)
+            _text(f"Institution (item {i})", s, it, "institution", p)
+            _text(f"Start date (YYYY-MM-DD) (item {i})", s, it, "start_date", p)
+            _text(f"End date (YYYY-MM-DD) (item {i})", s, it, "end_date", p)
+            _text(f"Country (item {i})", s, it, "country", p)
+
+def _skills(sk: Dict[str, Any], s: str) -> None:
+    st.markdown("### Skills (optional)")
+    _widget(st.text_area, "Skills (comma-separated)", s, sk, "skills",
+            to_widget=lambda v: ", ".join(v or []),
+            from_widget=lambda t: [x.strip() for x in re.split(r"[,\n]", t or "") if x.strip()])
+
+_RENDERERS = {
+    "basic_personal_info": _basic,
+    "address_and_permits": _address,
+    "employment": _employment,
+    "housing": _housing,
+    "dependents_information": _dependents,
+    "financial_information": _financial,
+    "education": _education,
+    "skills": _skills,
+}
+
+@st.fragment
+def _section(form_dict: Dict[str, Any], section: str) -> None:
+    _RENDERERS[section](form_dict[section], section)
+
+def render_editable_form(form_dict: Dict[str, Any]) -> Dict[str, Any]:
+    st.subheader("Intake Form (editable)")
+    for section in SECTIONS:
+        if isinstance(form_dict.get(section), dict):
+            _section(form_dict, section)
+    return form_dict
@@ -1,60 +1,177 @@
 import json, re
-from typing import Any, Dict, Optional
+from datetime import date
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type, Union, get_args, get_origin
 from dateutil.parser import parse as date_parse
+from pydantic import BaseModel
 from models import FormData
+import metrics
 
 def blank_form_dict() -> Dict[str, Any]:
     return FormData().model_dump()
 
-def normalize_date(value: Optional[str]) -> Optional[str]:
-    if not value or not value.strip():
-        return None
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+@lru_cache(maxsize=4096)
+def _parse_date(value: str) -> str:
     try:
         d = date_parse(value, dayfirst=False, yearfirst=False)
         return d.date().isoformat()
     except Exception:
         return value
 
-def coerce_dates_in_form(form: Dict[str, Any]) -> Dict[str, Any]:
-    date_paths = [
-        "basic_personal_info.date_of_birth",
-        "address_and_permits.permit_expiry_date",
-        "employment.start_date",
-        "housing.lease_start_date",
-        "housing.lease_end_date",
-    ]
-    def set_path(d: Dict[str, Any], path: str, value: Any):
-        parts = path.split("."); cur = d
-        for p in parts[:-1]:
-            cur = cur.get(p, {})
-        cur[parts[-1]] = value
-    def get_path(d: Dict[str, Any], path: str):
-        cur = d
-        for p in path.split("."):
-            if isinstance(cur, list): return None
-            cur = cur.get(p)
-            if cur is None: return None
-        return cur
-    for p in date_paths:
-        v = get_path(form, p)
-        if isinstance(v, str): set_path(form, p, normalize_date(v))
-    # dependents and education dates
-    for dep in form.get("dependents_information", {}).get("dependents", []):
-        if isinstance(dep, dict) and isinstance(dep.get("date_of_birth"), str):
-            dep["date_of_birth"] = normalize_date(dep["date_of_birth"])
-    for it in form.get("education", {}).get("items", []):
-        if isinstance(it, dict):
-            if isinstance(it.get("start_date"), str): it["start_date"] = normalize_date(it["start_date"])
-            if isinstance(it.get("end_date"), str): it["end_date"] = normalize_date(it["end_date"])
+def normalize_date(value: Optional[str]) -> Optional[str]:
+    if not value or not value.strip():
+        return None
+    # Already ISO: skip dateutil (most values after the first coercion)
+    if len(value) == 10 and _ISO_DATE_RE.fullmatch(value):
+        try:
+            date.fromisoformat(value)
+            return value
+        except ValueError:
+            pass
+    return _parse_date(value.strip())
+
+# ---------- Schema-compiled normalization ----------
+# FormData is compiled once into a flat plan of (parent path, field, coercer) steps; lists
+# of models carry their own item plan. Dates are recognised by field name (*_date,
+# date_of_birth), so new schema fields are picked up without touching this code.
+
+_WORD_INTS = {w: i for i, w in enumerate("zero one two three four five six seven eight nine ten eleven twelve".split())}
+_TRUE = frozenset({"true", "yes", "y", "1"})
+_FALSE = frozenset({"false", "no", "n", "0"})
+
+def _is_date_field(name: str) -> bool:
+    return name == "date_of_birth" or name.endswith("_date")
+
+def _to_str(v: Any) -> Any:
+    if type(v) is str or isinstance(v, bool):
+        return v
+    return str(v) if isinstance(v, (int, float)) else v
+
+def _to_date(v: Any) -> Any:
+    return normalize_date(v) if type(v) is str else v
+
+def _to_int(v: Any) -> Any:
+    if type(v) is int:
+        return v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, str):
+        t = v.strip().lower()
+        if t.lstrip("+-").isdigit():
+            return int(t)
+        return _WORD_INTS.get(t, v)
+    return v
+
+def _to_bool(v: Any) -> Any:
+    if isinstance(v, bool):
+        return v
+    if isinstance(v, (int, float)) and v in (0, 1):
+        return bool(v)
+    if isinstance(v, str):
+        t = v.strip().lower()
+        return True if t in _TRUE else False if t in _FALSE else v
+    return v
+
+def _to_str_list(v: Any) -> Any:
+    if isinstance(v, str):
+        return [x.strip() for x in re.split(r"[,;\n]", v) if x.strip()]
+    if isinstance(v, list):
+        return [_to_str(x) for x in v if x is not None]
+    return v
+
+def _scalar_coercer(name: str, annotation: Any):
+    if annotation is bool:
+        return _to_bool
+    if annotation is int:
+        return _to_int
+    return _to_date if _is_date_field(name) else _to_str
+
+def _compile_plan(model: Type[BaseModel], parent: Tuple[str, ...] = ()) -> Tuple[tuple, ...]:
+    steps = []
+    for name, f in model.model_fields.items():
+        ann = f.annotation
+        if get_origin(ann) is Union:
+            args = [a for a in get_args(ann) if a is not type(None)]
+            ann = args[0] if len(args) == 1 else str
+        if isinstance(ann, type) and issubclass(ann, BaseModel):
+            steps.extend(_compile_plan(ann, parent + (name,)))
+        elif get_origin(ann) in (list, List):
+            (item,) = get_args(ann) or (str,)
+            if isinstance(item, type) and issubclass(item, BaseModel):
+                steps.append((parent, name, None, _compile_plan(item)))
+            else:
+                steps.append((parent, name, _to_str_list, None))
+        else:
+            steps.append((parent, name, _scalar_coercer(name, ann), None))
+    return tuple(steps)
+
+@lru_cache(maxsize=None)
+def _form_plan() -> Tuple[tuple, ...]:
+    return _compile_plan(FormData)
+
+def _apply_plan(plan: Tuple[tuple, ...], obj: Dict[str, Any]) -> None:
+    for parent, name, coerce, item_plan in plan:
+        d = obj
+        for p in parent:
+            d = d.get(p)
+            if not isinstance(d, dict):
+                break
+        else:
+            v = d.get(name)
+            if v is None:
+                continue
+            if item_plan is None:
+                nv = coerce(v)
+                if nv is not v:
+                    d[name] = nv
+            elif isinstance(v, list):
+                for it in v:
+                    if isinstance(it, dict):
+                        _apply_plan(item_plan, it)
+
+def normalize_form(form: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Coerces every FormData field in place: dates to YYYY-MM-DD, ints/bools from strings
+    ("2", "two", "yes"), numbers in string fields to str, comma lists to list[str].
+    Missing sections and values that don't parse ("3 bedrooms", "maybe") are left as
+    they are; returns form.
+    """
+    if isinstance(form, dict):
+        _apply_plan(_form_plan(), form)
     return form
 
+@metrics.instrument("coerce_dates_in_form")
+def coerce_dates_in_form(form: Dict[str, Any]) -> Dict[str, Any]:
+    # Historic name; the normalization covers every typed field, not just dates
+    return normalize_form(form)
+
+@metrics.instrument("normalize_forms")
+def normalize_forms(forms: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    normalize_form over many forms (bulk runs); repeated date strings across forms are
+    parsed once through the shared date cache.
+    """
+    plan = _form_plan()
+    out = []
+    for form in forms:
+        if isinstance(form, dict):
+            _apply_plan(plan, form)
+        out.append(form)
+    return out
+
 def parse_json_strict(text: str) -> Optional[Dict[str, Any]]:
     m = re.search(r"\{[\s\S]*\}", text)
     if not m: return None
     try: return json.loads(m.group(0))
     except Exception: return None
 
+@metrics.instrument("deep_merge")
 def deep_merge(base, patch):
+    return _deep_merge(base, patch)
+
+def _deep_merge(base, patch):
     # Be defensive about inputs
     if not isinstance(base, dict):
         base = {}
@@ -63,7 +180,7 @@ def deep_merge(base, patch):
 
     for k, v in patch.items():
         if isinstance(v, dict) and isinstance(base.get(k), dict):
-            base[k] = deep_merge(base.get(k), v)
+            base[k] = _deep_merge(base.get(k), v)
         else:
             if v is not None:
                 base[k] = v
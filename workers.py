@@ -0,0 +1,444 @@
+"""
+Multi-process extraction workers sharing one copy of the model weights.
+
+WorkerPool takes a loaded (tokenizer, model), moves the weights into shared memory
+(model.share_memory()) and spawns N worker processes that attach to them read-only, each
+with its own torch thread budget. Each worker has its own task and result pipes; the
+parent queues requests and hands the next one to whichever worker is idle, so it always
+knows which worker holds a task. A monitor thread restarts workers that die, stop
+answering while idle, or overrun task_timeout, and re-queues the task a dead worker held.
+A worker is stopped by closing its task pipe, and killed only when it doesn't exit; since
+no queue or lock is shared, that can't wedge the other workers or the result reader.
+memory_report() gives per-process RSS/PSS/private memory so the cost of an added worker
+can be compared with loading the model again.
+"""
+import itertools
+import os
+import pickle
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from typing import Any, Dict, List, Optional, Tuple
+
+HEARTBEAT_S = 1.0
+# an idle worker whose heartbeat is older than this is considered hung
+HEARTBEAT_GRACE_S = 10.0
+MAX_ATTEMPTS = 2
+# how long a stopped worker gets to exit on its own before it is killed
+STOP_GRACE_S = 2.0
+_OPS = ("extract_category", "extract_many", "extract_categories", "llm_generate", "ping")
+
+class WorkerCrashed(RuntimeError):
+    """Raised for a task whose worker died (again) while running it."""
+
+# ---------- Worker side ----------
+
+def _picklable(e: BaseException) -> BaseException:
+    try:
+        pickle.dumps(e)
+        return e
+    except Exception:
+        return RuntimeError(f"{type(e).__name__}: {e}")
+
+def _run_op(op: str, tokenizer, model, cache, args: tuple, kwargs: Dict[str, Any]):
+    if op == "ping":
+        return os.getpid(), None, None
+    if op == "llm_generate":
+        import llm
+        return llm.llm_generate(tokenizer, model, *args, **kwargs), None, kwargs.get("stats")
+    import extractor
+    kwargs.setdefault("cache", cache)
+    result = getattr(extractor, op)(tokenizer, model, *args, **kwargs)
+    return result, kwargs.get("provenance"), kwargs.get("stats")
+
+def _worker_main(slot: int, tokenizer, model, tasks, results, heartbeat, threads: int,
+                 cache_db: Optional[str]) -> None:
+    import torch
+    torch.set_num_threads(threads)
+    from cache import ExtractionCache
+    cache = ExtractionCache(db_path=cache_db) if cache_db else None
+    try:
+        results.send(("ready", os.getpid(), None))
+    except OSError:  # the pool closed while this worker was starting
+        return
+    while True:
+        heartbeat[slot] = time.time()
+        try:
+            if not tasks.poll(HEARTBEAT_S):
+                continue
+            task = tasks.recv()
+        except (EOFError, OSError):  # the parent closed the pipe: stop
+            return
+        if task is None:
+            return
+        task_id, op, args, kwargs = task
+        try:
+            out = ("done", task_id, _run_op(op, tokenizer, model, cache, args, kwargs))
+        except Exception as e:
+            out = ("error", task_id, _picklable(e))
+        try:
+            results.send(out)
+        except (EOFError, OSError):
+            return
+        except Exception as e:  # an unpicklable result; nothing was written yet
+            results.send(("error", task_id, RuntimeError(f"result of {op} can't be sent back: {e}")))
+
+# ---------- Parent side ----------
+
+class _Slot:
+    __slots__ = ("proc", "tasks", "results", "pid", "ready", "task", "since", "restarts", "done")
+
+    def __init__(self):
+        self.proc = None
+        self.tasks = None   # parent ends of this worker's pipes
+        self.results = None
+        self.pid = None
+        self.ready = False
+        self.task = None    # task id being run
+        self.since = 0.0    # when it started
+        self.restarts = 0
+        self.done = 0
+
+class WorkerPool:
+    """
+    - tokenizer/model: loaded once in this process (llm.load_model); eager and bf16
+      models can be shared, a torch.compile'd forward cannot
+    - workers: number of worker processes
+    - threads_per_worker: torch threads per worker (default: cores // workers)
+    - cache_db: sqlite ExtractionCache path each worker opens (None = no cache)
+    - task_timeout: seconds a task may run before its worker is restarted
+    - timeout: default seconds a caller waits for a result
+    Extraction methods mirror extractor's, minus tokenizer/model/cache.
+    """
+
+    def __init__(self, tokenizer, model, workers: int = 2, threads_per_worker: Optional[int] = None,
+                 cache_db: Optional[str] = None, task_timeout: float = 600.0, timeout: float = 900.0,
+                 health_interval: float = 2.0):
+        import torch.multiprocessing as mp
+        backend = getattr(model, "formease_backend", {}).get("backend")
+        if backend == "compile":
+            raise ValueError("A torch.compile'd model can't be shared with worker processes; use eager or bf16.")
+        self.tokenizer, self.model = tokenizer, model
+        self.workers = max(1, int(workers))
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.cache_db, self.task_timeout, self.timeout = cache_db, task_timeout, timeout
+        self.health_interval = health_interval
+        model.share_memory()
+        self._ctx = mp.get_context("spawn")
+        self._heartbeat = self._ctx.Array("d", self.workers, lock=False)
+        self._slots = [_Slot() for _ in range(self.workers)]
+        self._pending: Dict[int, Tuple[Future, tuple, int]] = {}  # task id -> (future, task, attempts)
+        self._queue: deque = deque()  # ids of pending tasks no worker holds yet
+        self._conns: Dict[Any, int] = {}  # result pipe -> slot, including replaced workers' until EOF
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._ready = threading.Condition(self._lock)
+        for i in range(self.workers):
+            self._spawn(i)
+        self._collector = threading.Thread(target=self._collect, name="formease-pool-results", daemon=True)
+        self._collector.start()
+        self._monitor = threading.Thread(target=self._watch, name="formease-pool-health", daemon=True)
+        self._monitor.start()
+
+    def _spawn(self, i: int) -> None:
+        slot = self._slots[i]
+        slot.ready, slot.task, slot.pid = False, None, None
+        self._heartbeat[i] = time.time()
+        task_r, slot.tasks = self._ctx.Pipe(duplex=False)
+        slot.results, result_w = self._ctx.Pipe(duplex=False)
+        self._conns[slot.results] = i  # read (and closed at EOF) by _collect
+        slot.proc = self._ctx.Process(
+            target=_worker_main, name=f"formease-worker-{i}", daemon=True,
+            args=(i, self.tokenizer, self.model, task_r, result_w, self._heartbeat,
+                  self.threads, self.cache_db),
+        )
+        slot.proc.start()
+        # the child has its own copies; closing ours lets either side see EOF when the other goes
+        task_r.close()
+        result_w.close()
+
+    def _assign(self) -> List[Tuple[Any, tuple]]:
+        # caller holds the lock; returns (pipe, task) pairs to send once it is released
+        sends = []
+        for slot in self._slots:
+            while self._queue and slot.ready and slot.task is None:
+                entry = self._pending.get(self._queue.popleft())
+                if entry is not None:  # else answered or failed meanwhile
+                    slot.task, slot.since = entry[1][0], time.monotonic()
+                    sends.append((slot.tasks, entry[1]))
+        return sends
+
+    def _send(self, sends: List[Tuple[Any, tuple]]) -> None:
+        for conn, task in sends:
+            try:
+                conn.send(task)
+            except OSError:
+                pass  # the worker is gone; _watch restarts it and re-queues the task
+            except Exception as e:  # arguments that can't be pickled
+                with self._lock:
+                    entry = self._pending.pop(task[0], None)
+                    for slot in self._slots:
+                        if slot.task == task[0]:
+                            slot.task = None
+                    more = self._assign()
+                if entry is not None:
+                    entry[0].set_exception(e)
+                self._send(more)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """True once every worker has attached to the weights."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._ready:
+            while not all(s.ready for s in self._slots):
+                left = None if deadline is None else deadline - time.monotonic()
+                if left is not None and left <= 0:
+                    return False
+                self._ready.wait(left)
+        return True
+
+    # ----- results and health -----
+    def _collect(self) -> None:
+        while not self._closed:
+            with self._lock:
+                conns = dict(self._conns)
+            for conn in wait(list(conns), timeout=HEARTBEAT_S):
+                i = conns[conn]
+                try:
+                    kind, a, b = conn.recv()
+                except (EOFError, OSError):
+                    # the worker is gone, maybe mid-message; only its own pipe is affected
+                    with self._lock:
+                        del self._conns[conn]
+                    conn.close()
+                    continue
+                with self._lock:
+                    slot = self._slots[i]
+                    if slot.results is not conn:
+                        continue  # from a worker that has been replaced
+                    entry = None
+                    if kind == "ready":
+                        slot.ready, slot.pid = True, a
+                        self._ready.notify_all()
+                    else:
+                        if slot.task == a:
+                            slot.task = None
+                        slot.done += 1
+                        entry = self._pending.pop(a, None)
+                    sends = self._assign()
+                self._send(sends)
+                if entry is None:
+                    continue  # a ready message, or a task already failed over to another attempt
+                if kind == "done":
+                    entry[0].set_result(b)
+                else:
+                    entry[0].set_exception(b)
+
+    def _watch(self) -> None:
+        while not self._closed:
+            time.sleep(self.health_interval)
+            now, wall = time.monotonic(), time.time()
+            stopped = []
+            with self._lock:
+                for i, slot in enumerate(self._slots):
+                    if self._closed:
+                        return
+                    if not slot.proc.is_alive():
+                        reason = "exited"
+                    elif slot.task is not None and now - slot.since > self.task_timeout:
+                        reason = "timeout"
+                    elif slot.ready and slot.task is None and wall - self._heartbeat[i] > HEARTBEAT_GRACE_S:
+                        reason = "unresponsive"
+                    else:
+                        continue
+                    stopped.append(self._restart(i, reason))
+                sends = self._assign()
+            for old in stopped:
+                _stop(*old)
+            self._send(sends)
+
+    def _restart(self, i: int, reason: str) -> Tuple[Any, Any]:
+        # caller holds the lock; returns the old (proc, tasks) for _stop
+        import metrics
+        slot = self._slots[i]
+        old = (slot.proc, slot.tasks)
+        entry = self._pending.get(slot.task) if slot.task is not None else None
+        if entry is not None:
+            future, task, attempts = entry
+            if reason != "timeout" and attempts < MAX_ATTEMPTS:
+                self._pending[task[0]] = (future, task, attempts + 1)
+                self._queue.appendleft(task[0])
+            else:
+                del self._pending[task[0]]
+                error = TimeoutError("Extraction task timed out.") if reason == "timeout" else \
+                    WorkerCrashed(f"Worker {i} {reason} while running the task.")
+                future.set_exception(error)
+        slot.restarts += 1
+        metrics.count("worker_restarts")
+        self._spawn(i)
+        return old
+
+    def health(self) -> List[Dict[str, Any]]:
+        """One row per worker: pid, alive, ready, busy_s, heartbeat_age_s, restarts, tasks_done."""
+        now, wall = time.monotonic(), time.time()
+        with self._lock:
+            return [{
+                "worker": i, "pid": s.pid, "alive": s.proc.is_alive(), "ready": s.ready,
+                "busy_s": round(now - s.since, 3) if s.task is not None else 0.0,
+                "heartbeat_age_s": round(wall - self._heartbeat[i], 3),
+                "restarts": s.restarts, "tasks_done": s.done,
+            } for i, s in enumerate(self._slots)]
+
+    def healthy(self) -> int:
+        return sum(1 for h in self.health() if h["alive"] and h["ready"])
+
+    # ----- client side -----
+    def submit(self, op: str, *args, **kwargs) -> Future:
+        """Queues op(tokenizer, model, *args, **kwargs) for a worker; see _OPS."""
+        if op not in _OPS:
+            raise ValueError(f"Unknown op {op!r}; expected one of {_OPS}")
+        future: Future = Future()
+        task = (next(self._ids), op, args, kwargs)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("worker pool is closed")
+            self._pending[task[0]] = (future, task, 1)
+            self._queue.append(task[0])
+            sends = self._assign()
+        self._send(sends)
+        return future
+
+    def _call(self, op: str, *args, provenance=None, stats=None, timeout: Optional[float] = None, **kwargs):
+        # provenance/stats are filled in the worker's copy and merged back here
+        if provenance is not None:
+            kwargs["provenance"] = {} if isinstance(provenance, dict) else [{} for _ in provenance]
+        if stats is not None:
+            kwargs["stats"] = {} if isinstance(stats, dict) else [{} for _ in stats]
+        result, prov, st = self.submit(op, *args, **kwargs).result(self.timeout if timeout is None else timeout)
+        for mine, theirs in ((provenance, prov), (stats, st)):
+            if mine is None or theirs is None:
+                continue
+            if isinstance(mine, dict):
+                mine.update(theirs)
+            else:
+                for m, t in zip(mine, theirs):
+                    m.update(t)
+        return result
+
+    def ping(self, timeout: float = 30.0) -> int:
+        """pid of whichever worker answered."""
+        return self.submit("ping").result(timeout)[0]
+
+    def generate(self, messages, **kwargs) -> str:
+        return self._call("llm_generate", messages, **kwargs)
+
+    def extract_category(self, root_key: str, user_text: str, **kwargs) -> Dict[str, Any]:
+        return self._call("extract_category", root_key, user_text, **kwargs)
+
+    def extract_many(self, jobs: List[Tuple[str, str]], provenance: Optional[List[Dict[str, str]]] = None,
+                     stats: Optional[List[Dict[str, float]]] = None, timeout: Optional[float] = None,
+                     **kwargs) -> List[Dict[str, Any]]:
+        """Splits jobs into one contiguous shard per worker; results in input order."""
+        if not jobs:
+            return []
+        per = -(-len(jobs) // self.workers)
+        shards = range(0, len(jobs), per)
+        futures = []
+        for s in shards:
+            sub = dict(kwargs)
+            if provenance is not None:
+                sub["provenance"] = [{} for _ in jobs[s:s + per]]
+            if stats is not None:
+                sub["stats"] = [{} for _ in jobs[s:s + per]]
+            futures.append(self.submit("extract_many", jobs[s:s + per], **sub))
+        patches: List[Dict[str, Any]] = []
+        for s, f in zip(shards, futures):
+            result, prov, st = f.result(self.timeout if timeout is None else timeout)
+            patches.extend(result)
+            for mine, theirs in ((provenance, prov), (stats, st)):
+                if mine is not None and theirs is not None:
+                    for m, t in zip(mine[s:s + per], theirs):
+                        m.update(t)
+        return patches
+
+    def extract_categories(self, texts: Dict[str, str], provenance: Optional[Dict[str, str]] = None,
+                           stats: Optional[Dict[str, Dict[str, float]]] = None,
+                           **kwargs) -> Dict[str, Dict[str, Any]]:
+        """extractor.extract_categories with the categories spread over the workers."""
+        from extractor import category_schema
+        jobs = [(k, t.strip()) for k, t in texts.items()
+                if isinstance(t, str) and t.strip() and category_schema(k)]
+        job_stats = [stats.setdefault(k, {}) for k, _ in jobs] if stats is not None else None
+        job_prov = [provenance] * len(jobs) if provenance is not None else None
+        patches = self.extract_many(jobs, provenance=job_prov, stats=job_stats, **kwargs)
+        return {k: p for (k, _), p in zip(jobs, patches)}
+
+    def close(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            self._closed = True
+            pending = list(self._pending.values())
+            self._pending.clear()
+            self._queue.clear()
+            workers = [(s.proc, s.tasks) for s in self._slots]
+        for _, tasks in workers:
+            try:
+                tasks.send(None)
+            except OSError:
+                pass
+        for proc, tasks in workers:
+            _stop(proc, tasks, timeout)
+        for future, _, _ in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("worker pool is closed"))
+
+    # ----- memory -----
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        MB per process from /proc/<pid>/smaps_rollup (Linux): rss, pss (shared pages split
+        between their users) and private (what the process alone holds). A worker's
+        private MB is the memory cost of adding it; weights_mb is what a separate
+        process would have to load again instead.
+        """
+        weights = sum(t.numel() * t.element_size() for t in itertools.chain(self.model.parameters(),
+                                                                             self.model.buffers()))
+        with self._lock:
+            pids = [s.pid for s in self._slots]
+        workers = [process_memory(p) if p else {} for p in pids]
+        private = [w["private_mb"] for w in workers if w]
+        return {
+            "weights_mb": round(weights / 2**20, 1),
+            "parent": process_memory(os.getpid()),
+            "workers": workers,
+            "worker_private_mb_mean": round(sum(private) / len(private), 1) if private else None,
+            "total_pss_mb": round(sum(m.get("pss_mb", 0.0) for m in [process_memory(os.getpid()), *workers]), 1),
+        }
+
+def _stop(proc, tasks, grace: float = STOP_GRACE_S) -> None:
+    # closing the task pipe is the stop signal; kill only a worker that ignores it
+    # (hung, or stuck in a task), which is safe now that it shares no queue or lock
+    tasks.close()
+    proc.join(grace)
+    if proc.is_alive():
+        proc.kill()
+        proc.join(5)
+
+def process_memory(pid: int) -> Dict[str, float]:
+    """{"rss_mb", "pss_mb", "private_mb", "shared_mb"} for pid, or {} where /proc isn't available."""
+    fields: Dict[str, int] = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return {}
+    kb = lambda *names: round(sum(fields.get(n, 0) for n in names) / 1024, 1)
+    return {
+        "rss_mb": kb("Rss"),
+        "pss_mb": kb("Pss"),
+        "private_mb": kb("Private_Clean", "Private_Dirty"),
+        "shared_mb": kb("Shared_Clean", "Shared_Dirty"),
+    }